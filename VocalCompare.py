@@ -1,18 +1,25 @@
 import os
-import subprocess
+import sys
 import numpy as np
-import pyqtgraph as pg
-import vlc
 import time
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTabWidget,
     QPushButton, QFileDialog, QLabel, QStatusBar, QFrame,
-    QLineEdit, QTextEdit
+    QLineEdit, QTextEdit, QProgressBar, QSlider
 )
-from PyQt5.QtCore import QTimer, Qt
-
-pg.setConfigOptions(antialias=True)
+from PyQt5.QtCore import QTimer, Qt, QProcess, QProcessEnvironment
+from pitchfile import PitchData, frame_dtype, read_pitch
+from progress import kill_job, parse_event
+from scoring import read_score
+
+# Startup imports only Qt and the small pitch and score readers, and the
+# window is shown straight away. pyqtgraph is imported and the plot built
+# just after the window appears; VLC is loaded when a video is first loaded
+# or played. With VOCALCOMPARE_WORKER=1 a warm worker (worker.py) is started
+# too, and processing jobs run in it instead of paying for their imports each
+# time (downloads need none of them and start in a fraction of a second).
+use_worker = os.environ.get("VOCALCOMPARE_WORKER") == "1"
 
 base_folder = os.path.abspath("files")
 current_song_path = os.path.join(base_folder, "current_song.txt")
@@ -37,45 +44,60 @@ download_tab.setLayout(download_layout)
 tabs.addTab(playback_tab, "Playback")
 tabs.addTab(download_tab, "Download")
 
-live_pitch = studio_pitch = live_time = studio_time = []
+empty_pitch = PitchData(np.zeros(0, dtype=frame_dtype), 1.0)
+pitch_data = empty_pitch
 trimmed_start = 0.0
 song_folder = None
 
 def ensure_placeholder_files(folder):
-    empty_array = np.zeros(100)
-    empty_time = np.linspace(0, 10, 100)
-    for name in ["live_pitch.npy", "studio_pitch.npy", "live_pitch_times.npy", "studio_pitch_times.npy"]:
-        path = os.path.join(folder, name)
-        if not os.path.exists(path):
-            np.save(path, empty_time if "times" in name else empty_array)
     video = os.path.join(folder, "live_performance.mp4")
     if not os.path.exists(video):
         open(video, "wb").close()
 
 video_widget = QFrame()
 video_widget.setStyleSheet("background-color: black")
-instance = vlc.Instance('--aout=directsound', '--file-caching=1000')
-player = instance.media_player_new()
-
-plot_widget = pg.PlotWidget()
-plot_widget.setBackground('w')
-plot_widget.setLabel('left', 'Pitch (Hz)')
-plot_widget.getAxis("bottom").setStyle(showValues=False)
-plot_widget.addLegend()
-plot_widget.setYRange(100, 1000)
-plot_widget.setXRange(0, 5)
-plot_widget.setMouseEnabled(x=False, y=False)
-plot_widget.getViewBox().setMenuEnabled(False)
-
-background_studio_curve = plot_widget.plot([], [], pen=pg.mkPen((150, 150, 150, 180), width=1), name='Studio')
-live_curve = plot_widget.plot([], [], pen=pg.mkPen('red'), name='Live')
-playhead = pg.InfiniteLine(angle=90, movable=False, pen=pg.mkPen('lightgray', width=1))
-plot_widget.addItem(playhead)
+vlc_player = {"instance": None, "player": None}
+
+def media_player():
+    if vlc_player["player"] is None:
+        import vlc
+        vlc_player["instance"] = vlc.Instance('--aout=directsound', '--file-caching=1000')
+        vlc_player["player"] = vlc_player["instance"].media_player_new()
+    return vlc_player["player"]
+
+# Stands in for the plot until build_plot replaces it
+plot_placeholder = QFrame()
+plot_widget = background_studio_curve = live_curve = playhead = None
+
+def build_plot():
+    global plot_widget, background_studio_curve, live_curve, playhead
+    if plot_widget is not None:
+        return
+    import pyqtgraph as pg
+    pg.setConfigOptions(antialias=True)
+
+    plot_widget = pg.PlotWidget()
+    plot_widget.setBackground('w')
+    plot_widget.setLabel('left', 'Pitch (Hz)')
+    plot_widget.getAxis("bottom").setStyle(showValues=False)
+    plot_widget.addLegend()
+    plot_widget.setYRange(100, 1000)
+    plot_widget.setXRange(0, 5)
+    plot_widget.setMouseEnabled(x=False, y=False)
+    plot_widget.getViewBox().setMenuEnabled(False)
+
+    background_studio_curve = plot_widget.plot([], [], pen=pg.mkPen((150, 150, 150, 180), width=1), name='Studio')
+    live_curve = plot_widget.plot([], [], pen=pg.mkPen('red'), name='Live')
+    playhead = pg.InfiniteLine(angle=90, movable=False, pen=pg.mkPen('lightgray', width=1))
+    plot_widget.addItem(playhead)
+    video_layout.replaceWidget(plot_placeholder, plot_widget)
+    plot_placeholder.deleteLater()
 
 status_bar_playback = QStatusBar()
 status_bar_download = QStatusBar()
 current_script_label = QLabel("")
 current_script_label.setStyleSheet("color: gray")
+score_label = QLabel("")
 
 log_output = QTextEdit()
 log_output.setReadOnly(True)
@@ -84,15 +106,14 @@ log_output.setMinimumHeight(150)
 
 timer = QTimer()
 timer.setInterval(33)
-last_frame_index = [-1]
+last_window = [None]
 
 def append_log(msg):
     log_output.append(msg)
     log_output.verticalScrollBar().setValue(log_output.verticalScrollBar().maximum())
-    app.processEvents()
 
 def load_data():
-    global live_pitch, studio_pitch, live_time, studio_time, trimmed_start, song_folder
+    global pitch_data, trimmed_start, song_folder
     with open(current_song_path, "r", encoding="utf-8") as f:
         song_name = f.read().strip()
     song_folder = os.path.join(base_folder, song_name)
@@ -105,29 +126,119 @@ def load_data():
                 k, v = line.strip().split("=", 1)
                 data[k] = v
 
-    live_pitch = np.load(os.path.join(song_folder, "live_pitch.npy"))
-    studio_pitch = np.load(os.path.join(song_folder, "studio_pitch.npy"))
-    live_time = np.load(os.path.join(song_folder, "live_pitch_times.npy"))
-    studio_time = np.load(os.path.join(song_folder, "studio_pitch_times.npy"))
-    trimmed_start = float(data.get("live_start", 0.0))
-
-    background_studio_curve.setData(studio_time, studio_pitch)
-    live_curve.setData([], [])
+    # Memory-mapped; older folders with four .npy files are read too
+    pitch_data = read_pitch(os.path.join(song_folder, "pitch.bin"), float(data.get("live_start", 0.0))) \
+        or empty_pitch
+    trimmed_start = pitch_data.start
+
+    # Written next to the pitch by the pipeline (scoring.py)
+    summary = (read_score(song_folder) or {}).get("summary", {})
+    parts = []
+    if summary.get("accuracy") is not None:
+        parts.append(f"In tune: {summary['accuracy']:.0%}")
+    if summary.get("mean_abs_cents") is not None:
+        parts.append(f"Mean deviation: {summary['mean_abs_cents']:.0f} cents")
+    if summary.get("note_accuracy") is not None:
+        parts.append(f"Notes hit: {summary['note_accuracy']:.0%}")
+    score_label.setText("   ".join(parts))
+
+    # The seek bar spans the live video; until VLC knows its length, the end
+    # of the pitch stands in for it
+    set_seek_bar(0, int((trimmed_start + len(pitch_data) * pitch_data.frame_period) * 1000))
+    last_window[0] = None
+    move_playhead(-trimmed_start)
+
+# Drops the loaded pitch. Its file stays memory-mapped while loaded, and
+# on Windows a mapped file cannot be replaced, so the pipeline's final
+# write of pitch.bin would fail for the song on screen.
+def release_pitch():
+    global pitch_data
+    pitch_data = empty_pitch
+    last_window[0] = None
+    if plot_widget is not None:
+        background_studio_curve.setData([], [])
+        live_curve.setData([], [])
+
+# Only the +-5 s around the playhead is drawn. Frames are evenly spaced, so
+# each tick finds the window by arithmetic and decodes just those frames
+# (the live curve up to the playhead, the studio curve ahead of it too);
+# the cost per tick stays the same however far into the song playback is
+window_seconds = 5
+
+def show_window(position_s):
+    build_plot()
+    n = len(pitch_data)
+    lo = max(pitch_data.frame_at(position_s - window_seconds) - 1, 0)
+    live_hi = min(pitch_data.frame_at(position_s) + 1, n)
+    studio_hi = min(pitch_data.frame_at(position_s + window_seconds) + 2, n)
+    window = (lo, live_hi, studio_hi)
+    if window != last_window[0]:
+        background_studio_curve.setData(pitch_data.times(lo, studio_hi), pitch_data.pitch("studio", lo, studio_hi))
+        live_curve.setData(pitch_data.times(lo, live_hi), pitch_data.pitch("live", lo, live_hi))
+        last_window[0] = window
+
+# Moves the plot to position_s on the pitch timeline, forwards or back
+def move_playhead(position_s):
+    show_window(position_s)
+    playhead.setValue(position_s)
+    if position_s > window_seconds:
+        plot_widget.setXRange(position_s - window_seconds, position_s + window_seconds, padding=0)
+    else:
+        plot_widget.setXRange(0, window_seconds)
+    time_label.setText(f"{clock(position_s + trimmed_start)} / {clock(seek_bar.maximum() / 1000)}")
+
+def clock(seconds):
+    seconds = int(max(seconds, 0))
+    return f"{seconds // 60}:{seconds % 60:02d}"
 
 def update_plot():
-    if player.is_playing():
-        position_s = (player.get_time() / 1000) - trimmed_start
-        frame_index = np.searchsorted(live_time, position_s)
-        frame_index = min(max(frame_index, 1), len(live_pitch))
-        if frame_index != last_frame_index[0]:
-            live_curve.setData(live_time[:frame_index], live_pitch[:frame_index])
-            last_frame_index[0] = frame_index
-        playhead.setValue(position_s)
-        if position_s > 5:
-            plot_widget.setXRange(position_s - 5, position_s + 5, padding=0)
+    player = media_player()
+    if pending_seek[0] is not None and player.get_time() >= 0:
+        player.set_time(pending_seek[0])
+        pending_seek[0] = None
+        return  # VLC reports the new time from the next tick on
+    if player.is_playing() and not seek_bar.isSliderDown():
+        time_ms, length = player.get_time(), player.get_length()
+        set_seek_bar(time_ms, length if length > 0 else None)
+        move_playhead(time_ms / 1000 - trimmed_start)
 
 timer.timeout.connect(update_plot)
 
+# Seeking
+# The seek bar is in milliseconds of the live video. Dragging or clicking it
+# moves the plot at once (a window lookup, the same cost anywhere in the
+# song) and the video with it; a seek made before the video has started is
+# applied once it plays, as VLC ignores it until then. While dragging, the
+# video is sent at most one seek per seek_interval so its decoder keeps up.
+# Playback moves the bar without seeking.
+seek_interval = 0.1
+seek_bar = QSlider(Qt.Horizontal)
+seek_bar.setRange(0, 0)
+time_label = QLabel("0:00 / 0:00")
+pending_seek = [None]
+last_seek = [0.0]
+
+def seek(time_ms):
+    move_playhead(time_ms / 1000 - trimmed_start)
+    if seek_bar.isSliderDown() and time.time() - last_seek[0] < seek_interval:
+        return  # sent on a later move, or on release
+    last_seek[0] = time.time()
+    player = media_player()
+    if player.get_time() >= 0:
+        player.set_time(time_ms)
+    else:
+        pending_seek[0] = time_ms
+
+def set_seek_bar(time_ms, length_ms=None):
+    seek_bar.blockSignals(True)
+    if length_ms is not None:
+        seek_bar.setRange(0, length_ms)
+    seek_bar.setValue(time_ms)
+    seek_bar.blockSignals(False)
+
+seek_bar.valueChanged.connect(seek)
+seek_bar.sliderReleased.connect(lambda: seek(seek_bar.value()))
+
 btn_load = QPushButton("Load Video")
 def load_video():
     filepath, _ = QFileDialog.getOpenFileName(window, "Select Video", "", "Videos (*.mp4 *.mov *.avi)")
@@ -137,7 +248,15 @@ def load_video():
     with open(current_song_path, "w", encoding="utf-8") as f:
         f.write(os.path.basename(folder))
     load_data()
-    media = instance.media_new(filepath)
+    player = media_player()
+    # A video converted for playback (acquisition.py) replaces the original
+    # once the player has let go of it
+    player.stop()
+    player.set_media(None)
+    if os.path.basename(filepath) == "live_performance.mp4":
+        from acquisition import use_converted_video
+        use_converted_video(folder)
+    media = vlc_player["instance"].media_new(filepath)
     player.set_media(media)
     player.set_hwnd(video_widget.winId())
     status_bar_playback.showMessage("Video loaded.", 3000)
@@ -145,16 +264,15 @@ def load_video():
 btn_load.clicked.connect(load_video)
 
 btn_play = QPushButton("Play")
-btn_play.clicked.connect(lambda: [player.play(), timer.start()])
+btn_play.clicked.connect(lambda: [media_player().play(), timer.start()])
 
 btn_pause = QPushButton("Pause")
-btn_pause.clicked.connect(lambda: [player.pause(), timer.stop()])
+btn_pause.clicked.connect(lambda: [media_player().pause(), timer.stop()])
 
 btn_reset = QPushButton("Reset")
 def reset_playback():
-    player.set_time(0)
-    live_curve.setData([], [])
-    last_frame_index[0] = -1
+    set_seek_bar(0)
+    seek(0)
     status_bar_playback.showMessage("Reset.", 3000)
 
 btn_reset.clicked.connect(reset_playback)
@@ -167,6 +285,107 @@ live_url_input.setPlaceholderText("Live YouTube URL")
 btn_download = QPushButton("Download")
 btn_process = QPushButton("Process Vocals")
 btn_process.setEnabled(False)
+btn_cancel = QPushButton("Cancel")
+btn_cancel.setEnabled(False)
+
+progress_bar = QProgressBar()
+progress_bar.setRange(0, 1)
+progress_bar.setValue(0)
+
+# Background jobs
+# Download and processing run as child processes under QProcess, so the
+# event loop (and playback) keeps running while they work. Their output
+# arrives through signals: ordinary lines go to the log, structured events
+# (see progress.py) drive the progress bar and the stage label.
+job = {"process": None, "buffer": "", "cancelled": False, "running": [], "timings": {},
+       "song_folder": None, "start": 0.0}
+
+def set_job_running(running):
+    btn_download.setEnabled(not running)
+    btn_process.setEnabled(not running and job["song_folder"] is not None)
+    btn_cancel.setEnabled(running)
+
+def handle_event(event):
+    kind = event.get("event")
+    if kind == "plan":
+        progress_bar.setRange(0, max(len(event["stages"]), 1))
+        progress_bar.setValue(0)
+    elif kind == "stage_start":
+        job["running"].append(event["stage"])
+    elif kind in ("stage_done", "stage_cached"):
+        if event["stage"] in job["running"]:
+            job["running"].remove(event["stage"])
+        if kind == "stage_done":
+            job["timings"][event["stage"]] = event["seconds"]
+        progress_bar.setValue(min(progress_bar.value() + 1, progress_bar.maximum()))
+    elif kind == "song_folder":
+        job["song_folder"] = event["path"]
+    current_script_label.setText(", ".join(job["running"]) + "..." if job["running"] else "")
+
+def read_job_output():
+    process = job["process"]
+    job["buffer"] += bytes(process.readAllStandardOutput()).decode("utf-8", errors="replace")
+    *lines, job["buffer"] = job["buffer"].split("\n")
+    for line in lines:
+        line = line.rstrip("\r")
+        event = parse_event(line)
+        if event is not None:
+            handle_event(event)
+        elif line.strip():
+            append_log(line)
+
+# Starts `script args` in the background; on_finished(ok) runs on the main
+# thread once it exits
+def start_job(script, args, on_finished, warm=False):
+    process = QProcess(window)
+    process.setProcessChannelMode(QProcess.MergedChannels)
+    env = QProcessEnvironment.systemEnvironment()
+    env.insert("VOCALCOMPARE_EVENTS", "1")
+    env.insert("VOCALCOMPARE_JOB_GROUP", "1")  # so cancel_job stops what the job started too
+    env.insert("PYTHONIOENCODING", "utf-8")
+    process.setProcessEnvironment(env)
+    job.update(process=process, buffer="", cancelled=False, running=[], timings={}, start=time.time())
+    progress_bar.setRange(0, 0)
+
+    def finished(exit_code, exit_status):
+        read_job_output()
+        if job["buffer"].strip():
+            append_log(job["buffer"].strip())
+        job["buffer"] = ""
+        ok = exit_status == QProcess.NormalExit and exit_code == 0 and not job["cancelled"]
+        job["process"] = None
+        job["running"] = []
+        current_script_label.setText("")
+        progress_bar.setRange(0, 1)
+        progress_bar.setValue(1 if ok else 0)
+        set_job_running(False)
+        if job["cancelled"]:
+            append_log("Cancelled.")
+            status_bar_download.showMessage("Cancelled.", 3000)
+        else:
+            on_finished(ok)
+
+    def failed_to_start(error):
+        if error == QProcess.FailedToStart:
+            job["process"] = None
+            progress_bar.setRange(0, 1)
+            set_job_running(False)
+            status_bar_download.showMessage(f"Error: could not start {script}", 5000)
+
+    process.readyReadStandardOutput.connect(read_job_output)
+    process.finished.connect(finished)
+    process.errorOccurred.connect(failed_to_start)
+    set_job_running(True)
+    # Jobs that need the heavy libraries go through the warm worker if there
+    # is one; warm-worker.py runs the script itself when the worker has no
+    # warm spare free, so it never waits for one to warm up
+    process.start(sys.executable, (["warm-worker.py", "run"] if warm and use_worker else []) + [script] + args)
+
+def cancel_job():
+    if job["process"] is not None:
+        job["cancelled"] = True
+        kill_job(job["process"].processId())
+        job["process"].kill()
 
 def run_download():
     studio_url = studio_url_input.text()
@@ -176,92 +395,79 @@ def run_download():
         return
 
     append_log("Starting YouTube download...")
-    current_script_label.setText("Downloading from YouTube...")
     status_bar_download.showMessage("Downloading...", 3000)
+    job["song_folder"] = None
 
-    try:
-        process = subprocess.Popen(
-            ["python", "dl-files.py", studio_url, live_url],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
-        )
-        new_song_folder = None
-        while True:
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
-                break
-            if output:
-                append_log(output.strip())
-                if output.startswith("Files saved in:"):
-                    new_song_folder = output.split("Files saved in:")[-1].strip()
-
-        if process.returncode == 0 and new_song_folder:
+    def finished(ok):
+        if ok and job["song_folder"]:
             with open(current_song_path, "w", encoding="utf-8") as f:
-                f.write(os.path.basename(new_song_folder))
+                f.write(os.path.basename(job["song_folder"]))
             append_log("Download complete!")
             status_bar_download.showMessage("Download complete.", 3000)
-            btn_process.setEnabled(True)
+            set_job_running(False)
             load_data()
         else:
             status_bar_download.showMessage("Download failed.", 5000)
 
-    except Exception as e:
-        status_bar_download.showMessage(f"Error: {e}", 5000)
-
-    current_script_label.setText("")
+    # The video is made playable by process-vocals.py, alongside the audio
+    start_job("dl-files.py", [studio_url, live_url, "--defer-video"], finished)
 
 def run_processing():
-    try:
-        with open(current_song_path, "r", encoding="utf-8") as f:
-            song_name = f.read().strip()
-        folder_path = os.path.join(base_folder, song_name)
-
-        for script in ["extract-vocals.py", "denoise-vocals.py", "sync-vocals.py", "pitch-extraction.py"]:
-            append_log(f"Starting {script}...")
-            current_script_label.setText(f"Running {script}...")
-            status_bar_download.showMessage(f"Running {script}...", 3000)
-            app.processEvents()
-
-            start_time = time.time()
-            subprocess.run(["python", script, folder_path], check=True)
-            elapsed = time.time() - start_time
-            append_log(f"Finished {script} in {elapsed:.1f}s")
-
+    with open(current_song_path, "r", encoding="utf-8") as f:
+        song_name = f.read().strip()
+    job["song_folder"] = os.path.join(base_folder, song_name)
+    if job["song_folder"] == song_folder:
+        release_pitch()
+
+    # All stages run in one process, passing audio between them in memory
+    status_bar_download.showMessage("Processing...", 3000)
+
+    def finished(ok):
+        if not ok:
+            status_bar_download.showMessage("Processing failed.", 5000)
+            return
+        for stage, seconds in job["timings"].items():
+            append_log(f"  {stage}: {seconds:.1f}s")
+        append_log(f"Finished processing in {time.time() - job['start']:.1f}s")
         load_data()
         append_log("Processing complete!")
         status_bar_download.showMessage("Processing complete.", 3000)
 
-    except Exception as e:
-        status_bar_download.showMessage(f"Error: {e}", 5000)
-
-    current_script_label.setText("")
+    start_job("process-vocals.py", [job["song_folder"]], finished, warm=True)
 
 btn_download.clicked.connect(run_download)
 btn_process.clicked.connect(run_processing)
+btn_cancel.clicked.connect(cancel_job)
 
 # Layouts
 video_layout = QHBoxLayout()
 video_layout.addWidget(video_widget, 2)
-video_layout.addWidget(plot_widget, 3)
+video_layout.addWidget(plot_placeholder, 3)
 
 controls_layout = QHBoxLayout()
 controls_layout.addWidget(btn_load)
 controls_layout.addWidget(btn_play)
 controls_layout.addWidget(btn_pause)
 controls_layout.addWidget(btn_reset)
+controls_layout.addWidget(score_label)
+
+seek_layout = QHBoxLayout()
+seek_layout.addWidget(seek_bar)
+seek_layout.addWidget(time_label)
 
 playback_layout.addLayout(video_layout)
+playback_layout.addLayout(seek_layout)
 playback_layout.addLayout(controls_layout)
 playback_layout.addWidget(status_bar_playback)
 
 studio_row = QHBoxLayout(); studio_row.addWidget(QLabel("Studio URL:")); studio_row.addWidget(studio_url_input)
 live_row = QHBoxLayout(); live_row.addWidget(QLabel("Live URL:")); live_row.addWidget(live_url_input)
-btn_row = QHBoxLayout(); btn_row.addWidget(btn_download); btn_row.addWidget(btn_process)
+btn_row = QHBoxLayout(); btn_row.addWidget(btn_download); btn_row.addWidget(btn_process); btn_row.addWidget(btn_cancel)
 
 download_layout.addLayout(studio_row)
 download_layout.addLayout(live_row)
 download_layout.addLayout(btn_row)
+download_layout.addWidget(progress_bar)
 download_layout.addWidget(current_script_label)
 download_layout.addWidget(log_output)
 download_layout.addWidget(status_bar_download)
@@ -271,4 +477,19 @@ main_layout.addWidget(tabs)
 window.setLayout(main_layout)
 window.resize(1280, 720)
 window.show()
+QTimer.singleShot(0, build_plot)
+
+# The warm worker lives as long as the window
+if use_worker:
+    worker_process = QProcess()
+    worker_process.setStandardOutputFile(QProcess.nullDevice())
+    worker_process.setStandardErrorFile(QProcess.nullDevice())
+    worker_process.start(sys.executable, ["warm-worker.py"])
+
+    def stop_worker():
+        worker_process.terminate()  # lets it remove files/worker.json and its spare
+        if not worker_process.waitForFinished(3000):
+            worker_process.kill()
+    app.aboutToQuit.connect(stop_worker)
+
 app.exec_()
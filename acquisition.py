@@ -0,0 +1,300 @@
+import itertools
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import unicodedata
+from cache import file_key
+from metrics import measure
+from progress import emit
+from references import StudioReference, content_reference_id, url_reference_id
+from scheduler import Scheduler, Task
+
+# Media acquisition for a song folder. Each source is fetched once: the
+# live URL's metadata is fetched a single time (for the title) and reused
+# for the download, the live performance is downloaded once as a muxed
+# video and its audio demuxed and decoded locally, and the studio track is
+# downloaded once, audio only, into its reference. The live and studio
+# fetches run side by side.
+#
+# Either source may be a local file instead of a URL: a live video is
+# stream-copied into the folder, a live audio file gives a folder without
+# video, and a local studio file goes to a reference keyed by its content.
+# WAV files are copied as they are; anything else is decoded with ffmpeg.
+#
+# The live video is only needed for playback, so making it playable is a
+# separate step (prepare_video) that callers run in the background while
+# the audio is processed. It writes the converted video next to the
+# original and leaves it to whoever knows the original is not open (the GUI
+# before it loads a video, dl-files.py) to swap it in (use_converted_video).
+
+# Audio is decoded at the rate Demucs separates at, so the first stage does
+# not resample
+working_sr = 44100
+
+video_extensions = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+
+# h264 at most 720p where available, else any mp4 at most 720p
+live_video_format = ("bestvideo[ext=mp4][vcodec^=avc1][height<=720]+bestaudio[ext=m4a]"
+                     "/best[ext=mp4][vcodec^=avc1][height<=720]"
+                     "/bestvideo[ext=mp4][height<=720]+bestaudio[ext=m4a]/best[ext=mp4][height<=720]")
+
+def is_url(source):
+    return source.startswith(("http://", "https://"))
+
+# A source as song folders record it: the URL, or the file's absolute path
+def source_name(source):
+    return source if is_url(source) else os.path.abspath(source)
+
+def clean_title(title):
+    # Remove illegal characters
+    title = re.sub(r'[<>:"/\\|?*]', '', title)
+    # Convert to ASCII
+    title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
+    # Remove leading/trailing spaces
+    return title.strip()
+
+def fetch_info(url):
+    import yt_dlp
+    with yt_dlp.YoutubeDL({"quiet": True, "no_warnings": True}) as ydl:
+        return ydl.extract_info(url, download=False)
+
+# Downloads the format `format` of an already fetched info dict to
+# `outtmpl`; returns the downloaded file's path
+def download(info, format, outtmpl):
+    import yt_dlp
+    opts = {"format": format, "outtmpl": outtmpl, "merge_output_format": "mp4",
+            "quiet": True, "no_warnings": True}
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.process_ie_result(info, download=True)
+        return ydl.prepare_filename(info)
+
+def decode_audio(source, wav_path, sr=working_sr):
+    if source.lower().endswith(".wav"):
+        shutil.copyfile(source, wav_path + ".partial")
+    else:
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", source, "-vn", "-c:a", "pcm_s16le",
+                        "-ar", str(sr), "-f", "wav", wav_path + ".partial"], check=True)
+    os.replace(wav_path + ".partial", wav_path)
+
+# Video
+# Codecs VLC plays from an MP4 as they are
+playable_codecs = {"video": ("h264", "hevc", "vp9", "av1"), "audio": ("aac", "mp3", "opus")}
+
+# ffmpeg threads for a conversion: it runs beside the pipeline, outside the
+# scheduler's CPU budget
+video_threads = 1
+
+def video_paths(song_folder):
+    return (os.path.join(song_folder, "live_performance.mp4"),
+            os.path.join(song_folder, "live_performance_converted.mp4"))
+
+# (codec_type, codec_name) of every stream in the file
+def probe_streams(path):
+    result = subprocess.run([
+        "ffprobe", "-v", "error",
+        "-show_entries", "stream=codec_type,codec_name",
+        "-of", "json", path
+    ], capture_output=True, text=True, check=True)
+    return [(stream.get("codec_type"), stream.get("codec_name")) for stream in json.loads(result.stdout)["streams"]]
+
+# Makes the song folder's live video playable in one pass over the file:
+# streams the player handles are copied, only the others are transcoded
+# (video with a speed-tuned x264 preset, at most 720p, on `threads`
+# threads) to live_performance_converted.mp4; the original is not touched.
+# Returns whether a converted video was written; folders without a video,
+# or with a conversion not yet swapped in, are left alone.
+def prepare_video(song_folder, threads=video_threads):
+    live_video, converted = video_paths(song_folder)
+    if not os.path.exists(live_video) or os.path.getsize(live_video) == 0 or os.path.exists(converted):
+        return False
+    streams = probe_streams(live_video)
+    transcode = {kind: any(t == kind and c not in playable_codecs[kind] for t, c in streams)
+                 for kind in ("video", "audio")}
+    print(f"Live video streams: {', '.join(f'{t} {c}' for t, c in streams)}", flush=True)
+    if not any(transcode.values()):
+        return False
+
+    print(f"Converting {' and '.join(kind for kind in transcode if transcode[kind])} for playback...", flush=True)
+    temp_path = os.path.join(song_folder, "raw", "live_performance_converted.mp4")
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", live_video, "-map", "0:v:0?", "-map", "0:a:0?",
+               "-threads", str(threads), "-filter_threads", str(threads)]
+    if transcode["video"]:
+        command += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-vf", "scale=-2:'min(720,ih)'"]
+    else:
+        command += ["-c:v", "copy"]
+    command += ["-c:a", "aac", "-b:a", "192k"] if transcode["audio"] else ["-c:a", "copy"]
+    subprocess.run(command + ["-movflags", "+faststart", temp_path], check=True)
+    os.replace(temp_path, converted)
+    return True
+
+# Replaces the live video with its converted version, if there is one.
+# Only for when nothing has the live video open: on Windows the replace
+# fails while VLC plays it. Returns whether it was replaced.
+def use_converted_video(song_folder):
+    live_video, converted = video_paths(song_folder)
+    if not os.path.exists(converted):
+        return False
+    os.replace(converted, live_video)
+    return True
+
+# prepare_video on a thread (ffmpeg does the work in its own process);
+# join the returned thread before relying on the video. A failure is
+# reported, not raised: the audio results do not depend on it.
+def prepare_video_in_background(song_folder):
+    def run():
+        try:
+            timed_step("video conversion", prepare_video, song_folder)
+        except Exception as e:
+            print(f"Video conversion failed: {e!r}", flush=True)
+    thread = threading.Thread(target=run, name="video conversion")
+    thread.start()
+    return thread
+
+# Live video (when there is one) and live_audio.wav for the song folder.
+# info is the live URL's fetched metadata.
+def acquire_live(source, song_folder, info=None):
+    raw_folder = os.path.join(song_folder, "raw")
+    live_video = os.path.join(song_folder, "live_performance.mp4")
+    live_audio = os.path.join(raw_folder, "live_audio.wav")
+
+    if is_url(source):
+        print("Downloading live performance...", flush=True)
+        downloaded = download(info or fetch_info(source), live_video_format,
+                              os.path.join(raw_folder, "live_video.%(ext)s"))
+        shutil.move(downloaded, live_video)
+    elif source.lower().endswith(video_extensions):
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", source, "-c", "copy", live_video], check=True)
+    else:
+        print(f"Decoding live audio from {source}...", flush=True)
+        decode_audio(source, live_audio)
+        return
+
+    print("Extracting live audio from the video...", flush=True)
+    decode_audio(live_video, live_audio)
+
+# The id of the studio reference a studio source goes to; info is the
+# studio URL's fetched metadata
+def studio_reference_id(source, info=None):
+    if is_url(source):
+        return url_reference_id(info or fetch_info(source))
+    return content_reference_id(file_key(source))
+
+# The studio reference holding the studio audio, downloaded or decoded
+# unless it already has it. info is the studio URL's fetched metadata.
+def acquire_studio(source, base_folder, info=None):
+    if is_url(source):
+        info = info or fetch_info(source)
+    reference = StudioReference(base_folder, studio_reference_id(source, info))
+    os.makedirs(reference.folder, exist_ok=True)
+    if reference.has_audio():
+        print(f"Reusing studio audio from reference {reference.id}", flush=True)
+        return reference
+
+    studio_audio = os.path.join(reference.folder, "studio_audio.wav")
+    if is_url(source):
+        print("Downloading studio audio...", flush=True)
+        downloaded = download(info, "bestaudio/best",
+                              os.path.join(reference.folder, "studio_source.%(ext)s"))
+        decode_audio(downloaded, studio_audio)
+        os.remove(downloaded)
+        reference.info["url"] = source
+    else:
+        decode_audio(source, studio_audio)
+        reference.info["source"] = os.path.abspath(source)
+    reference.save_info()
+    return reference
+
+# fn(*args) between stage_start and stage_done progress events, measured
+# (metrics.py)
+def timed_step(name, fn, *args):
+    emit("stage_start", stage=name)
+    start_time = time.time()
+    with measure(name):
+        result = fn(*args)
+    emit("stage_done", stage=name, seconds=round(time.time() - start_time, 3))
+    return result
+
+# The live source a song folder records, in raw/live_source.txt or (for
+# folders whose source file is lost) data.txt; None when it records none.
+# A source file another job has just created is given a moment to be
+# written.
+def recorded_live_source(song_folder, wait=1.0):
+    source_path = os.path.join(song_folder, "raw", "live_source.txt")
+    deadline = time.time() + wait
+    while os.path.exists(source_path):
+        with open(source_path, encoding="utf-8") as f:
+            source = f.read().strip()
+        if source or time.time() > deadline:
+            return source or None
+        time.sleep(0.05)
+    try:
+        with open(os.path.join(song_folder, "data.txt"), encoding="utf-8") as f:
+            data = dict(line.strip().split("=", 1) for line in f if "=" in line)
+        return data.get("live_source")
+    except OSError:
+        return None
+
+# Whether the song folder can hold `source`: it records that source, or
+# records none (a folder from before sources were recorded, or from a job
+# that stopped before recording it) and its live audio, when the source is
+# a WAV file copied in as it is, has the same content
+def holds_live_source(song_folder, source):
+    recorded = recorded_live_source(song_folder)
+    if recorded is not None:
+        return recorded == source
+    live_audio = os.path.join(song_folder, "raw", "live_audio.wav")
+    if source.lower().endswith(".wav") and os.path.exists(source) and os.path.exists(live_audio):
+        return file_key(source) == file_key(live_audio)
+    return True
+
+# The song folder for `live` under base_folder: `name`, or `name (2)`,
+# `name (3)`... when a folder of that name holds another live source.
+# Creating raw/live_source.txt (exclusively) claims a folder, so concurrent
+# jobs (batch.py) whose titles clean to the same name never share one,
+# while a job for the same live source, a rerun or an older folder of that
+# song gets the folder back.
+def claim_song_folder(base_folder, name, live):
+    source = source_name(live)
+    for number in itertools.count(1):
+        song_folder = os.path.join(base_folder, name if number == 1 else f"{name} ({number})")
+        os.makedirs(os.path.join(song_folder, "raw"), exist_ok=True)
+        if not holds_live_source(song_folder, source):
+            continue
+        try:
+            fd = os.open(os.path.join(song_folder, "raw", "live_source.txt"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Claimed meanwhile, by this source or another
+            if recorded_live_source(song_folder) in (None, source):
+                return song_folder
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(source + "\n")
+        return song_folder
+
+# Builds the song folder for a studio and a live source (URLs or local
+# files) under base_folder and returns its path. The folder is named
+# `name`, else after the live video's title or the live file (see
+# claim_song_folder).
+def acquire(studio, live, base_folder, name=None):
+    live_info = fetch_info(live) if is_url(live) else None
+    if not name:
+        name = clean_title(live_info["title"]) if live_info else os.path.splitext(os.path.basename(live))[0]
+    song_folder = claim_song_folder(base_folder, name, live)
+
+    emit("plan", stages=["live media", "studio audio"])
+    results = Scheduler().run([
+        Task("live media", lambda: timed_step("live media", acquire_live, live, song_folder, live_info)),
+        Task("studio audio", lambda: timed_step("studio audio", acquire_studio, studio, base_folder)),
+    ])
+
+    # Save song name, live source and studio reference
+    with open(os.path.join(song_folder, "data.txt"), "w", encoding="utf-8") as f:
+        f.write(f"song_name={name}\n")
+        f.write(f"live_source={source_name(live)}\n")
+        f.write(f"studio_ref={results['studio audio'].id}\n")
+    emit("song_folder", path=song_folder)
+    return song_folder
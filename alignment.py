@@ -0,0 +1,303 @@
+import numpy as np
+from numba import njit
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
+
+# DTW over chroma frames (rows of X and Y) with the L1 frame distance.
+#
+# The search space is a band: row i of the cost matrix only holds columns
+# [lo[i], hi[i]), stored back to back in a flat array (row i starts at
+# offsets[i]). A full band reproduces the dtw package exactly - same costs,
+# same accumulation and the same tie-breaking in the traceback - while a
+# narrow band keeps time and memory linear in the sequence length.
+
+# Bands
+def full_band(n, m):
+    return np.zeros(n, dtype=np.int64), np.full(n, m, dtype=np.int64)
+
+# Sakoe-Chiba band of +-radius frames around the straight line joining the
+# first and last frames, so songs of different lengths still fit the band.
+def sakoe_chiba_band(n, m, radius):
+    centre = np.arange(n) * ((m - 1) / max(n - 1, 1))
+    lo = np.floor(centre - radius).astype(np.int64)
+    hi = np.ceil(centre + radius).astype(np.int64) + 1
+    return connect_band(lo, hi, m)
+
+# Corridor of +-radius frames around a warping path given at `scale` times
+# coarser resolution than the n x m grid the band is built for.
+def path_band(path_ref, path_target, n, m, radius, scale=1):
+    path_ref = np.asarray(path_ref, dtype=np.int64)
+    path_target = np.asarray(path_target, dtype=np.int64)
+    n_coarse = int(path_ref.max()) + 1
+
+    lo_coarse = np.full(n_coarse, np.iinfo(np.int64).max)
+    hi_coarse = np.full(n_coarse, -1)
+    np.minimum.at(lo_coarse, path_ref, path_target)
+    np.maximum.at(hi_coarse, path_ref, path_target)
+
+    row_radius = int(np.ceil(radius / scale))
+    lo_coarse = minimum_filter1d(lo_coarse, 2 * row_radius + 1, mode="nearest")
+    hi_coarse = maximum_filter1d(hi_coarse, 2 * row_radius + 1, mode="nearest")
+
+    rows = np.minimum(np.arange(n) // scale, n_coarse - 1)
+    lo = lo_coarse[rows] * scale - radius
+    hi = (hi_coarse[rows] + 1) * scale + radius
+    return connect_band(lo, hi, m)
+
+# Clip a band to the grid and make sure a monotonic path from (0, 0) to
+# (n - 1, m - 1) exists inside it.
+def connect_band(lo, hi, m):
+    lo = np.clip(lo, 0, m - 1)
+    hi = np.clip(hi, 1, m)
+    lo[0] = 0
+    hi[-1] = m
+    lo = np.minimum.accumulate(lo[::-1])[::-1]
+    hi = np.maximum.accumulate(hi)
+    lo[1:] = np.minimum(lo[1:], hi[:-1])
+    return lo.astype(np.int64), hi.astype(np.int64)
+
+def band_offsets(lo, hi):
+    offsets = np.zeros(len(lo) + 1, dtype=np.int64)
+    np.cumsum(hi - lo, out=offsets[1:])
+    return offsets
+
+# Cost
+# abs().sum() over the 12 chroma bins reduces exactly like
+# np.linalg.norm(x - y, ord=1), so costs match the old per-pair lambda bit
+# for bit. Rows are processed in blocks to vectorize across the band.
+def l1_cost(X, Y, lo, hi, offsets, out=None, block_cells=1 << 14):
+    cost = np.empty(offsets[-1], dtype=np.float64) if out is None else out
+    block_cells = max(block_cells, int((hi - lo).max()))
+    diff = np.empty(block_cells * X.shape[1], dtype=np.result_type(X, Y))
+    n = len(lo)
+    i = 0
+    while i < n:
+        # lo and hi are monotonic, so rows [i, i + rows) span lo[i]..hi[i + rows - 1]
+        rows = 1
+        while i + 2 * rows <= n and 2 * rows * (hi[i + 2 * rows - 1] - lo[i]) <= block_cells:
+            rows *= 2
+        block_lo = int(lo[i])
+        block_hi = int(hi[i + rows - 1])
+        shape = (rows, block_hi - block_lo, X.shape[1])
+        block = diff[:np.prod(shape)].reshape(shape)
+        np.subtract(X[i:i + rows, None, :], Y[None, block_lo:block_hi, :], out=block)
+        block = np.abs(block, out=block).sum(axis=-1)
+        for r in range(rows):
+            row = i + r
+            cost[offsets[row]:offsets[row + 1]] = block[r, lo[row] - block_lo:hi[row] - block_lo]
+        i += rows
+    return cost
+
+# Accumulation and traceback
+@njit(cache=True)
+def _at(D, lo, hi, offsets, i, j):
+    if i < 0 or j < 0:
+        return 0.0 if (i == -1 and j == -1) else np.inf
+    if j < lo[i] or j >= hi[i]:
+        return np.inf
+    return D[offsets[i] + j - lo[i]]
+
+@njit(cache=True)
+def _accumulate(D, lo, hi, offsets):
+    # Row 0 only has the left neighbour (D[-1, -1] counts as 0 for cell 0)
+    for k in range(offsets[0] + 1, offsets[1]):
+        D[k] += D[k - 1]
+    for i in range(1, len(lo)):
+        prev_lo, prev_hi, prev_start = lo[i - 1], hi[i - 1], offsets[i - 1]
+        start = offsets[i]
+        for j in range(lo[i], hi[i]):
+            diag = D[prev_start + j - 1 - prev_lo] if prev_lo <= j - 1 < prev_hi else np.inf
+            up = D[prev_start + j - prev_lo] if prev_lo <= j < prev_hi else np.inf
+            left = D[start + j - 1 - lo[i]] if j > lo[i] else np.inf
+            D[start + j - lo[i]] += min(diag, left, up)
+
+@njit(cache=True)
+def _traceback(D, lo, hi, offsets, m):
+    i = len(lo) - 1
+    j = m - 1
+    p = np.empty(len(lo) + m, dtype=np.int64)
+    q = np.empty(len(lo) + m, dtype=np.int64)
+    k = len(p) - 1
+    p[k] = i
+    q[k] = j
+    while i > 0 or j > 0:
+        diag = _at(D, lo, hi, offsets, i - 1, j - 1)
+        up = _at(D, lo, hi, offsets, i - 1, j)
+        left = _at(D, lo, hi, offsets, i, j - 1)
+        if diag <= up and diag <= left:
+            i -= 1
+            j -= 1
+        elif up <= left:
+            i -= 1
+        else:
+            j -= 1
+        k -= 1
+        p[k] = i
+        q[k] = j
+    return p[k:].copy(), q[k:].copy()
+
+# Returns the warping path (indices into X, indices into Y)
+def dtw_path(X, Y, band=None):
+    n, m = len(X), len(Y)
+    if n == 1:
+        return np.zeros(m, dtype=np.int64), np.arange(m)
+    if m == 1:
+        return np.arange(n), np.zeros(n, dtype=np.int64)
+
+    lo, hi = full_band(n, m) if band is None else band
+    offsets = band_offsets(lo, hi)
+
+    D = l1_cost(X, Y, lo, hi, offsets)
+    _accumulate(D, lo, hi, offsets)
+    return _traceback(D, lo, hi, offsets, m)
+
+# Average pooling of frames, used for coarse alignment passes
+def downsample(X, factor):
+    n = len(X) // factor * factor
+    pooled = X[:n].reshape(-1, factor, X.shape[1]).mean(axis=1)
+    if n < len(X):
+        pooled = np.vstack([pooled, X[n:].mean(axis=0, keepdims=True)])
+    return pooled.astype(X.dtype)
+
+# Band around the path of a single coarse alignment at 1/factor resolution
+def adaptive_band(X, Y, radius, factor=8):
+    coarse_ref, coarse_target = dtw_path(downsample(X, factor), downsample(Y, factor))
+    return path_band(coarse_ref, coarse_target, len(X), len(Y), radius, scale=factor)
+
+# FastDTW-style coarse-to-fine alignment: halve both sequences until they are
+# short enough for an exact pass, then project the path up one level at a
+# time and refine it inside a +-radius corridor. Every level only stores its
+# corridor, so memory grows linearly with duration.
+def multiscale_path(X, Y, radius=16, factor=2, min_frames=512):
+    if len(X) <= min_frames or len(Y) <= min_frames:
+        return dtw_path(X, Y)
+    coarse_ref, coarse_target = multiscale_path(downsample(X, factor), downsample(Y, factor),
+                                                radius, factor, min_frames)
+    band = path_band(coarse_ref, coarse_target, len(X), len(Y), radius, scale=factor)
+    return dtw_path(X, Y, band)
+
+# How far a path strays from a reference path (e.g. the exact one), measured
+# per target frame as the distance between the mean reference frames the two
+# paths assign to it. Returns (mean, p95, max) in frames.
+def path_deviation(path, reference_path):
+    m = int(max(path[1].max(), reference_path[1].max())) + 1
+
+    def mean_ref(p):
+        counts = np.bincount(p[1], minlength=m)
+        return np.bincount(p[1], weights=p[0], minlength=m) / np.maximum(counts, 1)
+
+    deviation = np.abs(mean_ref(path) - mean_ref(reference_path))
+    return float(deviation.mean()), float(np.percentile(deviation, 95)), float(deviation.max())
+
+# Online time warping. Live frames arrive in blocks and are aligned against a
+# fully known reference. Each live frame adds one column of accumulated cost,
+# limited to a window of +-radius reference frames that follows the current
+# best match. Only the last lag + block columns are kept: the path is
+# backtracked from the newest frame and everything older than `lag` frames is
+# committed and emitted, so memory stays bounded however long the input is.
+@njit(cache=True)
+def _online_column(prev, prev_lo, cost, lo):
+    column = np.empty(len(cost))
+    for k in range(len(cost)):
+        i = lo + k
+        best = np.inf
+        if 0 <= i - 1 - prev_lo < len(prev):
+            best = prev[i - 1 - prev_lo]
+        if 0 <= i - prev_lo < len(prev):
+            best = min(best, prev[i - prev_lo])
+        if k > 0:
+            best = min(best, column[k - 1])
+        column[k] = cost[k] + best
+    return column
+
+class OnlineAligner:
+    def __init__(self, reference, radius=64, lag=32):
+        self.reference = reference
+        self.radius = radius
+        self.lag = lag
+        self.columns = []           # (live frame, window lo, accumulated cost)
+        self.n_live = 0
+        self.committed = (-1, -1)   # last emitted (reference, live) cell
+        self.position = 0
+
+    def _add_frame(self, frame):
+        n = len(self.reference)
+        lo = max(self.columns[-1][1] if self.columns else 0, self.position - self.radius)
+        lo = min(lo, max(n - 2 * self.radius - 1, 0))
+        hi = min(n, lo + 2 * self.radius + 1)
+
+        cost = np.abs(self.reference[lo:hi] - frame).sum(axis=-1).astype(np.float64)
+        if self.columns:
+            _, prev_lo, prev = self.columns[-1]
+        else:
+            prev_lo, prev = -1, np.zeros(1)
+        column = _online_column(prev, prev_lo, cost, lo)
+
+        j = self.n_live
+        normalized = column / (np.arange(lo, hi) + j + 2)
+        self.position = lo + int(np.argmin(normalized))
+        self.columns.append((j, lo, column))
+        self.n_live += 1
+
+    # Path cells from `row` in the newest column back to the oldest kept one
+    def _backtrack(self, row):
+        cells = []
+        c = len(self.columns) - 1
+        i = row
+        while True:
+            _, lo, column = self.columns[c]
+            cells.append((i, self.columns[c][0]))
+            if c == 0:
+                break
+            _, prev_lo, prev = self.columns[c - 1]
+            diag = prev[i - 1 - prev_lo] if 0 <= i - 1 - prev_lo < len(prev) else np.inf
+            left = prev[i - prev_lo] if 0 <= i - prev_lo < len(prev) else np.inf
+            up = column[i - 1 - lo] if i - 1 >= lo else np.inf
+            if diag <= left and diag <= up:
+                i -= 1
+                c -= 1
+            elif left <= up:
+                c -= 1
+            else:
+                i -= 1
+        return cells[::-1]
+
+    # Commit cells whose live frame is below `until` and drop their columns
+    def _commit(self, cells, until):
+        last_ref, _ = self.committed
+        ref = np.array([max(i, last_ref) for i, j in cells if j < until], dtype=np.int64)
+        live = np.array([j for i, j in cells if j < until], dtype=np.int64)
+        self.columns = [column for column in self.columns if column[0] >= until]
+        if len(ref):
+            ref = np.maximum.accumulate(ref)
+            self.committed = (int(ref[-1]), int(live[-1]))
+        return ref, live
+
+    # Feed a block of live frames, returns the newly committed path chunk
+    # (empty while fewer than lag frames are uncommitted, or no frame has
+    # come yet)
+    def push(self, frames):
+        for frame in frames:
+            self._add_frame(frame)
+        if not self.columns or self.n_live - self.columns[0][0] <= self.lag:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return self._commit(self._backtrack(self.position), self.n_live - self.lag)
+
+    # Flush the remaining path once the live input has ended
+    def finish(self):
+        if not self.columns:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        _, lo, column = self.columns[-1]
+        row = len(self.reference) - 1 if lo + len(column) == len(self.reference) else self.position
+        return self._commit(self._backtrack(row), self.n_live)
+
+# Generator over path chunks (reference indices, live indices) for an
+# iterable of live frame blocks, each shaped (frames, bins)
+def online_path(reference, live_blocks, radius=64, lag=32):
+    aligner = OnlineAligner(reference, radius, lag)
+    for block in live_blocks:
+        chunk = aligner.push(block)
+        if len(chunk[0]):
+            yield chunk
+    chunk = aligner.finish()
+    if len(chunk[0]):
+        yield chunk
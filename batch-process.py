@@ -0,0 +1,26 @@
+import sys
+from batch import read_manifest, run_batch
+
+# Processes every song pair of a manifest without the GUI
+usage = ("Usage: python batch-process.py <manifest.csv|manifest.jsonl> "
+         "[--workers N] [--retries N] [--cpus N] [--memory-gb N]")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(usage)
+        sys.exit(1)
+
+    options = {"--workers": 1, "--retries": 2, "--cpus": None, "--memory-gb": None}
+    args = iter(sys.argv[2:])
+    try:
+        for arg in args:
+            if arg not in options:
+                raise ValueError(arg)
+            options[arg] = float(next(args)) if arg == "--memory-gb" else int(next(args))
+    except (StopIteration, ValueError):
+        print(usage)
+        sys.exit(1)
+
+    memory_gb = options["--memory-gb"]
+    run_batch(read_manifest(sys.argv[1]), options["--workers"], options["--retries"], options["--cpus"],
+               int(memory_gb * 1024 ** 3) if memory_gb else None)
@@ -0,0 +1,210 @@
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from acquisition import acquire, prepare_video_in_background, studio_reference_id
+from metrics import recording
+from pipeline import read_data, run_pipeline, song_files
+from pitchfile import has_legacy_pitch
+from scheduler import Scheduler, total_memory
+
+# Headless processing of many song pairs. A manifest lists one job per row
+# (CSV with a header, or JSONL) with a "studio" and a "live" column, each a
+# URL or a local file (see acquisition.py), plus optional "name", "aligner",
+# "warp_mode" and "backend". Jobs run download -> separate -> denoise -> sync -> pitch in a
+# pool of worker processes, each with an equal share of the CPU and memory
+# budget, and failed jobs are retried.
+#
+# Progress is kept per job in files/.batch/<id>.json next to its log. After
+# a crash, rerunning the same manifest skips the download when the song
+# folder already has its audio, skips the pipeline when the pitch files of a
+# finished job exist, and otherwise picks the pipeline up from the stage
+# cache.
+
+base_folder = os.path.abspath("files")
+
+def read_manifest(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            jobs = [json.loads(line) for line in f if line.strip()]
+        else:
+            jobs = [dict(row) for row in csv.DictReader(f)]
+    for number, job in enumerate(jobs, 1):
+        if not job.get("studio") or not job.get("live"):
+            raise ValueError(f"{path}: job {number} needs both a studio and a live entry")
+    return jobs
+
+def job_id(job):
+    return hashlib.sha256(f"{job['studio']}\n{job['live']}".encode("utf-8")).hexdigest()[:16]
+
+def state_path(job):
+    return os.path.join(base_folder, ".batch", f"{job_id(job)}.json")
+
+def read_state(job):
+    try:
+        with open(state_path(job), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_state(job, state):
+    path = state_path(job)
+    with open(path + ".partial", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".partial", path)
+
+def downloaded(song_folder):
+    files = song_files(song_folder)
+    return os.path.exists(files["data"]) and os.path.exists(files["live_audio"])
+
+def processed(song_folder):
+    return os.path.exists(song_files(song_folder)["pitch"]) or has_legacy_pitch(song_folder)
+
+# Worker
+# Runs one job in a worker process, logging to files/.batch/<id>.log.
+# Returns (song folder, {stage: seconds}) for the stages run this time.
+def run_job(job, cpus, memory_bytes):
+    os.makedirs(os.path.dirname(state_path(job)), exist_ok=True)
+    log_path = os.path.splitext(state_path(job))[0] + ".log"
+    with open(log_path, "a", encoding="utf-8") as log_file, \
+            contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        state = read_state(job)
+        song_folder = state.get("folder")
+        timings = {}
+        try:
+            with recording("batch", song_folder) as run:
+                if not song_folder or not downloaded(song_folder):
+                    start_time = time.time()
+                    song_folder = acquire(job["studio"], job["live"], base_folder, job.get("name"))
+                    run["song_folder"] = song_folder
+                    timings["download"] = time.time() - start_time
+                    write_state(job, {"folder": song_folder, "status": "downloaded"})
+
+                if state.get("status") != "done" or not processed(song_folder):
+                    video = prepare_video_in_background(song_folder)
+                    scheduler = Scheduler(cpus, memory_bytes)
+                    try:
+                        timings.update(run_pipeline(song_folder, checkpoints=False,
+                                                    aligner=job.get("aligner") or "exact",
+                                                    warp_mode=job.get("warp_mode") or "interp",
+                                                    backend=job.get("backend") or "pyin",
+                                                    scheduler=scheduler))
+                    finally:
+                        scheduler.shutdown()
+                        video.join()
+                    write_state(job, {"folder": song_folder, "status": "done", "timings": timings})
+        except Exception:
+            traceback.print_exc()
+            raise
+    return song_folder, timings
+
+# Runner
+# {job index: studio reference id} for the given jobs, each distinct studio
+# entry resolved once (a metadata fetch for a URL). An entry that cannot be
+# resolved stands for itself; its job fails and is retried as usual.
+def studio_references(jobs, indices):
+    resolved, studios = {}, {}
+    for i in indices:
+        source = jobs[i]["studio"]
+        if source not in resolved:
+            try:
+                resolved[source] = studio_reference_id(source)
+            except Exception as e:
+                print(f"Could not resolve studio {source}: {e!r}", flush=True)
+                resolved[source] = source
+        studios[i] = resolved[source]
+    return studios
+
+def percentiles(values):
+    return np.percentile(values, 50), np.percentile(values, 95)
+
+# Runs every job of the manifest across `workers` processes and prints a
+# throughput summary. cpus and memory_bytes are the budget for the whole
+# batch (default: all cores, 80% of physical memory). Returns
+# {job index: song folder} for the jobs that succeeded.
+def run_batch(jobs, workers=1, retries=2, cpus=None, memory_bytes=None):
+    cpus = cpus or os.cpu_count() or 1
+    memory_bytes = memory_bytes or (int(0.8 * total_memory()) if total_memory() else None)
+    job_cpus = max(1, cpus // workers)
+    job_memory = memory_bytes // workers if memory_bytes else None
+
+    folders, failed, timings = {}, {}, []
+    attempts = {i: 0 for i in range(len(jobs))}
+    queue = []
+    for i, job in enumerate(jobs):
+        state = read_state(job)
+        if state.get("status") == "done" and processed(state["folder"]):
+            folders[i] = state["folder"]
+        else:
+            queue.append(i)
+    skipped = len(folders)
+    print(f"{len(jobs)} jobs, {skipped} already done; {workers} workers, "
+          f"{job_cpus} CPUs each", flush=True)
+
+    # Until one job of a studio track has finished, its reference is still
+    # being built, so other jobs of that track wait rather than separating
+    # it again in parallel. Jobs are matched on the reference they resolve
+    # to, not the manifest entry, so two URLs of one video, or two paths to
+    # one file, count as one track.
+    studios = studio_references(jobs, queue)
+    ready_studios = {read_data(folder).get("studio_ref") for folder in folders.values()}
+    building = set()
+    running = {}
+    pool = ProcessPoolExecutor(max_workers=workers)
+    start_time = time.time()
+    try:
+        while queue or running:
+            for i in list(queue):
+                studio = studios[i]
+                if len(running) >= workers:
+                    break
+                if studio in building:
+                    continue
+                queue.remove(i)
+                if studio not in ready_studios:
+                    building.add(studio)
+                running[pool.submit(run_job, jobs[i], job_cpus, job_memory)] = i
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                building.discard(studios[i])
+                attempts[i] += 1
+                name = jobs[i].get("name") or jobs[i]["live"]
+                try:
+                    folders[i], job_timings = future.result()
+                    ready_studios.add(studios[i])
+                    timings.append(job_timings)
+                    print(f"Done {name} ({len(folders) - skipped}/{len(jobs) - skipped})", flush=True)
+                except Exception as e:
+                    # A worker that died takes the pool down with it
+                    if isinstance(e, BrokenProcessPool) and not running:
+                        pool.shutdown()
+                        pool = ProcessPoolExecutor(max_workers=workers)
+                    if attempts[i] <= retries:
+                        queue.append(i)
+                        print(f"Retrying {name} after: {e!r}", flush=True)
+                    else:
+                        failed[i] = e
+                        print(f"Failed {name} after {attempts[i]} attempts: {e!r}", flush=True)
+    finally:
+        pool.shutdown()
+    elapsed = time.time() - start_time
+
+    done = len(folders) - skipped
+    print(f"Processed {done} songs in {elapsed / 60:.1f} min "
+          f"({done / elapsed * 3600 if elapsed else 0:.1f} songs/hour), {len(failed)} failed", flush=True)
+    stages = sorted({stage for job_timings in timings for stage in job_timings})
+    if stages:
+        print(f"{'stage':>24} {'jobs':>5} {'p50 (s)':>8} {'p95 (s)':>8}")
+        for stage in stages:
+            values = [job_timings[stage] for job_timings in timings if stage in job_timings]
+            p50, p95 = percentiles(values)
+            print(f"{stage:>24} {len(values):5d} {p50:8.1f} {p95:8.1f}")
+    return folders
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alignment import adaptive_band, dtw_path, multiscale_path, online_path, path_deviation, sakoe_chiba_band
+
+# Usage: python benchmarks/bench_alignment.py [--legacy]
+# Aligns synthetic chroma sequences at the sync-vocals.py frame rate. The
+# exact aligner is skipped where its n x m matrix would not fit in memory;
+# --legacy also times the dtw package (slow, 3 minute input only).
+# Deviation (mean / p95 / max, in frames) is measured against the known
+# synthetic warp and, where it ran, the exact path. Short clips at several
+# noise levels show how much accuracy the approximate aligners give up.
+
+sr = 22050
+hop_length = 1024
+durations_min = [3, 10, 30, 60]
+clip_min = 2
+clip_noise = [0.05, 0.3, 1.0]
+band_radius = 200
+adaptive_radius = 32
+coarse_factor = 8
+multiscale_radius = 16
+online_radius = 64
+online_lag = 32
+stream_block = 64
+max_exact_bytes = 4 << 30
+
+# Random chroma walk and a tempo-warped, noisy copy standing in for the live take
+def synthetic_chroma(duration_min, noise=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(duration_min * 60 * sr / hop_length)
+    steps = rng.standard_normal((n, 12)) * 0.3
+    studio = np.abs(np.cumsum(steps, axis=0) % 2 - 1)
+
+    rate = 1 + 0.08 * np.sin(np.linspace(0, 6 * np.pi, int(n * 1.1)))
+    positions = np.cumsum(rate)
+    positions = positions[positions < n - 1]
+    truth = (positions.astype(np.int64), np.arange(len(positions)))
+    live = studio[truth[0]] + noise * rng.standard_normal((len(positions), 12))
+    return studio.astype(np.float32), np.abs(live).astype(np.float32), truth
+
+def measure(fn):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1 << 20)
+
+# Feeds Y to the online aligner block by block, as sync-vocals.py streams it
+def online(X, Y):
+    blocks = (Y[k:k + stream_block] for k in range(0, len(Y), stream_block))
+    chunks = list(online_path(X, blocks, online_radius, online_lag))
+    return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+def legacy_path(X, Y):
+    from dtw import dtw
+    _, _, _, path = dtw(X, Y, dist=lambda x, y: np.linalg.norm(x - y, ord=1))
+    return path
+
+# Compile the numba kernels outside the measurements
+dtw_path(*synthetic_chroma(0.1)[:2])
+online(*synthetic_chroma(0.1)[:2])
+
+def format_deviation(path, reference):
+    if reference is None:
+        return "-"
+    return "{:.2f} / {:.1f} / {:.1f}".format(*path_deviation(path, reference))
+
+def report(label, runs, n, m, truth):
+    exact = None
+    for name, fn in runs.items():
+        path, elapsed, peak = measure(fn)
+        if name == "exact":
+            exact = path
+        print(f"{label:>10} {name:>10} {n:>6}x{m:<6} {elapsed:9.2f} {peak:9.1f} "
+              f"{format_deviation(path, truth):>20} {format_deviation(path, exact):>20}")
+
+print(f"{'input':>10} {'aligner':>10} {'frames':>13} {'time (s)':>9} {'peak MB':>9} "
+      f"{'dev vs truth':>20} {'dev vs exact':>20}")
+for duration in durations_min:
+    X, Y, truth = synthetic_chroma(duration)
+    n, m = len(X), len(Y)
+    runs = {
+        "band": lambda: dtw_path(X, Y, sakoe_chiba_band(n, m, band_radius)),
+        "adaptive": lambda: dtw_path(X, Y, adaptive_band(X, Y, adaptive_radius, coarse_factor)),
+        "multiscale": lambda: multiscale_path(X, Y, multiscale_radius),
+        "online": lambda: online(X, Y),
+    }
+    if 16 * n * m <= max_exact_bytes:
+        runs = {"exact": lambda: dtw_path(X, Y), **runs}
+    if "--legacy" in sys.argv and duration == durations_min[0]:
+        runs = {"dtw": lambda: legacy_path(X, Y), **runs}
+    report(f"{duration}m", runs, n, m, truth)
+
+for noise in clip_noise:
+    X, Y, truth = synthetic_chroma(clip_min, noise, seed=1)
+    n, m = len(X), len(Y)
+    runs = {
+        "exact": lambda: dtw_path(X, Y),
+        "band": lambda: dtw_path(X, Y, sakoe_chiba_band(n, m, band_radius)),
+        "adaptive": lambda: dtw_path(X, Y, adaptive_band(X, Y, adaptive_radius, coarse_factor)),
+        "multiscale": lambda: multiscale_path(X, Y, multiscale_radius),
+        "online": lambda: online(X, Y),
+    }
+    report(f"noise {noise}", runs, n, m, truth)
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pitch import backends, extract_pitch
+from pitchfile import read_pitch
+
+# Usage: python benchmarks/bench_pitch.py [song_folder]
+# Times every pitch backend and compares it with a reference contour: the
+# song folder's live pitch (from the pyin backend) when a folder is given,
+# otherwise the known f0 of a synthetic vocal with vibrato and gaps.
+
+sr = 22050
+hop_length = 256
+duration_s = 180
+
+def synthetic_vocal(duration_s, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sr)) / sr
+    note = 196 * 2 ** (np.floor(t / 4) % 7 / 12)
+    f0 = np.where(t % 4 < 3, note * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t)), np.nan)
+    phase = 2 * np.pi * np.cumsum(np.nan_to_num(f0)) / sr
+    y = np.where(np.isnan(f0), 0, 0.3 * (np.sin(phase) + 0.4 * np.sin(2 * phase) + 0.2 * np.sin(3 * phase)))
+    y += 0.0005 * rng.standard_normal(len(t))
+    return y.astype(np.float32), f0[::hop_length][:1 + len(y) // hop_length]
+
+def compare(estimate, reference):
+    n = min(len(estimate), len(reference))
+    estimate, reference = estimate[:n], reference[:n]
+    voicing = np.mean(np.isnan(estimate) == np.isnan(reference))
+    both = ~np.isnan(estimate) & ~np.isnan(reference)
+    cents = 1200 * np.abs(np.log2(estimate[both] / reference[both]))
+    return voicing, np.median(cents), np.mean(cents < 50)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        song_folder = sys.argv[1]
+        y, _ = librosa.load(os.path.join(song_folder, "raw", "live_vocals_denoised.wav"), sr=sr)
+        reference = read_pitch(os.path.join(song_folder, "pitch.bin")).pitch("live")
+        print(f"{song_folder}: {len(y) / sr:.1f}s, reference live pitch")
+    else:
+        y, reference = synthetic_vocal(duration_s)
+        print(f"Synthetic vocal: {duration_s}s, reference is the true f0")
+
+    # Compile numba kernels outside the measurements
+    for backend in backends:
+        extract_pitch(y[:sr], sr, backend, hop_length=hop_length)
+
+    print(f"{'backend':>14} {'time (s)':>9} {'voicing':>8} {'median cents':>13} {'< 50 cents':>11}")
+    for backend in backends:
+        start_time = time.perf_counter()
+        f0, _ = extract_pitch(y, sr, backend, hop_length=hop_length)
+        elapsed = time.perf_counter() - start_time
+        voicing, median_cents, within = compare(f0, reference)
+        print(f"{backend:>14} {elapsed:9.2f} {voicing:8.3f} {median_cents:13.2f} {within:11.3f}")
@@ -0,0 +1,89 @@
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import librosa
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from separation import Separator, default_model
+
+# Usage: python benchmarks/bench_separation.py [audio_file ...] [--seconds N] [--threads N] [--repo folder]
+# Separates two tracks (the given files, or synthetic stereo mixes of N
+# seconds, default 60), as a live and a studio track would be:
+#   subprocess: `python -m demucs` per track, stems through WAV files (the
+#               old separate_vocals)
+#   in-process: one resident Separator, arrays in and out
+# Reports wall and CPU time (the subprocess path's CPU is its children's)
+# and the correlation between the two paths' vocals. The subprocess gets the
+# Separator's --shifts 0 (its default of 1 only adds a random offset), so
+# the two outputs are comparable. --repo points both at a local folder of
+# model files instead of downloading them.
+
+def synthetic_mix(duration_s, sr=44100, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sr)) / sr
+    voice = 0.3 * np.sin(2 * np.pi * 220 * 2 ** (np.floor(t) % 5 / 12) * t)
+    drums = 0.2 * rng.standard_normal(len(t)) * (t % 0.5 < 0.05)
+    bass = 0.2 * np.sin(2 * np.pi * 55 * t)
+    return np.stack([voice + drums + bass, voice + drums - bass]).astype(np.float32), sr
+
+def subprocess_separate(y, sr, repo=None):
+    temp_folder = tempfile.mkdtemp(prefix="demucs_")
+    try:
+        input_file = os.path.join(temp_folder, "input.wav")
+        sf.write(input_file, y.T, sr)
+        command = [sys.executable, "-m", "demucs", "-n", default_model, "--out", temp_folder,
+                   "--two-stems", "vocals", "--shifts", "0", input_file]
+        if repo:
+            command += ["--repo", repo]
+        subprocess.run(command, check=True, capture_output=True)
+        vocals, vocals_sr = librosa.load(os.path.join(temp_folder, default_model, "input", "vocals.wav"), sr=None)
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+    return vocals, vocals_sr
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def option(name, default):
+    if name in sys.argv:
+        value = sys.argv[sys.argv.index(name) + 1]
+        del sys.argv[sys.argv.index(name):sys.argv.index(name) + 2]
+        return value
+    return default
+
+if __name__ == "__main__":
+    seconds = float(option("--seconds", 60))
+    threads = option("--threads", None)
+    repo = option("--repo", None)
+    if len(sys.argv) > 1:
+        tracks = [librosa.load(path, sr=None, mono=False) for path in sys.argv[1:]]
+    else:
+        tracks = [synthetic_mix(seconds, seed=0), synthetic_mix(seconds, seed=1)]
+    total_s = sum(np.atleast_2d(y).shape[-1] / sr for y, sr in tracks)
+    print(f"{len(tracks)} tracks, {total_s:.0f}s of audio, {os.cpu_count()} CPUs")
+
+    wall, cpu = time.perf_counter(), children_cpu()
+    old = [subprocess_separate(y, sr, repo) for y, sr in tracks]
+    old_wall, old_cpu = time.perf_counter() - wall, children_cpu() - cpu
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    separator = Separator(threads=int(threads) if threads else None, repo=repo)
+    load_wall = time.perf_counter() - wall
+    new = separator.separate_many(tracks)
+    new_wall, new_cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    print(f"{'path':>11} {'wall (s)':>9} {'CPU (s)':>8} {'x realtime':>11}")
+    print(f"{'subprocess':>11} {old_wall:9.1f} {old_cpu:8.1f} {total_s / old_wall:11.2f}")
+    print(f"{'in-process':>11} {new_wall:9.1f} {new_cpu:8.1f} {total_s / new_wall:11.2f}"
+          f"   (model load {load_wall:.1f}s)")
+
+    for (a, _), (b, _) in zip(old, new):
+        n = min(len(a), len(b))
+        print(f"vocals correlation: {np.corrcoef(a[:n], b[:n])[0, 1]:.4f}")
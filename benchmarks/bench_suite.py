@@ -0,0 +1,231 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fixtures
+from alignment import path_deviation
+from pipeline import compute_alignment_path, denoise_vocals, extract_chroma
+from pitch import extract_pitch
+from silence import trim_silence
+from warping import warp_audio
+
+# Usage: python benchmarks/bench_suite.py [--durations 1,5,30] [--stages a,b] [--aligners a,b]
+#            [--backends a,b] [--repeat N] [--memory] [--out PATH] [--compare PATH]
+# Times every processing stage on the synthetic fixtures of fixtures.py (1, 5
+# and 30 minutes by default) and checks each result against the fixture's
+# known truth:
+#   trim_silence  lead-in found vs the true one, ms
+#   denoise       denoise_vocals on the live take; lead-in error, ms
+#   chroma        extract_chroma of both takes
+#   align_<name>  compute_alignment_path; deviation from the true time map,
+#                 mean / p95 / max ms
+#   warp          warp_audio of the studio take through the true time map;
+#                 correlation of its loudness envelope with the live take's
+#   pitch_<name>  extract_pitch of the live take; voicing agreement, median
+#                 cents error and share of voiced frames within 50 cents
+# Times are the best of --repeat runs; --memory also records peak traced
+# memory (slower). Results go to benchmarks/results/<commit>.json (or --out)
+# with the fixture checksums, so runs on different commits can be compared:
+# --compare prints each stage's time against an earlier results file and
+# flags stages that got slower or less accurate.
+
+sr = fixtures.sr
+hop_length = fixtures.hop_length
+chroma_hop = 1024
+durations_min = [1, 5, 30]
+stages = ["trim_silence", "denoise", "chroma", "align", "warp", "pitch"]
+aligners = ["exact", "multiscale", "band"]
+backends = ["yin"]
+max_exact_bytes = 4 << 30
+envelope_ms = 20
+slower_ratio = 1.1     # --compare flags stages this much slower...
+slower_seconds = 0.05  # ...and by at least this many seconds
+results_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+# Best time of `repeat` runs of fn (stage log lines suppressed); returns
+# (last result, seconds, peak MB or None)
+def measure(fn, repeat=1, memory=False):
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+    return result, best, peak
+
+# Accuracy checks
+def live_lead_in(fixture):
+    studio_times, live_times = fixture["time_map"]
+    return live_times[np.searchsorted(studio_times, fixture["lead_in"])]
+
+def true_path(fixture, n_live_frames):
+    studio_times, live_times = fixture["time_map"]
+    live_frame_times = np.arange(n_live_frames) * chroma_hop / sr
+    studio_frames = np.rint(np.interp(live_frame_times, live_times, studio_times) * sr / chroma_hop)
+    return studio_frames.astype(np.int64), np.arange(n_live_frames)
+
+def envelope(y, n):
+    frame = int(sr * envelope_ms / 1000)
+    y = y[:n - n % frame].reshape(-1, frame)
+    return np.sqrt(np.mean(y.astype(np.float64) ** 2, axis=1))
+
+def pitch_accuracy(f0, truth):
+    n = min(len(f0), len(truth))
+    f0, truth = f0[:n], truth[:n]
+    voicing = float(np.mean(np.isnan(f0) == np.isnan(truth)))
+    both = ~np.isnan(f0) & ~np.isnan(truth)
+    cents = 1200 * np.abs(np.log2(f0[both] / truth[both]))
+    return {"voicing": voicing, "median_cents": float(np.median(cents)) if len(cents) else None,
+            "within_50_cents": float(np.mean(cents < 50)) if len(cents) else None}
+
+# Runs the selected stages on one fixture; returns {stage: {seconds,
+# realtime, peak_mb, accuracy...}}
+def run_fixture(fixture, options):
+    results = {}
+    live_seconds = len(fixture["live"]) / sr
+
+    def record(name, fn, audio_seconds=live_seconds):
+        result, seconds, peak = measure(fn, options["repeat"], options["memory"])
+        results[name] = {"seconds": round(seconds, 4), "realtime": round(audio_seconds / seconds, 2),
+                         "peak_mb": round(peak, 1) if peak is not None else None}
+        return result
+
+    if "trim_silence" in options["stages"]:
+        _, start_ms = record("trim_silence", lambda: trim_silence(fixture["studio"], sr),
+                             len(fixture["studio"]) / sr)
+        results["trim_silence"]["lead_in_error_ms"] = round(abs(start_ms - 1000 * fixture["lead_in"]), 1)
+
+    if "denoise" in options["stages"]:
+        _, start = record("denoise", lambda: denoise_vocals(fixture["live"], sr))
+        results["denoise"]["lead_in_error_ms"] = round(1000 * abs(start - live_lead_in(fixture)), 1)
+
+    chroma = None
+    if "chroma" in options["stages"] or "align" in options["stages"]:
+        chroma = record("chroma", lambda: (extract_chroma(fixture["studio"]), extract_chroma(fixture["live"])))
+
+    if "align" in options["stages"]:
+        n, m = chroma[0].shape[1], chroma[1].shape[1]
+        truth = true_path(fixture, m)
+        for aligner in options["aligners"]:
+            if aligner == "exact" and 16 * n * m > max_exact_bytes:
+                continue
+            path = record(f"align_{aligner}", lambda: compute_alignment_path(chroma[0], chroma[1], aligner))
+            path = (np.asarray(path[0]), np.asarray(path[1]))
+            frame_ms = 1000 * chroma_hop / sr
+            mean, p95, worst = (frame_ms * d for d in path_deviation(path, truth))
+            results[f"align_{aligner}"].update(deviation_ms_mean=round(mean, 1), deviation_ms_p95=round(p95, 1),
+                                               deviation_ms_max=round(worst, 1))
+
+    if "warp" in options["stages"]:
+        warped = record("warp", lambda: warp_audio(fixture["studio"], sr, [fixture["time_map"]]))
+        n = min(len(warped), len(fixture["live_clean"]))
+        correlation = np.corrcoef(envelope(warped, n), envelope(fixture["live_clean"], n))[0, 1]
+        results["warp"]["envelope_correlation"] = round(float(correlation), 4)
+
+    if "pitch" in options["stages"]:
+        for backend in options["backends"]:
+            f0, _ = record(f"pitch_{backend}", lambda: extract_pitch(fixture["live"], sr, backend,
+                                                                     hop_length=hop_length))
+            results[f"pitch_{backend}"].update({k: round(v, 4) if v is not None else None
+                                                for k, v in pitch_accuracy(f0, fixture["live_f0"]).items()})
+    return results
+
+# Accuracy fields where a larger value is better
+better_higher = ("envelope_correlation", "voicing", "within_50_cents")
+
+def compare(results, baseline):
+    for label, checksum in results["fixtures"].items():
+        if baseline["fixtures"].get(label, checksum) != checksum:
+            print(f"Warning: the {label} fixture differs from the baseline's; its times are not comparable")
+    print(f"\nAgainst {baseline['commit']}:")
+    print(f"{'input':>6} {'stage':>18} {'before (s)':>11} {'after (s)':>10} {'ratio':>7}")
+    for label, stage_results in results["results"].items():
+        for stage, result in stage_results.items():
+            before = baseline["results"].get(label, {}).get(stage)
+            if before is None:
+                continue
+            ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+            slower = ratio > slower_ratio and result["seconds"] - before["seconds"] > slower_seconds
+            notes = ["slower"] if slower else []
+            for field, value in result.items():
+                if field in ("seconds", "realtime", "peak_mb") or value is None or before.get(field) is None:
+                    continue
+                worse = value < before[field] if field in better_higher else value > before[field]
+                if worse and not np.isclose(value, before[field]):
+                    notes.append(f"{field} {before[field]} -> {value}")
+            print(f"{label:>6} {stage:>18} {before['seconds']:11.3f} {result['seconds']:10.3f} {ratio:7.2f}"
+                  f"  {'; '.join(notes)}")
+
+if __name__ == "__main__":
+    options = {"durations": durations_min, "stages": stages, "aligners": aligners, "backends": backends,
+               "repeat": 1, "memory": False, "out": None, "compare": None}
+    args = iter(sys.argv[1:])
+    for arg in args:
+        name = arg[2:]
+        if name == "memory":
+            options["memory"] = True
+        elif name == "repeat":
+            options["repeat"] = int(next(args))
+        elif name in ("out", "compare"):
+            options[name] = next(args)
+        elif name == "durations":
+            options["durations"] = [float(d) for d in next(args).split(",")]
+        elif name in ("stages", "aligners", "backends"):
+            options[name] = next(args).split(",")
+        else:
+            print(f"Unknown option {arg}")
+            sys.exit(1)
+
+    # Compile numba kernels and warm caches outside the measurements
+    run_fixture(fixtures.make_fixture(10), {**options, "repeat": 1, "memory": False})
+
+    results = {"commit": commit(), "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "python": platform.python_version(), "numpy": np.__version__, "librosa": librosa.__version__,
+               "machine": platform.machine(), "cpus": os.cpu_count(), "fixtures": {}, "results": {}}
+    print(f"{'input':>6} {'stage':>18} {'time (s)':>9} {'x real':>8} {'peak MB':>8}  accuracy")
+    for duration in options["durations"]:
+        label = f"{duration:g}m"
+        fixture = fixtures.make_fixture(duration * 60)
+        results["fixtures"][label] = fixtures.checksum(fixture)
+        results["results"][label] = run_fixture(fixture, options)
+        for stage, result in results["results"][label].items():
+            accuracy = ", ".join(f"{k} {v}" for k, v in result.items() if k not in ("seconds", "realtime", "peak_mb"))
+            peak = "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+            print(f"{label:>6} {stage:>18} {result['seconds']:9.3f} {result['realtime']:8.1f} {peak:>8}  {accuracy}",
+                  flush=True)
+        del fixture
+
+    out = options["out"] or os.path.join(results_folder, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results saved to {out}")
+
+    if options["compare"]:
+        with open(options["compare"], encoding="utf-8") as f:
+            compare(results, json.load(f))
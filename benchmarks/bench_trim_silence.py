@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import numpy as np
+from pydub import AudioSegment
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from silence import trim_silence
+
+# Usage: python benchmarks/bench_trim_silence.py [wav_file]
+# Without a file, 10 minute synthetic vocals with short and long silent
+# lead-in/out are used.
+
+sr = 44100
+duration_s = 600
+
+# Reference implementation previously used in denoise-vocals.py
+def trim_silence_pydub(audio, silence_thresh=-40):
+    start_trim = 0
+    end_trim = len(audio)
+
+    for i in range(len(audio)):
+        if audio[i:i+1].dBFS > silence_thresh:
+            start_trim = i
+            break
+    for i in range(len(audio) - 1, 0, -1):
+        if audio[i:i+1].dBFS > silence_thresh:
+            end_trim = i + 1
+            break
+
+    return audio[start_trim:end_trim], start_trim
+
+def synthetic_vocal(sr, duration_s, lead_in_s=3.2, tail_s=4.7):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration_s * sr)) / sr
+    f0 = 220 * 2 ** (np.floor(t / 2) % 12 / 12) * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    y = 0.3 * np.sin(2 * np.pi * np.cumsum(f0) / sr)
+    y += 0.001 * rng.standard_normal(len(y))
+    y[:int(lead_in_s * sr)] *= 0.001
+    y[-int(tail_s * sr):] *= 0.001
+    return y.astype(np.float32)
+
+def to_segment(y, sr):
+    pcm = (np.clip(y, -1, 1) * 32767).astype(np.int16)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=sr, channels=1)
+
+def run_case(name, y, sr):
+    segment = to_segment(y, sr)
+    print(f"{name}: {len(y) / sr:.1f}s at {sr} Hz")
+
+    start_time = time.perf_counter()
+    _, pydub_start = trim_silence_pydub(segment)
+    pydub_elapsed = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    _, numpy_start = trim_silence(y, sr)
+    numpy_elapsed = time.perf_counter() - start_time
+
+    print(f"  pydub loop: {pydub_elapsed:8.3f}s  start={pydub_start / 1000.0:.3f}")
+    print(f"  numpy:      {numpy_elapsed:8.3f}s  start={numpy_start / 1000.0:.3f}")
+    print(f"  Speedup: {pydub_elapsed / numpy_elapsed:.0f}x")
+
+if len(sys.argv) > 1:
+    import librosa
+    y, sr = librosa.load(sys.argv[1], sr=None)
+    run_case(os.path.basename(sys.argv[1]), y, sr)
+else:
+    run_case("Short silence", synthetic_vocal(sr, duration_s), sr)
+    run_case("Long silence", synthetic_vocal(sr, duration_s, lead_in_s=95.0, tail_s=80.0), sr)
@@ -0,0 +1,116 @@
+import hashlib
+import numpy as np
+
+# Deterministic synthetic vocals for the benchmarks. A seeded score of notes
+# (a random walk over a singable range, each with its own vibrato) and rests
+# is rendered twice: as the studio take on its own timeline, and as a live
+# take sung to a known, smoothly varying tempo with noise added. Both are
+# rendered from the score rather than resampled from each other, so the live
+# take keeps the studio pitch and only its timing differs, and the true f0
+# of either and the true live -> studio time map are known exactly.
+
+sr = 22050
+hop_length = 256
+lead_in = 1.5          # seconds of silence before the first note
+tail = 1.0             # and after the last
+note_seconds = (0.2, 1.2)
+rest_seconds = (0.3, 1.5)
+rest_probability = 0.2
+midi_range = (55, 74)
+vibrato_rates = (5.0, 6.5)  # Hz
+vibrato_depth = 0.012       # peak, as a fraction of f0 (~20 cents)
+tempo_depth = 0.06          # the live tempo varies by +-6%...
+tempo_period = 40.0         # ...over this many seconds
+live_noise = 0.002
+block = 1 << 20        # samples rendered at a time
+
+class Score:
+    def __init__(self, starts, lengths, f0, rates, depths):
+        self.starts = starts    # seconds on the score (studio) timeline
+        self.lengths = lengths
+        self.f0 = f0            # Hz
+        self.rates = rates
+        self.depths = depths
+
+    # f0 in Hz at score times (NaN outside notes), and each time's position
+    # in its note in seconds from either end (for the envelope)
+    def at(self, times):
+        note = np.clip(np.searchsorted(self.starts, times, side="right") - 1, 0, len(self.starts) - 1)
+        into = times - self.starts[note]
+        left = self.lengths[note] - into
+        inside = (into >= 0) & (left > 0)
+        f0 = np.where(inside, self.f0[note], np.nan)
+        f0 = f0 * (1 + self.depths[note] * np.sin(2 * np.pi * self.rates[note] * times))
+        return f0, np.minimum(into, left)
+
+def make_score(duration_s, seed=0):
+    rng = np.random.default_rng(seed)
+    starts, lengths, f0 = [], [], []
+    t, midi = lead_in, rng.integers(*midi_range)
+    while t < duration_s - tail:
+        if starts and rng.random() < rest_probability:
+            t += rng.uniform(*rest_seconds)
+        length = min(rng.uniform(*note_seconds), duration_s - tail - t)
+        midi = int(np.clip(midi + rng.integers(-4, 5), *midi_range))
+        starts.append(t)
+        lengths.append(length)
+        f0.append(440 * 2 ** ((midi - 69) / 12))
+        t += length
+    n = len(starts)
+    return Score(np.array(starts), np.array(lengths), np.array(f0),
+                 rng.uniform(*vibrato_rates, n), rng.uniform(0, vibrato_depth, n))
+
+# Live time -> score time for a take of duration_s score seconds
+def tempo_map(duration_s, seed=0):
+    phase = np.random.default_rng(seed + 1).uniform(0, 2 * np.pi)
+    def score_time(live_times):
+        # integral of the rate 1 + depth * sin(2 pi t / period + phase)
+        w = 2 * np.pi / tempo_period
+        return live_times + tempo_depth / w * (np.cos(phase) - np.cos(w * live_times + phase))
+    # live length: the first time the score time reaches duration_s
+    live_times = np.arange(0, duration_s * (1 + 2 * tempo_depth), 0.01)
+    live_duration = live_times[np.searchsorted(score_time(live_times), duration_s)]
+    return score_time, live_duration
+
+# Renders the score at the given score time of every output sample, block by
+# block (the phase carries over), as float32 with a three-harmonic timbre and
+# 10 ms fades at note edges. Returns the audio and the true f0 per
+# hop_length frame (NaN when unvoiced).
+def render(score, n_samples, score_time=lambda t: t):
+    y = np.zeros(n_samples, dtype=np.float32)
+    f0_frames = np.full(1 + n_samples // hop_length, np.nan)
+    phase = 0.0
+    for lo in range(0, n_samples, block):
+        times = score_time(np.arange(lo, min(lo + block, n_samples)) / sr)
+        f0, edge = score.at(times)
+        voiced = ~np.isnan(f0)
+        step = 2 * np.pi * np.where(voiced, f0, 0) / sr
+        phases = phase + np.cumsum(step)
+        phase = phases[-1] % (2 * np.pi)
+        envelope = np.where(voiced, np.clip(edge / 0.01, 0, 1), 0)
+        y[lo:lo + len(times)] = 0.3 * envelope * (np.sin(phases) + 0.5 * np.sin(2 * phases)
+                                                 + 0.25 * np.sin(3 * phases))
+        frames = np.arange((lo + hop_length - 1) // hop_length * hop_length, lo + len(times), hop_length)
+        f0_frames[frames // hop_length] = f0[frames - lo]
+    return y, f0_frames
+
+# The fixture for a duration: studio and live audio (and the live take
+# before noise), their true f0 per frame, and the true time map as (studio
+# times, live times) every 10 ms
+def make_fixture(duration_s, seed=0):
+    score = make_score(duration_s, seed)
+    score_time, live_duration = tempo_map(duration_s, seed)
+    studio, studio_f0 = render(score, int(duration_s * sr))
+    live_clean, live_f0 = render(score, int(live_duration * sr), score_time)
+    noise = np.random.default_rng(seed + 2).standard_normal(len(live_clean), dtype=np.float32)
+    live_times = np.arange(0, live_duration, 0.01)
+    return {"studio": studio, "live": live_clean + live_noise * noise, "live_clean": live_clean,
+            "studio_f0": studio_f0, "live_f0": live_f0, "time_map": (score_time(live_times), live_times),
+            "lead_in": lead_in}
+
+# Checksum of a fixture's audio, so results are only compared on equal inputs
+def checksum(fixture):
+    digest = hashlib.sha256()
+    for name in ("studio", "live"):
+        digest.update(fixture[name].tobytes())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,130 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Usage: python benchmarks/import_times.py [script.py|module ...] [--top N] [--repeat N] [--out PATH]
+#            [--compare PATH]
+# Startup cost of the scripts: for each, the imports at its top level are
+# run in a fresh interpreter under `python -X importtime`, without running
+# the script itself (so the GUI and the stage scripts can be measured
+# alike). Reports the total import time and the packages that cost the most
+# (cumulative, counting what they import in turn). Times are the best of
+# --repeat runs. Results go to benchmarks/results/imports-<commit>.json (or
+# --out); --compare prints each script's total against an earlier results
+# file.
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+scripts = ["VocalCompare.py", "dl-files.py", "extract-vocals.py", "denoise-vocals.py", "sync-vocals.py",
+           "pitch-extraction.py", "process-vocals.py", "batch-process.py", "score-songs.py", "warm-worker.py"]
+top = 8
+results_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=root)
+        return result.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+# The import statements at a script's top level (not inside functions), as
+# source; a module name stands for itself
+def startup_imports(target):
+    if not target.endswith(".py"):
+        return f"import {target}"
+    with open(os.path.join(root, target), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+# {module: (self seconds, cumulative seconds)} and the total, from one
+# interpreter importing `source`; an import that fails is reported, not
+# raised (a missing GUI library, say)
+def import_times(source):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", source], capture_output=True,
+                            text=True, cwd=root)
+    modules, total, error = {}, 0.0, None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            if line.strip():
+                error = line.strip()
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # the header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        modules[name] = (self_us / 1e6, cumulative_us / 1e6)
+        if depth == 0:
+            total += cumulative_us / 1e6
+    return modules, total, error if result.returncode else None
+
+# Packages (top-level names) by cumulative time: a package's time is that of
+# its first import, which includes everything it imported
+def package_times(modules):
+    packages = {}
+    for name, (_, cumulative) in modules.items():
+        package = name.split(".")[0]
+        if package == name or package not in modules:
+            packages[package] = max(packages.get(package, 0.0), cumulative)
+    return sorted(packages.items(), key=lambda item: -item[1])
+
+def measure(target, repeat):
+    source = startup_imports(target)
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        modules, total, error = import_times(source)
+        wall = time.perf_counter() - start_time
+        if best is None or total < best["import_seconds"]:
+            best = {"import_seconds": round(total, 4), "process_seconds": round(wall, 4), "error": error,
+                    "modules": len(modules), "packages": [[p, round(s, 4)] for p, s in package_times(modules)]}
+    return best
+
+def compare(results, baseline):
+    print(f"\nAgainst {baseline['commit']}:")
+    print(f"{'script':>22} {'before (s)':>11} {'after (s)':>10} {'ratio':>7}")
+    for target, result in results["results"].items():
+        before = baseline["results"].get(target)
+        if before is None:
+            continue
+        ratio = result["import_seconds"] / before["import_seconds"] if before["import_seconds"] else float("inf")
+        print(f"{target:>22} {before['import_seconds']:11.3f} {result['import_seconds']:10.3f} {ratio:7.2f}")
+
+if __name__ == "__main__":
+    options = {"targets": [], "top": top, "repeat": 1, "out": None, "compare": None}
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg in ("--top", "--repeat"):
+            options[arg[2:]] = int(next(args))
+        elif arg in ("--out", "--compare"):
+            options[arg[2:]] = next(args)
+        elif arg.startswith("--"):
+            print(f"Unknown option {arg}")
+            sys.exit(1)
+        else:
+            options["targets"].append(arg)
+
+    results = {"commit": commit(), "created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+               "results": {}}
+    for target in options["targets"] or scripts:
+        result = results["results"][target] = measure(target, options["repeat"])
+        packages = ", ".join(f"{p} {s:.2f}" for p, s in result["packages"][:options["top"]])
+        print(f"{target:>22} {result['import_seconds']:7.2f}s  {result['modules']:5d} modules  {packages}",
+              flush=True)
+        if result["error"]:
+            print(f"{'':>22} failed: {result['error']}")
+
+    out = options["out"] or os.path.join(results_folder, f"imports-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results saved to {out}")
+
+    if options["compare"]:
+        with open(options["compare"], encoding="utf-8") as f:
+            compare(results, json.load(f))
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+# Content-addressed cache of stage results. An entry's key is a hash of the
+# stage name, its code version, its parameters and the keys of its inputs:
+# raw files are keyed by their content, and a stage fed by another stage uses
+# that stage's key, so a studio track shared by several live performances
+# hits the same entries whichever song folder it sits in.
+#
+# Each entry is a folder holding one .npy per array in the result and a
+# meta.json with the remaining values. meta.json's mtime records the last
+# use; once the cache outgrows max_bytes the least recently used entries are
+# removed (never, with max_bytes=None). The cache's size is walked once per
+# StageCache and then kept as a running total of what it stores, so a store
+# only walks the cache again when that total passes max_bytes; eviction
+# then frees down to evict_to of it, so a full cache is not walked on every
+# store. Entries other processes store meanwhile are not counted until then.
+
+default_max_bytes = 10 * 1024 ** 3
+evict_to = 0.9  # fraction of max_bytes an eviction frees the cache down to
+
+def file_key(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def stage_key(stage, version, params, inputs):
+    description = json.dumps({"stage": stage, "version": version, "params": params, "inputs": inputs},
+                             sort_keys=True)
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+class StageCache:
+    def __init__(self, root, max_bytes=default_max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None  # running total of the entries' bytes, None until first walked
+        os.makedirs(root, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def contains(self, key):
+        return os.path.exists(os.path.join(self._entry(key), "meta.json"))
+
+    # Returns the cached result tuple, or None
+    def load(self, key):
+        meta_path = os.path.join(self._entry(key), "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        items = []
+        for kind, value in meta["items"]:
+            if kind == "array":
+                items.append(np.load(os.path.join(self._entry(key), value), mmap_mode="r"))
+            else:
+                items.append(value)
+        os.utime(meta_path)
+        return tuple(items)
+
+    def store(self, key, result):
+        entry = self._entry(key)
+        partial = entry + f".{os.getpid()}.partial"
+        os.makedirs(partial, exist_ok=True)
+
+        items = []
+        for i, value in enumerate(result):
+            if isinstance(value, np.ndarray):
+                np.save(os.path.join(partial, f"{i}.npy"), value)
+                items.append(("array", f"{i}.npy"))
+            else:
+                items.append(("value", value.item() if isinstance(value, np.generic) else value))
+        with open(os.path.join(partial, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"items": items, "created": time.time()}, f)
+
+        size = sum(os.path.getsize(os.path.join(partial, f)) for f in os.listdir(partial))
+
+        # Another process may have stored the same entry meanwhile
+        try:
+            os.replace(partial, entry)
+        except OSError:
+            shutil.rmtree(partial, ignore_errors=True)
+            return
+        if self.max_bytes is None:
+            return
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    # Entries as (last used, size, path), oldest first
+    def entries(self):
+        found = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            meta_path = os.path.join(entry, "meta.json")
+            if not os.path.exists(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            found.append((os.path.getmtime(meta_path), size, entry))
+        return sorted(found)
+
+    # Walks the cache and, when it is over max_bytes, removes the least
+    # recently used entries until it is within evict_to of it; resets the
+    # running total
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        found = self.entries()
+        total = sum(size for _, size, _ in found)
+        limit = self.max_bytes if total <= self.max_bytes else evict_to * self.max_bytes
+        for _, size, entry in found:
+            if total <= limit:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        self._size = total
@@ -1,7 +1,10 @@
 import os
-import subprocess
-import shutil
 import sys
+import numpy as np
+from metrics import measure, recording
+from pipeline import load_audio, log, save_audio, separate_vocals, song_files, song_stages
+from scheduler import Scheduler, Task
+from separation import set_threads
 
 # Path Setup
 if len(sys.argv) != 2:
@@ -9,47 +12,33 @@ if len(sys.argv) != 2:
     sys.exit(1)
 
 song_folder = sys.argv[1]
-raw_folder = os.path.join(song_folder, "raw")
+files = song_files(song_folder)
 
-data = {}
-with open(os.path.join(song_folder, "data.txt"), encoding="utf-8") as f:
-    for line in f:
-        if "=" in line:
-            k, v = line.strip().split("=", 1)
-            data[k] = v
-
-live_audio = os.path.join(raw_folder, "live_audio.wav")
-studio_audio = os.path.join(raw_folder, "studio_audio.wav")
-
-live_vocals_output = os.path.join(raw_folder, "live_vocals.wav")
-studio_vocals_output = os.path.join(raw_folder, "studio_vocals.wav")
-
-temp_demucs_out = os.path.join(raw_folder, "demucs_temp")
-
-def separate_vocals(input_file, final_output_path):
+def separate_file(input_file, final_output_path):
     if not os.path.exists(input_file):
-        print(f"Warning: {input_file} not found. Skipping.", flush=True)
+        log(f"Warning: {input_file} not found. Skipping.")
         return
 
-    print(f"Separating vocals for: {input_file}", flush=True)
-
-    subprocess.run([
-        "python", "-m", "demucs",
-        "-n", "htdemucs",
-        "--out", temp_demucs_out,
-        "--two-stems", "vocals",
-        input_file
-    ], check=True)
-
-    filename_only = os.path.splitext(os.path.basename(input_file))[0]
-    vocals_source = os.path.join(temp_demucs_out, "htdemucs", filename_only, "vocals.wav")
-
-    if os.path.exists(vocals_source):
-        shutil.move(vocals_source, final_output_path)
-        print(f"Saved vocals to: {final_output_path}", flush=True)
-    else:
-        print(f"Error: Expected vocals file not found for {input_file}", flush=True)
-
-# Run for both live and studio
-separate_vocals(live_audio, live_vocals_output)
-separate_vocals(studio_audio, studio_vocals_output)
+    log(f"Separating vocals for: {input_file}")
+    audio, sr = load_audio(input_file, mono=False)
+    with measure("live separation", audio.shape[-1] / sr):
+        vocals, vocals_sr = separate_vocals(audio, sr)
+    save_audio(final_output_path, vocals, vocals_sr)
+    log(f"Saved vocals to: {final_output_path}")
+
+# The studio side is separated once per studio track, in its reference
+def separate_studio():
+    log("Separating studio vocals...")
+    studio_vocals, studio_sr = song_stages(song_folder)["studio_vocals"].result()
+    save_audio(files["studio_vocals"], np.asarray(studio_vocals), studio_sr)
+    log(f"Saved vocals to: {files['studio_vocals']}")
+
+# Live and studio run side by side, each on half the CPU threads
+scheduler = Scheduler()
+threads = max(1, scheduler.cpu_budget // 2)
+set_threads(threads)
+with recording("extract-vocals", song_folder):
+    scheduler.run([
+        Task("live", lambda: separate_file(files["live_audio"], files["live_vocals"]), cpu=threads),
+        Task("studio", separate_studio, cpu=threads),
+    ])
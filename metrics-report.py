@@ -0,0 +1,64 @@
+import sys
+import numpy as np
+from metrics import aggregate, find_metric_folders, read_runs, regressions
+
+# Summarises the recorded runs (metrics.jsonl, see metrics.py) of song
+# folders, or of every song folder under a folder such as files/: per step
+# timings, peak memory and throughput across runs, each script's startup
+# time, and the steps that got slower in each folder's latest run.
+usage = "Usage: python metrics-report.py <song_folder|folder>... [--script NAME] [--last N]"
+
+if __name__ == "__main__":
+    paths, script, last = [], None, None
+    args = iter(sys.argv[1:])
+    try:
+        for arg in args:
+            if arg == "--script":
+                script = next(args)
+            elif arg == "--last":
+                last = int(next(args))
+            elif arg.startswith("--"):
+                raise ValueError(arg)
+            else:
+                paths.append(arg)
+    except (StopIteration, ValueError):
+        print(usage)
+        sys.exit(1)
+    if not paths:
+        print(usage)
+        sys.exit(1)
+
+    runs_by_folder = {}
+    for folder in find_metric_folders(paths):
+        runs = [run for run in read_runs(folder) if script is None or run["script"] == script]
+        runs_by_folder[folder] = runs[-last:] if last else runs
+    runs = [run for folder_runs in runs_by_folder.values() for run in folder_runs]
+    print(f"{len(runs)} runs in {len(runs_by_folder)} song folders")
+
+    def cell(value, scale=1.0, digits=1):
+        return "-" if value is None else f"{value / scale:.{digits}f}"
+    print(f"{'step':>32} {'runs':>5} {'p50 (s)':>8} {'p95 (s)':>8} {'cpu p50':>8} {'peak MB':>8} {'x real':>7}")
+    summary = aggregate(runs)
+    for name, step in summary.items():
+        # * marks steps that ran alongside others: their CPU and memory include the others' work
+        overlapped = "*" if step["overlapped"] else " "
+        print(f"{name[:32]:>32} {step['count']:5d} {cell(step['wall_p50']):>8} {cell(step['wall_p95']):>8} "
+              f"{cell(step['cpu_p50']):>7}{overlapped} {cell(step['peak_rss_max'], 1e6, 0):>8} "
+              f"{cell(step['throughput_p50']):>7}")
+    if any(step["overlapped"] for step in summary.values()):
+        print("* ran alongside other steps in some runs; its CPU and memory include theirs")
+
+    startup = {}
+    for run in runs:
+        if run.get("startup_seconds") is not None:
+            startup.setdefault(run["script"], []).append(run["startup_seconds"])
+    if startup:
+        print("Startup (process start to run start, mostly imports):")
+        for run_script, seconds in sorted(startup.items()):
+            print(f"  {run_script}: p50 {np.percentile(seconds, 50):.2f}s over {len(seconds)} runs")
+
+    found = regressions(runs_by_folder)
+    if found:
+        print("Slower than usual in the latest run:")
+        for folder, run_script, name, seconds, usual in found:
+            print(f"  {folder} ({run_script}) {name}: {seconds:.1f}s, usually {usual:.1f}s")
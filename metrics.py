@@ -0,0 +1,348 @@
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+
+# Per-step instrumentation. Within a run (recording(...)), measure(name)
+# records for each step:
+#   wall_seconds, cpu_seconds   CPU of the whole process and of its child
+#                               processes (the pyin pool, ffmpeg) while the
+#                               step ran
+#   overlapped                  whether a step on another thread was running
+#                               at the same time; its CPU, memory and byte
+#                               counts then include that step's work
+#   peak_rss                    the process's peak resident memory while the
+#                               step ran, sampled every 10 ms
+#   read_bytes, written_bytes   bytes the process read and wrote meanwhile
+#                               (through read/write calls, not memory maps)
+#   audio_seconds, throughput   audio seconds per wall second, when the
+#                               step's audio length is known
+# Steps nest per thread (a load inside a separation has it as its parent).
+#
+# A finished run is appended to its song folder's metrics.jsonl, one JSON
+# object per run, so the folder keeps its history; aggregate() and
+# regressions() (metrics-report.py) summarise runs across folders. Set
+# VOCALCOMPARE_METRICS=0 to record nothing. A run also records its
+# startup_seconds, from the process starting to the run starting: mostly
+# imports, paid again by every stage script launched on its own.
+#
+# With VOCALCOMPARE_PROFILE=cprofile each run is also profiled with
+# cProfile (the main thread and every measured step's thread), with
+# VOCALCOMPARE_PROFILE=sample by a stack sampler over all threads (collapsed
+# stacks, as flame graph tools read them). Profiles go to the song folder's
+# profiles/ folder.
+#
+# Both variables are read when a run starts, not on import, so a warm worker
+# (worker.py) that imported this module earlier follows each job's settings.
+
+sample_interval = 0.01  # seconds, for memory and for the stack sampler
+regression_ratio = 1.25 # a step this much slower than its usual time is flagged
+regression_seconds = 0.5
+
+job_started = None  # time.time() a warm worker took up its job, counted as the start instead
+
+_run = None
+_lock = threading.Lock()
+_local = threading.local()
+
+# Process counters
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+# (bytes read, bytes written) by the process so far
+def io_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        import psutil
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+    except (ImportError, AttributeError):
+        return None, None
+
+# CPU seconds of this process's child processes so far: those that have
+# exited and been waited for, plus (with psutil) those still running
+def children_cpu():
+    seconds = None
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        seconds = usage.ru_utime + usage.ru_stime
+    except ImportError:
+        pass
+    try:
+        import psutil
+        process = psutil.Process()
+        if seconds is None:
+            times = process.cpu_times()
+            seconds = times.children_user + times.children_system
+        for child in process.children(recursive=True):
+            try:
+                times = child.cpu_times()
+                seconds += times.user + times.system
+            except psutil.Error:
+                pass  # exited meanwhile
+    except ImportError:
+        pass
+    return seconds or 0.0
+
+# CPU seconds of this process and its children so far
+def total_cpu():
+    return time.process_time() + children_cpu()
+
+# Seconds since this process started
+def process_age():
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return time.time() - psutil.Process().create_time()
+    except ImportError:
+        return None
+
+def _commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# Samples memory for the open steps and, when sampling, the stacks of every
+# thread, until the run finishes
+def _sampler(run, stop):
+    me = threading.get_ident()
+    while not stop.wait(sample_interval):
+        rss = current_rss()
+        with _lock:
+            for step in run["_open"]:
+                step["peak_rss"] = max(step["peak_rss"] or 0, rss or 0) or None
+            run["peak_rss"] = max(run["peak_rss"] or 0, rss or 0) or None
+        if run["_stacks"] is None:
+            continue
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            run["_stacks"][key] = run["_stacks"].get(key, 0) + 1
+
+def _start_profile(run):
+    if run["_profile_mode"] != "cprofile" or getattr(_local, "profile", None) is not None:
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is active; on Pythons whose cProfile covers all
+        # threads at once it is already profiling this one
+        return None
+    _local.profile = profile
+    return profile
+
+def _stop_profile(run, profile):
+    if profile is not None:
+        profile.disable()
+        _local.profile = None
+        run["_profiles"].append(profile)
+
+# Measuring
+# Records one step of the current run (nothing without one). Yields the
+# step's record; audio_seconds can be set on it before the step ends.
+@contextlib.contextmanager
+def measure(name, audio_seconds=None):
+    run = _run
+    if run is None:
+        yield {}
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    read, written = io_bytes()
+    step = {"name": name, "parent": stack[-1]["name"] if stack else None,
+            "thread": threading.current_thread().name, "start": round(time.time() - run["started"], 3),
+            "audio_seconds": audio_seconds, "peak_rss": current_rss(), "overlapped": False}
+    stack.append(step)
+    with _lock:
+        for other in run["_open"]:
+            if other["thread"] != step["thread"]:
+                other["overlapped"] = step["overlapped"] = True
+        run["_open"].append(step)
+    profile = _start_profile(run)
+    wall, cpu = time.perf_counter(), total_cpu()
+    try:
+        yield step
+    finally:
+        step["wall_seconds"] = round(time.perf_counter() - wall, 4)
+        step["cpu_seconds"] = round(total_cpu() - cpu, 4)
+        _stop_profile(run, profile)
+        end_read, end_written = io_bytes()
+        step["read_bytes"] = end_read - read if read is not None else None
+        step["written_bytes"] = end_written - written if written is not None else None
+        step["throughput"] = (round(step["audio_seconds"] / step["wall_seconds"], 2)
+                              if step["audio_seconds"] and step["wall_seconds"] else None)
+        stack.pop()
+        with _lock:
+            run["_open"].remove(step)
+            step["peak_rss"] = max(step["peak_rss"] or 0, current_rss() or 0) or None
+            run["steps"].append(step)
+
+# Runs
+# Records a run of `script` for song_folder (which can be set on the
+# yielded run later, once known). The run is written to the folder's
+# metrics.jsonl when the block exits, failed or not.
+@contextlib.contextmanager
+def recording(script, song_folder=None):
+    global _run
+    if os.environ.get("VOCALCOMPARE_METRICS", "1") == "0" or _run is not None:
+        yield {}
+        return
+    age = time.time() - job_started if job_started is not None else process_age()
+    profile_mode = os.environ.get("VOCALCOMPARE_PROFILE", "")
+    run = {"script": script, "song_folder": song_folder, "started": time.time(), "commit": _commit(),
+           "python": platform.python_version(), "host": platform.node(), "cpus": os.cpu_count(),
+           "startup_seconds": round(age, 3) if age is not None else None,
+           "status": "ok", "peak_rss": current_rss(), "steps": [], "_profile_mode": profile_mode,
+           "_open": [], "_profiles": [], "_stacks": {} if profile_mode == "sample" else None}
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sampler, args=(run, stop), name="metrics sampler", daemon=True)
+    _run = run
+    sampler.start()
+    profile = _start_profile(run)
+    cpu = total_cpu()
+    try:
+        yield run
+    except BaseException:
+        run["status"] = "failed"
+        raise
+    finally:
+        run["wall_seconds"] = round(time.time() - run["started"], 3)
+        run["cpu_seconds"] = round(total_cpu() - cpu, 3)
+        _stop_profile(run, profile)
+        stop.set()
+        sampler.join()
+        _run = None
+        if run["song_folder"]:
+            write_run(run)
+
+def write_run(run):
+    song_folder = run["song_folder"]
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(run["started"]))
+    profiles, stacks = run.pop("_profiles"), run.pop("_stacks")
+    run.pop("_open")
+    run.pop("_profile_mode")
+    if profiles or stacks:
+        os.makedirs(os.path.join(song_folder, "profiles"), exist_ok=True)
+    if profiles:
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        run["profile"] = os.path.join("profiles", f"{run['script']}-{stamp}.prof")
+        stats.dump_stats(os.path.join(song_folder, run["profile"]))
+    if stacks:
+        run["profile"] = os.path.join("profiles", f"{run['script']}-{stamp}.stacks")
+        with open(os.path.join(song_folder, run["profile"]), "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+    with open(os.path.join(song_folder, "metrics.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+
+# Reports
+def read_runs(song_folder):
+    runs = []
+    try:
+        with open(os.path.join(song_folder, "metrics.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    continue  # a run cut off while being written
+    except OSError:
+        pass
+    return runs
+
+# Song folders under each path: the path itself if it has runs, else its
+# subfolders that do
+def find_metric_folders(paths):
+    folders = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, "metrics.jsonl")):
+            folders.append(path)
+        elif os.path.isdir(path):
+            folders += sorted(entry.path for entry in os.scandir(path) if entry.is_dir()
+                              and os.path.exists(os.path.join(entry.path, "metrics.jsonl")))
+    return folders
+
+# Per step name over the runs: {name: {count, overlapped, wall_p50,
+# wall_p95, cpu_p50, peak_rss_max, throughput_p50}}, overlapped counting the
+# steps that ran alongside another
+def aggregate(runs):
+    by_name = {}
+    for run in runs:
+        for step in run["steps"]:
+            by_name.setdefault(step["name"], []).append(step)
+    summary = {}
+    for name, steps in sorted(by_name.items()):
+        def values(field):
+            return np.array([s[field] for s in steps if s.get(field) is not None], dtype=float)
+        wall, cpu, rss, throughput = values("wall_seconds"), values("cpu_seconds"), values("peak_rss"), \
+            values("throughput")
+        summary[name] = {
+            "count": len(steps),
+            "overlapped": sum(1 for s in steps if s.get("overlapped")),
+            "wall_p50": float(np.percentile(wall, 50)) if len(wall) else None,
+            "wall_p95": float(np.percentile(wall, 95)) if len(wall) else None,
+            "cpu_p50": float(np.percentile(cpu, 50)) if len(cpu) else None,
+            "peak_rss_max": float(rss.max()) if len(rss) else None,
+            "throughput_p50": float(np.percentile(throughput, 50)) if len(throughput) else None,
+        }
+    return summary
+
+# Steps whose time in a folder's latest run of a script is well above their
+# median over that folder's earlier runs of it: [(folder, script, step,
+# latest seconds, median seconds)]
+def regressions(runs_by_folder):
+    found = []
+    for folder, runs in runs_by_folder.items():
+        for script in {run["script"] for run in runs}:
+            script_runs = [run for run in runs if run["script"] == script and run.get("status") == "ok"]
+            if len(script_runs) < 2:
+                continue
+            *earlier, latest = script_runs
+            for step in latest["steps"]:
+                history = [s["wall_seconds"] for run in earlier for s in run["steps"] if s["name"] == step["name"]]
+                if not history:
+                    continue
+                usual = float(np.median(history))
+                if step["wall_seconds"] > usual * regression_ratio and step["wall_seconds"] - usual > regression_seconds:
+                    found.append((folder, script, step["name"], step["wall_seconds"], usual))
+    return found
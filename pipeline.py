@@ -0,0 +1,715 @@
+import functools
+import os
+import threading
+import time
+import numpy as np
+import librosa
+import soundfile as sf
+from cache import StageCache, file_key, stage_key
+from metrics import measure
+from references import StudioReference, content_reference_id
+from scheduler import Scheduler, Task
+from scoring import write_score
+from separation import get_separator, set_threads
+from pitch import extract_pitch, yin_pitch
+from pitchfile import legacy_names, write_pitch
+from progress import emit
+from silence import frame_count, frame_dbfs, trim_silence
+from warping import TimeMap, warp_audio
+
+# Processing stages as functions on in-memory float32 arrays. The stage
+# scripts (extract-vocals, denoise-vocals, sync-vocals, pitch-extraction) are
+# thin file-based wrappers around these; run_pipeline chains them in one
+# process as a graph of cached stages, decoding each track once and writing
+# intermediate WAVs only as optional checkpoints.
+
+# Parameters
+demucs_model = "htdemucs"
+demucs_segment = None  # seconds per chunk, None for the model's own
+demucs_overlap = 0.25
+demucs_shifts = 0
+demucs_threads = None  # torch CPU threads, None for one per core
+demucs_repo = None     # local folder of model files, None to download them
+denoise_mode = "adaptive" # or "nonstationary" (noisereduce's running noise estimate)
+noise_seconds = 4      # seconds of audio in the adaptive noise profile
+noise_frame_ms = 50    # frames the noise profile is picked from
+noise_percentile = 30  # unvoiced frames no louder than this percentile count as noise
+prop_decrease = 0.8
+denoise_chunk = 300000 # samples denoised at a time (~7 s at 44.1 kHz)
+denoise_padding = 30000 # samples of context either side of a chunk
+silence_thresh = -40   # dBFS
+target_dB = -20
+sync_sr = 22050
+chroma_hop = 1024
+pitch_hop = 256
+band_radius = 200      # frames (~9 s) either side of the band centre
+adaptive_radius = 32   # frames either side of the coarse path
+coarse_factor = 8      # downsampling for the adaptive band's coarse pass
+multiscale_radius = 16 # corridor half-width at every multiscale level
+online_radius = 64     # reference frames searched either side of the online position
+online_lag = 32        # live frames held back before the online path is committed
+stream_block = 64      # live frames decoded per streaming block
+warp_block = 0.5       # seconds of output rendered per warping block
+fmin = 80
+fmax = 1000
+pitch_frame_length = 1024
+cqt_bins_per_octave = 36 # constant-Q bins under chroma (chroma_cqt's defaults)
+cqt_octaves = 7
+# Default hop of each feature, in samples at sync_sr
+feature_hops = {"cqt": chroma_hop, "chroma": chroma_hop, "rms": pitch_hop, "onset": pitch_hop}
+
+# Rough peak memory per step for the scheduler, as (MB, MB per minute of
+# audio); exact DTW alignment is instead quadratic in the track lengths
+stage_memory = {"separate": (900, 40), "denoise": (90, 12), "resample": (0, 10), "cqt": (0, 70),
+                "chroma": (0, 5), "rms": (0, 5), "onset": (0, 20), "align": (0, 100), "warp": (0, 50),
+                "pitch": (0, 260)}
+
+# Bump a stage's version whenever a code change alters its output, so cached
+# results from the old code are not reused
+stage_versions = {"separate": 2, "denoise": 3, "resample": 1, "cqt": 1, "chroma": 2,
+                  "rms": 1, "onset": 1, "align": 1, "warp": 1, "pitch": 2}
+
+aligners = ["exact", "band", "adaptive", "multiscale", "online", "dtw"]
+warp_modes = ["interp", "stretch"]
+
+# Progress messages, written in one call so that lines from stages running
+# side by side do not interleave
+def log(message):
+    print(message + "\n", end="", flush=True)
+
+# Song folder
+def song_files(song_folder):
+    raw_folder = os.path.join(song_folder, "raw")
+    return {
+        "data": os.path.join(song_folder, "data.txt"),
+        "live_audio": os.path.join(raw_folder, "live_audio.wav"),
+        "studio_audio": os.path.join(raw_folder, "studio_audio.wav"),
+        "live_vocals": os.path.join(raw_folder, "live_vocals.wav"),
+        "studio_vocals": os.path.join(raw_folder, "studio_vocals.wav"),
+        "live_denoised": os.path.join(raw_folder, "live_vocals_denoised.wav"),
+        "studio_denoised": os.path.join(raw_folder, "studio_vocals_denoised.wav"),
+        "studio_warped": os.path.join(song_folder, "studio_vocals_warped.wav"),
+        "time_map": os.path.join(song_folder, "time_map.npy"),
+        "pitch": os.path.join(song_folder, "pitch.bin"),
+        "score": os.path.join(song_folder, "score.json"),
+    }
+
+def read_data(song_folder):
+    data = {}
+    with open(os.path.join(song_folder, "data.txt"), encoding="utf-8") as f:
+        for line in f:
+            if "=" in line:
+                k, v = line.strip().split("=", 1)
+                data[k] = v
+    return data
+
+def write_data(song_folder, data):
+    with open(os.path.join(song_folder, "data.txt"), "w", encoding="utf-8") as f:
+        for k, v in data.items():
+            f.write(f"{k}={v}\n")
+
+def load_audio(path, sr=None, mono=True):
+    with measure("load") as step:
+        audio, file_sr = librosa.load(path, sr=sr, mono=mono)
+        step["audio_seconds"] = audio.shape[-1] / file_sr
+    return audio.astype(np.float32, copy=False), file_sr
+
+# Float samples, so a stage script reading a checkpoint back gets the audio
+# the pipeline computed, not a 16-bit rounding of it
+def save_audio(path, y, sr):
+    sf.write(path, y.T if y.ndim > 1 else y, sr, subtype="FLOAT")
+
+# Separation
+# Runs Demucs, kept loaded in this process, on a (channels, samples) or mono
+# array; returns mono vocals
+def separate_vocals(y, sr):
+    separator = get_separator(demucs_model, segment=demucs_segment, overlap=demucs_overlap,
+                              shifts=demucs_shifts, threads=demucs_threads, repo=demucs_repo)
+    return separator.separate(y, sr)
+
+# Denoising
+# Sample boundaries of the frame_ms frames of silence.frame_dbfs
+def frame_edges(y, sr, frame_ms):
+    return (np.arange(frame_count(y, sr, frame_ms) + 1) * frame_ms * sr / 1000).astype(np.int64)
+
+# Whether each frame_ms frame (as in silence.frame_dbfs) holds voice, from
+# YIN run over the track a block of frames at a time, so memory does not
+# grow with its length. A frame is voiced when the YIN frame centred at
+# either of its edges is.
+def frame_voicing(y, sr, frame_ms, block_frames=1000):
+    hop = max(int(sr * frame_ms / 1000), 1)
+    centres = []
+    for start in range(0, len(y), hop * block_frames):
+        f0, _ = yin_pitch(y[start:start + hop * block_frames], sr, fmin, fmax, pitch_frame_length, hop)
+        centres.append(~np.isnan(f0[:block_frames]))
+    centres = np.concatenate(centres + [[False]])
+    edges = frame_edges(y, sr, frame_ms) // hop
+    return centres[np.minimum(edges[:-1], len(centres) - 1)] | centres[np.minimum(edges[1:], len(centres) - 1)]
+
+# Noise profile for stationary gating: runs of at least three quiet,
+# unvoiced noise_frame_ms frames from anywhere in the track, quietest first,
+# up to noise_seconds in all. Returns (profile, the loudness in dBFS below
+# which an unvoiced frame counts as noise, dBFS of every frame); profile
+# and level are None when the track has too little such audio.
+def noise_profile(y, sr):
+    db = frame_dbfs(y, sr, noise_frame_ms)
+    edges = frame_edges(y, sr, noise_frame_ms)
+    candidates = ~frame_voicing(y, sr, noise_frame_ms) & (db > -80)
+    if candidates.sum() * noise_frame_ms >= 500:
+        level = np.percentile(db[candidates], noise_percentile)
+        quiet = np.concatenate([[0], (candidates & (db <= level)).astype(np.int8), [0]])
+        bounds = np.flatnonzero(np.diff(quiet))
+        runs = [(a, b) for a, b in zip(bounds[::2], bounds[1::2]) if b - a >= 3]
+        runs.sort(key=lambda run: db[run[0]:run[1]].mean())
+        pieces, frames = [], 0
+        for a, b in runs:
+            if frames * noise_frame_ms >= noise_seconds * 1000:
+                break
+            pieces.append(y[edges[a]:edges[b]])
+            frames += b - a
+        if frames * noise_frame_ms >= 500:
+            return np.concatenate(pieces), level, db
+    return None, None, db
+
+# Noise reduction of a float32 buffer in place, one chunk at a time. Each
+# chunk is filtered with denoise_padding samples of its neighbours either
+# side, the way noisereduce chunks internally, but without its copies of
+# the whole signal and its temporary output file: memory stays at the buffer
+# plus one chunk's working set, whatever the length of the recording.
+#
+# In adaptive mode the chunks are gated against a noise profile picked from
+# the whole track (noise_profile) rather than its first seconds, which may
+# hold crowd noise or singing. A chunk with nothing louder than that noise
+# gets no spectral work: it is attenuated by prop_decrease, as gating would.
+# A track without enough noise for a profile is denoised non-stationary, as
+# the lead-in could be anything.
+def reduce_constant_echo(y, sr):
+    import noisereduce as nr  # imports torch: seconds of startup, paid only when denoising
+
+    options, level = {}, None
+    if denoise_mode == "adaptive":
+        profile, level, db = noise_profile(y, sr)
+        if profile is None:
+            log("Too little noise for a noise profile; using non-stationary noise reduction")
+        else:
+            options = {"stationary": True, "y_noise": profile}
+    n = len(y)
+    length = (n if n <= denoise_chunk else denoise_chunk) + 2 * denoise_padding
+    before = y[:0].copy()  # original samples preceding the current chunk
+    skipped = 0
+    for start in range(0, n, denoise_chunk):
+        stop = min(start + denoise_chunk, n)
+        after = min(stop + denoise_padding, n)
+        if level is not None:
+            frames = db[max(start - denoise_padding, 0) * 1000 // (sr * noise_frame_ms):
+                        -(-after * 1000 // (sr * noise_frame_ms))]
+            if len(frames) and frames.max() <= level:
+                before = y[max(stop - denoise_padding, 0):stop].copy()
+                y[start:stop] *= np.float32(1 - prop_decrease)
+                skipped += 1
+                continue
+        chunk = np.zeros(length)
+        chunk[denoise_padding - len(before):denoise_padding] = before
+        chunk[denoise_padding:denoise_padding + after - start] = y[start:after]
+        before = y[max(stop - denoise_padding, 0):stop].copy()
+        filtered = nr.reduce_noise(y=chunk, sr=sr, prop_decrease=prop_decrease, chunk_size=length, padding=0,
+                                   **options)
+        y[start:stop] = filtered[denoise_padding:denoise_padding + stop - start]
+    if skipped:
+        log(f"Skipped {skipped} silent chunks")
+    return y
+
+# Scales y in place to target_dB RMS, summing squares block by block
+def normalize_audio(y, sr, target_dB=target_dB, block=1 << 20):
+    power = sum(np.dot(y[k:k + block].astype(np.float64), y[k:k + block]) for k in range(0, len(y), block))
+    rms = np.sqrt(power / max(len(y), 1))
+    y *= np.float32(10 ** ((target_dB - 20 * np.log10(rms)) / 20))
+    return y
+
+# Returns the denoised, trimmed and normalized vocals and the trimmed
+# lead-in in seconds. All three steps work on one float32 copy of y; the
+# result is a view of it.
+def denoise_vocals(y, sr):
+    y = np.array(y, dtype=np.float32)
+
+    log("Reducing noise...")
+    reduce_constant_echo(y, sr)
+
+    log("Trimming silence...")
+    trimmed, start_ms = trim_silence(y, sr, silence_thresh)
+
+    log("Normalizing audio...")
+    return normalize_audio(trimmed, sr), start_ms / 1000.0
+
+# Features
+# Frame-wise features of audio at sync_sr, hops in samples. Chroma is
+# folded from the CQT magnitude (tuned to the audio, as chroma_cqt does),
+# so both come from one transform.
+def cqt_magnitude(y, hop_length=chroma_hop):
+    C = librosa.cqt(np.asarray(y), sr=sync_sr, hop_length=hop_length, n_bins=cqt_octaves * cqt_bins_per_octave,
+                    bins_per_octave=cqt_bins_per_octave, tuning=None)
+    return np.abs(C).astype(np.float32)
+
+def chroma_from_cqt(C, hop_length=chroma_hop):
+    return librosa.feature.chroma_cqt(C=np.asarray(C), sr=sync_sr, hop_length=hop_length,
+                                      bins_per_octave=cqt_bins_per_octave)
+
+def rms_energy(y, hop_length=pitch_hop):
+    return librosa.feature.rms(y=np.asarray(y), frame_length=4 * hop_length, hop_length=hop_length)[0]
+
+def onset_envelope(y, hop_length=pitch_hop):
+    return librosa.onset.onset_strength(y=np.asarray(y), sr=sync_sr, hop_length=hop_length)
+
+feature_functions = {"cqt": cqt_magnitude, "rms": rms_energy, "onset": onset_envelope}
+
+# Alignment
+def extract_chroma(y):
+    return chroma_from_cqt(cqt_magnitude(y))
+
+def compute_alignment_path(chroma_ref, chroma_target, aligner="exact"):
+    from alignment import adaptive_band, dtw_path, multiscale_path, sakoe_chiba_band
+
+    X, Y = chroma_ref.T, chroma_target.T
+    if aligner == "dtw":
+        from dtw import dtw
+        dist_fn = lambda x, y: np.linalg.norm(x - y, ord=1)
+        _, _, _, path = dtw(X, Y, dist=dist_fn)
+        return path
+    if aligner == "band":
+        return dtw_path(X, Y, sakoe_chiba_band(len(X), len(Y), band_radius))
+    if aligner == "adaptive":
+        return dtw_path(X, Y, adaptive_band(X, Y, adaptive_radius, coarse_factor))
+    if aligner == "multiscale":
+        return multiscale_path(X, Y, multiscale_radius)
+    return dtw_path(X, Y)
+
+# Streaming chroma for the online aligner, computed with a hop matching
+# chroma_hop at sync_sr so every source shares the same frame rate. Each
+# returns (generator of (frames, 12) blocks, hop in seconds).
+def _chroma_blocks(blocks, sr, hop, n_frames):
+    for block in blocks:
+        chroma = librosa.feature.chroma_stft(y=block, sr=sr, n_fft=4 * hop, hop_length=hop, center=False)
+        # The last block is zero-padded to full length
+        yield chroma.T[:n_frames]
+        n_frames -= chroma.shape[1]
+        if n_frames <= 0:
+            break
+
+def file_chroma_blocks(path):
+    native_sr = librosa.get_samplerate(path)
+    hop = int(round(chroma_hop * native_sr / sync_sr))
+    n_frames = 1 + max(sf.info(path).frames - 4 * hop, 0) // hop
+    blocks = librosa.stream(path, block_length=stream_block, frame_length=4 * hop,
+                            hop_length=hop, mono=True, fill_value=0)
+    return _chroma_blocks(blocks, native_sr, hop, n_frames), hop / native_sr
+
+def array_chroma_blocks(y, sr):
+    hop = int(round(chroma_hop * sr / sync_sr))
+    n_frames = 1 + max(len(y) - 4 * hop, 0) // hop
+    padded = np.pad(y, (0, 4 * hop))
+    step = stream_block * hop
+    blocks = (padded[k:k + step + 3 * hop] for k in range(0, n_frames * hop, step))
+    return _chroma_blocks(blocks, sr, hop, n_frames), hop / sr
+
+# Yields (studio times, live times) chunks of the time map as live chroma
+# blocks arrive, aligned against the whole studio chroma. Times are frame
+# centres (frame k spans 4 hops).
+def online_time_map(studio_blocks, live_blocks):
+    from alignment import online_path
+
+    (studio_chroma, studio_hop_s), (live_chroma, live_hop_s) = studio_blocks, live_blocks
+    reference = np.vstack(list(studio_chroma))
+    for path_ref, path_target in online_path(reference, live_chroma, online_radius, online_lag):
+        yield (path_ref + 2) * studio_hop_s, (path_target + 2) * live_hop_s
+
+# Time map chunks for vocals at sync_sr. Either chroma can be passed in
+# precomputed (from a FeatureStore); the online aligner ignores them.
+def align_vocals(studio, live, aligner="exact", chroma_studio=None, chroma_live=None):
+    if aligner == "online":
+        return online_time_map(array_chroma_blocks(studio, sync_sr), array_chroma_blocks(live, sync_sr))
+
+    if chroma_studio is None or chroma_live is None:
+        log("Extracting chroma features...")
+    if chroma_studio is None:
+        chroma_studio = extract_chroma(studio)
+    if chroma_live is None:
+        chroma_live = extract_chroma(live)
+
+    log(f"Computing DTW alignment path ({aligner})...")
+    with measure("dtw", len(live) / sync_sr):
+        path_studio, path_live = compute_alignment_path(chroma_studio, chroma_live, aligner)
+    return [(np.array(path_studio) * chroma_hop / sync_sr, np.array(path_live) * chroma_hop / sync_sr)]
+
+# Pitch
+# Returns f0 and voiced probability per pitch_hop frame for vocals at sr
+def pitch_contour(y, sr, backend="pyin"):
+    return extract_pitch(y, sr, backend, fmin, fmax, pitch_frame_length, pitch_hop)
+
+# Studio f0 and voiced probability on the live timeline: each live frame
+# takes the studio frame the time map (studio times, live times) assigns to it
+def warp_pitch(f0, voiced_prob, studio_times, live_times, n_frames, sr=sync_sr):
+    time_map = TimeMap()
+    time_map.extend(np.asarray(studio_times, dtype=np.float64), np.asarray(live_times, dtype=np.float64))
+    time_map.close()
+    times = librosa.frames_to_time(np.arange(n_frames), sr=sr, hop_length=pitch_hop)
+    frames = np.clip(np.rint(time_map(times) * sr / pitch_hop).astype(int), 0, len(f0) - 1)
+    return np.asarray(f0)[frames], np.asarray(voiced_prob)[frames]
+
+# The studio contour (f0, voiced_prob) of the reference on the live frame
+# grid, up to the last live time of the alignment path
+def studio_on_live(studio, path_studio, path_live):
+    n_frames = 1 + int(path_live[-1] * sync_sr) // pitch_hop
+    return warp_pitch(studio[0], studio[1], path_studio, path_live, n_frames)
+
+# The alignment path (studio times, live times) sync-vocals.py found, kept
+# for pitch-extraction.py
+def save_time_map(song_folder, path_studio, path_live):
+    np.save(song_files(song_folder)["time_map"], np.stack([path_studio, path_live]))
+
+def read_time_map(song_folder):
+    path_studio, path_live = np.load(song_files(song_folder)["time_map"])
+    return path_studio, path_live
+
+# live and studio are (f0, voiced_prob) on the live frame grid; start is
+# where the denoised live vocals begin in the live audio. Pitch files of the
+# older four-file layout are replaced, and the performance is scored
+# (scoring.py).
+def save_pitch(song_folder, live, studio, start, sr=sync_sr):
+    write_pitch(song_files(song_folder)["pitch"], {"live": live, "studio": studio}, sr, pitch_hop, start)
+    for name in legacy_names:
+        if os.path.exists(os.path.join(song_folder, name)):
+            os.remove(os.path.join(song_folder, name))
+    write_score(song_folder)
+
+# Runner
+# fn(*args) with progress messages and events, measured (metrics.py) over
+# audio_seconds of audio when given
+def timed(name, fn, *args, audio_seconds=None):
+    log(f"Starting {name}...")
+    emit("stage_start", stage=name)
+    start_time = time.time()
+    with measure(name, audio_seconds):
+        result = fn(*args)
+    seconds = time.time() - start_time
+    log(f"Finished {name} in {seconds:.1f}s")
+    emit("stage_done", stage=name, seconds=round(seconds, 3))
+    return result
+
+# One pipeline step. Its key is a hash of the step, its version, params and
+# the keys of its inputs (other stages, or callables returning the content
+# hash of a raw file), so keys are known without running anything. result()
+# loads the tuple from the first store holding it, or computes it from the
+# input stages' results and saves it to the first store. Stages can be run
+# from several threads; each computes at most once.
+class Stage:
+    def __init__(self, stores, name, step, params, inputs, compute):
+        self.stores = stores
+        self.name = name
+        self.step = step
+        self.params = params
+        self.inputs = inputs
+        self.compute = compute
+        self._key = None
+        self._result = None
+        self._lock = threading.Lock()
+        self.seconds = None  # compute time, when computed rather than loaded
+        self.audio_seconds = None  # length of the audio it works through, for metrics
+
+    @property
+    def key(self):
+        if self._key is None:
+            inputs = [i.key if isinstance(i, Stage) else i() for i in self.inputs]
+            self._key = stage_key(self.step, stage_versions[self.step], self.params, inputs)
+        return self._key
+
+    @property
+    def done(self):
+        return self._result is not None
+
+    @property
+    def cached(self):
+        return any(store.contains(self.key) for store in self.stores)
+
+    @property
+    def input_stages(self):
+        return [i for i in self.inputs if isinstance(i, Stage)]
+
+    def result(self):
+        with self._lock:
+            if self._result is None:
+                self._result = self._load_or_compute()
+        return self._result
+
+    def _load_or_compute(self):
+        for store in self.stores:
+            result = store.load(self.key)
+            if result is not None:
+                log(f"Reusing cached {self.name}")
+                emit("stage_cached", stage=self.name)
+                return result
+        args = [i.result() for i in self.input_stages]
+        start_time = time.time()
+        result = timed(self.name, self.compute, *args, audio_seconds=self.audio_seconds)
+        self.seconds = time.time() - start_time
+        result = result if isinstance(result, tuple) else (result,)
+        if self.stores:
+            self.stores[0].store(self.key, result)
+        return result
+
+# Stage results are cached next to the song folders (files/.cache)
+def cache_folder(song_folder):
+    return os.path.join(os.path.dirname(os.path.abspath(song_folder)), ".cache")
+
+# Features shared by the stages that need them. Each track is a stage
+# producing its audio at sync_sr, so it is decoded and resampled once; a
+# feature of it is a stage too, made on first request and stored with the
+# track's audio, so it is computed once and then opened as a memory map by
+# every later request, in this run or the next.
+class FeatureStore:
+    def __init__(self, tracks):
+        self.tracks = dict(tracks)
+        self._stages = {}
+        self._lock = threading.RLock()
+
+    def audio(self, track):
+        return self.tracks[track].result()[0]
+
+    def feature(self, track, feature, hop_length=None):
+        return self.stage(track, feature, hop_length).result()[0]
+
+    def stage(self, track, feature, hop_length=None):
+        hop_length = hop_length or feature_hops[feature]
+        with self._lock:
+            if (track, feature, hop_length) not in self._stages:
+                self._stages[track, feature, hop_length] = self._make_stage(track, feature, hop_length)
+            return self._stages[track, feature, hop_length]
+
+    def _make_stage(self, track, feature, hop_length):
+        audio = self.tracks[track]
+        name = f"{track} {feature} extraction"
+        if hop_length != feature_hops[feature]:
+            name += f" (hop {hop_length})"
+        params = {"sr": sync_sr, "hop_length": hop_length}
+        if feature == "chroma":
+            stage = Stage(audio.stores, name, "chroma", params, [self.stage(track, "cqt", hop_length)],
+                          lambda C: chroma_from_cqt(C[0], hop_length))
+            stage.audio_seconds = audio.audio_seconds
+            return stage
+        if feature == "cqt":
+            params.update(bins_per_octave=cqt_bins_per_octave, octaves=cqt_octaves)
+        stage = Stage(audio.stores, name, feature, params, [audio],
+                      lambda y: feature_functions[feature](y[0], hop_length))
+        stage.audio_seconds = audio.audio_seconds
+        return stage
+
+# A track decoded from an audio file at sync_sr, keyed by the file's content
+def decoded_audio(stores, name, path):
+    stage = Stage(stores, f"{name} decoding", "resample", {"sr": sync_sr}, [lambda: file_key(path)],
+                  lambda: load_audio(path, sr=sync_sr)[0])
+    stage.audio_seconds = audio_minutes(path) * 60
+    return stage
+
+# The song's studio reference: the one named in data.txt, or for older
+# folders one keyed by the content of raw/studio_audio.wav, recorded in
+# data.txt for next time
+def song_reference(song_folder):
+    data = read_data(song_folder)
+    base_folder = os.path.dirname(os.path.abspath(song_folder))
+    if "studio_ref" in data:
+        return StudioReference(base_folder, data["studio_ref"])
+
+    audio_path = song_files(song_folder)["studio_audio"]
+    audio_key = file_key(audio_path)
+    reference = StudioReference(base_folder, content_reference_id(audio_key))
+    if "audio_key" not in reference.info:
+        os.makedirs(reference.folder, exist_ok=True)
+        reference.info["audio_path"] = os.path.abspath(audio_path)
+        reference.info["audio_key"] = audio_key
+        reference.save_info()
+    data["studio_ref"] = reference.id
+    write_data(song_folder, data)
+    return reference
+
+def vocals_stages(stores, name, audio_path, audio_key):
+    vocals = Stage(stores, f"{name} separation", "separate",
+                   {"model": demucs_model, "segment": demucs_segment, "overlap": demucs_overlap,
+                    "shifts": demucs_shifts}, [audio_key],
+                   lambda: separate_vocals(*load_audio(audio_path, mono=False)))
+    denoised = Stage(stores, f"{name} denoising", "denoise",
+                     {"mode": denoise_mode, "noise_seconds": noise_seconds, "noise_frame_ms": noise_frame_ms,
+                      "noise_percentile": noise_percentile, "chunk": denoise_chunk,
+                      "padding": denoise_padding, "prop_decrease": prop_decrease,
+                      "silence_thresh": silence_thresh, "target_dB": target_dB},
+                     [vocals], lambda v: (*denoise_vocals(np.asarray(v[0]), v[1]), v[1]))
+    # Sync and pitch extraction share one resampled copy
+    resampled = Stage(stores, f"{name} resampling", "resample", {"sr": sync_sr}, [denoised],
+                      lambda d: librosa.resample(np.asarray(d[0]), orig_sr=d[2], target_sr=sync_sr))
+    return vocals, denoised, resampled
+
+# Builds the stage graph for a song folder. Studio stages that do not depend
+# on the live performance are stored in the studio reference, the rest in
+# the stage cache; without use_cache nothing is read or stored. With a
+# process pool, pyin (which holds the GIL) runs in it.
+def song_stages(song_folder, aligner="exact", warp_mode="interp", backend="pyin", use_cache=True,
+                processes=None):
+    files = song_files(song_folder)
+    reference = song_reference(song_folder)
+    studio_stores = [reference.arrays] if use_cache else []
+    live_stores = [StageCache(cache_folder(song_folder))] if use_cache else []
+
+    stages = {}
+    stages["live_vocals"], stages["live_denoised"], stages["live_sync"] = vocals_stages(
+        live_stores, "live", files["live_audio"], lambda: file_key(files["live_audio"]))
+    stages["studio_vocals"], stages["studio_denoised"], stages["studio_sync"] = vocals_stages(
+        studio_stores, "studio", reference.audio_path(), reference.audio_key)
+    for name, path in (("live", files["live_audio"]), ("studio", reference.audio_path())):
+        seconds = audio_minutes(path) * 60
+        for stage in ("vocals", "denoised", "sync"):
+            stages[f"{name}_{stage}"].audio_seconds = seconds
+
+    features = FeatureStore({"live": stages["live_sync"], "studio": stages["studio_sync"]})
+    stages["studio_chroma"] = features.stage("studio", "chroma")
+    stages["live_chroma"] = features.stage("live", "chroma")
+
+    def align(studio, live, *chroma):
+        chroma = [c[0] for c in chroma] or [None, None]
+        chunks = list(align_vocals(studio[0], live[0], aligner, *chroma))
+        return tuple(np.concatenate([chunk[side] for chunk in chunks]) for side in (0, 1))
+    align_inputs = [stages["studio_sync"], stages["live_sync"]]
+    if aligner != "online":
+        align_inputs += [stages["studio_chroma"], stages["live_chroma"]]
+    stages["align"] = Stage(live_stores, "alignment", "align",
+                            {"sr": sync_sr, "chroma_hop": chroma_hop, "aligner": aligner,
+                             "band_radius": band_radius, "adaptive_radius": adaptive_radius,
+                             "coarse_factor": coarse_factor, "multiscale_radius": multiscale_radius,
+                             "online_radius": online_radius, "online_lag": online_lag},
+                            align_inputs, align)
+
+    def warp(studio, path):
+        log(f"Warping studio audio to sync with live performance ({warp_mode})...")
+        return warp_audio(studio[0], sync_sr, [path], warp_mode, warp_block)
+    stages["studio_warped"] = Stage(live_stores, "warping", "warp",
+                                    {"sr": sync_sr, "mode": warp_mode, "block": warp_block},
+                                    [stages["studio_sync"], stages["align"]], warp)
+
+    pitch_params = {"backend": backend, "sr": sync_sr, "hop_length": pitch_hop,
+                    "fmin": fmin, "fmax": fmax, "frame_length": pitch_frame_length}
+    def pitch(y):
+        if processes is not None and backend == "pyin":
+            return processes.submit(pitch_contour, np.asarray(y[0]), sync_sr, backend).result()
+        return pitch_contour(y[0], sync_sr, backend)
+    stages["live_pitch"] = Stage(live_stores, "live pitch extraction", "pitch", pitch_params,
+                                 [stages["live_sync"]], pitch)
+    stages["studio_pitch"] = Stage(studio_stores, "studio pitch extraction", "pitch", pitch_params,
+                                   [stages["studio_sync"]], pitch)
+    for name in ("align", "studio_warped", "live_pitch"):
+        stages[name].audio_seconds = stages["live_sync"].audio_seconds
+    stages["studio_pitch"].audio_seconds = stages["studio_sync"].audio_seconds
+    return stages
+
+# Features for the stage scripts, which work from the song folder's files:
+# "studio" from the studio reference, "live" decoded from the denoised live
+# vocals and "warped" from the warped studio vocals
+def song_features(song_folder, use_cache=True):
+    files = song_files(song_folder)
+    stages = song_stages(song_folder, use_cache=use_cache)
+    live_stores = [StageCache(cache_folder(song_folder))] if use_cache else []
+    return FeatureStore({"studio": stages["studio_sync"],
+                         "live": decoded_audio(live_stores, "live", files["live_denoised"]),
+                         "warped": decoded_audio(live_stores, "warped studio", files["studio_warped"])})
+
+def _separate_with_threads(stage, threads):
+    set_threads(threads)
+    return stage.result()
+
+def audio_minutes(path):
+    return sf.info(path).duration / 60 if os.path.exists(path) else 0.0
+
+# Scheduler tasks that bring the targets up to date: every stage a target
+# needs, stopping at stages already in a store, in dependency order. Each
+# task's memory comes from stage_memory and the length of its branch's
+# audio; separations share the CPU budget (unless demucs_threads is set)
+# and set torch's thread count to their share.
+def stage_tasks(targets, minutes, aligner, cpu_budget):
+    needed = []
+    def need(stage):
+        if stage in needed:
+            return
+        if not stage.cached:
+            for i in stage.input_stages:
+                need(i)
+        needed.append(stage)
+    for stage in targets:
+        need(stage)
+
+    separations = [s for s in needed if s.step == "separate" and not s.cached]
+    tasks = []
+    for stage in needed:
+        if stage.cached:
+            tasks.append(Task(stage.name, stage.result, cpu=0))
+            continue
+        branch = minutes.get(stage.name.split()[0], max(minutes.values()))
+        base_mb, per_minute_mb = stage_memory[stage.step]
+        memory_mb = base_mb + per_minute_mb * branch
+        if stage.step == "align" and aligner in ("exact", "dtw"):
+            frames = [m * 60 * sync_sr / chroma_hop for m in minutes.values()]
+            memory_mb = 16 * frames[0] * frames[1] / 1e6
+        fn, cpu = stage.result, 1
+        if stage.step == "separate":
+            cpu = demucs_threads or max(1, cpu_budget // len(separations))
+            fn = functools.partial(_separate_with_threads, stage, cpu)
+        tasks.append(Task(stage.name, fn, [i.name for i in stage.input_stages if i in needed],
+                          cpu, int(memory_mb * 1e6)))
+    return tasks
+
+# Runs separation through pitch extraction for a downloaded song folder.
+# Only the pitch files and data.txt are always written; with checkpoints the
+# intermediate WAVs the stage scripts produce are saved as well. A stage
+# whose inputs, parameters and version are unchanged is not rerun, and the
+# studio side is computed once per studio reference, so a new live
+# performance of a known studio track only costs the live-side work. The
+# live and studio branches run concurrently within the scheduler's budget
+# until they join at alignment. Returns {stage name: seconds} for the
+# stages that were computed.
+def run_pipeline(song_folder, checkpoints=True, aligner="exact", warp_mode="interp", backend="pyin",
+                 use_cache=True, scheduler=None):
+    files = song_files(song_folder)
+    own_scheduler = scheduler is None
+    scheduler = scheduler or Scheduler()
+    stages = song_stages(song_folder, aligner, warp_mode, backend, use_cache, scheduler.processes)
+
+    targets = ["live_pitch", "studio_pitch", "align", "live_denoised", "studio_denoised"]
+    if checkpoints:
+        targets.append("studio_warped")
+    minutes = {"live": audio_minutes(files["live_audio"]),
+               "studio": audio_minutes(song_reference(song_folder).audio_path())}
+    tasks = stage_tasks([stages[name] for name in targets], minutes, aligner, scheduler.cpu_budget)
+    emit("plan", stages=[task.name for task in tasks])
+    try:
+        scheduler.run(tasks)
+    finally:
+        if own_scheduler:
+            scheduler.shutdown()
+
+    live_f0, live_prob = stages["live_pitch"].result()
+    path_studio, path_live = stages["align"].result()
+    studio_pitch = studio_on_live(stages["studio_pitch"].result(), path_studio, path_live)
+    live_start = stages["live_denoised"].result()[1]
+    save_pitch(song_folder, (live_f0, live_prob), studio_pitch, live_start)
+
+    data = read_data(song_folder)
+    data["studio_start"] = f"{stages['studio_denoised'].result()[1]:.3f}"
+    data["live_start"] = f"{live_start:.3f}"
+    write_data(song_folder, data)
+
+    # Checkpoints of what this run computed or loaded. The warped studio
+    # vocals are no longer needed for pitch and are rendered only here.
+    if checkpoints:
+        for name in ("live_vocals", "studio_vocals", "live_denoised", "studio_denoised"):
+            if stages[name].done:
+                result = stages[name].result()
+                save_audio(files[name], np.asarray(result[0]), result[-1])
+        save_audio(files["studio_warped"], stages["studio_warped"].result()[0], sync_sr)
+        save_time_map(song_folder, path_studio, path_live)
+
+    return {stage.name: stage.seconds for stage in stages.values() if stage.seconds is not None}
@@ -1,63 +1,55 @@
 import os
 import sys
-import librosa
 import numpy as np
+from metrics import measure, recording
+from pipeline import (pitch_contour, read_data, read_time_map, save_pitch, song_features, song_files, song_stages,
+                      studio_on_live, sync_sr)
+from pitch import backends
+from scheduler import Scheduler, Task
 
 # Path Setup
-if len(sys.argv) != 2:
-    print("Usage: python pitch-extraction.py <song_folder>")
+if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] not in backends):
+    print(f"Usage: python pitch-extraction.py <song_folder> [{'|'.join(backends)}]")
     sys.exit(1)
 
 song_folder = sys.argv[1]
-raw_folder = os.path.join(song_folder, "raw")
+files = song_files(song_folder)
+backend = sys.argv[2] if len(sys.argv) == 3 else "pyin"
 
-data = {}
-with open(os.path.join(song_folder, "data.txt"), encoding="utf-8") as f:
-    for line in f:
-        if "=" in line:
-            k, v = line.strip().split("=", 1)
-            data[k] = v
-
-# Audio Settings
-sr = 22050
-hop_length = 256
-
-# Input Files
-live_vocals = os.path.join(raw_folder, "live_vocals_denoised.wav")
-studio_vocals = os.path.join(song_folder, "studio_vocals_warped.wav")
-
-# Output Files
-live_pitch_file = os.path.join(song_folder, "live_pitch.npy")
-studio_pitch_file = os.path.join(song_folder, "studio_pitch.npy")
-live_time_file = os.path.join(song_folder, "live_pitch_times.npy")
-studio_time_file = os.path.join(song_folder, "studio_pitch_times.npy")
-
-def extract_pitch(y, sr, fmin=80, fmax=1000):
-    f0, _, _ = librosa.pyin(
-        y=y,
-        sr=sr,
-        fmin=fmin,
-        fmax=fmax,
-        frame_length=1024,
-        hop_length=hop_length
-    )
-    return f0
+if not os.path.exists(files["time_map"]):
+    print(f"Error: File not found -> {files['time_map']} (run sync-vocals.py first)")
+    sys.exit(1)
 
+# Live and studio run side by side; pyin holds the GIL, so it runs in the
+# scheduler's process pool. The live audio comes from the feature store, so
+# the live vocals sync-vocals.py already decoded are not decoded again. The
+# studio pitch is the studio reference's, computed once per reference, and
+# is mapped onto the live timeline with sync-vocals.py's time map, as
+# process-vocals.py does, rather than taken from the warped studio vocals.
 def save_pitch_data():
-    print("Extracting pitch from live vocals...", flush=True)
-    live_y, live_sr = librosa.load(live_vocals, sr=sr)
-    live_pitch = extract_pitch(live_y, live_sr)
-    live_times = librosa.frames_to_time(np.arange(len(live_pitch)), sr=live_sr, hop_length=hop_length)
-    np.save(live_pitch_file, live_pitch)
-    np.save(live_time_file, live_times)
-
-    print("Extracting pitch from studio vocals...", flush=True)
-    studio_y, studio_sr = librosa.load(studio_vocals, sr=sr)
-    studio_pitch = extract_pitch(studio_y, studio_sr)
-    studio_times = librosa.frames_to_time(np.arange(len(studio_pitch)), sr=studio_sr, hop_length=hop_length)
-    np.save(studio_pitch_file, studio_pitch)
-    np.save(studio_time_file, studio_times)
-
-    print(f"Saved pitch data to:\n  {live_pitch_file}\n  {studio_pitch_file}", flush=True)
-
-save_pitch_data()
+    scheduler = Scheduler()
+    features = song_features(song_folder)
+    studio_pitch = song_stages(song_folder, backend=backend, processes=scheduler.processes)["studio_pitch"]
+
+    def extract(name, track):
+        print(f"Extracting pitch from {name} vocals ({backend})...", flush=True)
+        y = np.asarray(features.audio(track))
+        with measure(f"{name} pitch extraction", len(y) / sync_sr):
+            if backend == "pyin":
+                return scheduler.processes.submit(pitch_contour, y, sync_sr, backend).result()
+            return pitch_contour(y, sync_sr, backend)
+
+    try:
+        contours = scheduler.run([Task("live", lambda: extract("live", "live")),
+                                  Task("studio", studio_pitch.result)])
+    finally:
+        scheduler.shutdown()
+    studio = studio_on_live(contours["studio"], *read_time_map(song_folder))
+    live_start = float(read_data(song_folder).get("live_start", 0.0))
+    save_pitch(song_folder, contours["live"], studio, live_start)
+    print(f"Saved pitch data to: {files['pitch']}", flush=True)
+
+# Guarded so process-pool workers can re-import this script
+if __name__ == "__main__":
+    with recording("pitch-extraction", song_folder):
+        save_pitch_data()
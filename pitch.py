@@ -0,0 +1,125 @@
+import os
+import numpy as np
+import librosa
+from concurrent.futures import ProcessPoolExecutor
+from silence import frame_dbfs
+
+# Pitch backends. All of them return one f0 value per hop (NaN when unvoiced)
+# and the probability that the frame is voiced, on the frame grid of
+# librosa.pyin with center=True, i.e. 1 + len(y) // hop_length frames at
+# times k * hop_length / sr.
+backends = ["pyin", "yin", "pyin-parallel"]
+
+def pyin_pitch(y, sr, fmin=80, fmax=1000, frame_length=1024, hop_length=256):
+    f0, _, voiced_prob = librosa.pyin(
+        y=y,
+        sr=sr,
+        fmin=fmin,
+        fmax=fmax,
+        frame_length=frame_length,
+        hop_length=hop_length
+    )
+    return f0, voiced_prob
+
+# Vectorized YIN: the difference function of every frame in a block is
+# computed at once from FFT autocorrelations, then the first trough of the
+# cumulative mean normalized difference below `threshold` gives the period.
+# Frames without such a trough, or quieter than silence_thresh dBFS, are
+# unvoiced; the voiced probability is 1 minus the trough's depth. Frames are
+# taken yin_block at a time, so the FFT working set stays the same however
+# long the recording.
+yin_block = 4096
+
+def yin_pitch(y, sr, fmin=80, fmax=1000, frame_length=1024, hop_length=256,
+              threshold=0.15, silence_thresh=-50):
+    padded = np.pad(y.astype(np.float32), frame_length // 2)
+    frames = librosa.util.frame(padded, frame_length=frame_length, hop_length=hop_length).T
+    frames = frames[:1 + len(y) // hop_length]
+    f0 = np.full(len(frames), np.nan)
+    voiced_prob = np.zeros(len(frames))
+    for lo in range(0, len(frames), yin_block):
+        f0[lo:lo + yin_block], voiced_prob[lo:lo + yin_block] = _yin_frames(
+            frames[lo:lo + yin_block], sr, fmin, fmax, threshold, silence_thresh)
+    return f0, voiced_prob
+
+def _yin_frames(frames, sr, fmin, fmax, threshold, silence_thresh):
+    frame_length = frames.shape[1]
+    min_period = max(int(np.floor(sr / fmax)), 2)
+    max_period = min(int(np.ceil(sr / fmin)), frame_length - 1)
+    window = frame_length - max_period
+
+    # d(tau) = sum_t (x[t] - x[t + tau])^2 over the first `window` samples
+    n_fft = 2 * frame_length
+    spectrum = np.fft.rfft(frames, n_fft, axis=1)
+    head = np.fft.rfft(frames[:, :window], n_fft, axis=1)
+    acf = np.fft.irfft(np.conj(head) * spectrum, n_fft, axis=1)[:, :max_period + 1]
+    energy = np.cumsum(np.square(frames, dtype=np.float64), axis=1)
+    energy = np.concatenate([np.zeros((len(frames), 1)), energy], axis=1)
+    lagged_energy = energy[:, window:window + max_period + 1] - energy[:, :max_period + 1]
+    difference = np.maximum(energy[:, window:window + 1] + lagged_energy - 2 * acf, 0)
+
+    cumulative_mean = np.cumsum(difference[:, 1:], axis=1) / np.arange(1, max_period + 1)
+    cmnd = difference[:, 1:] / np.maximum(cumulative_mean, np.finfo(np.float64).tiny)
+    cmnd = cmnd[:, min_period - 2:]  # column k is tau = min_period - 1 + k
+
+    is_trough = (cmnd[:, 1:-1] < cmnd[:, :-2]) & (cmnd[:, 1:-1] <= cmnd[:, 2:])
+    candidates = is_trough & (cmnd[:, 1:-1] < threshold)
+    voiced = candidates.any(axis=1)
+    k = np.argmax(candidates, axis=1) + 1
+
+    rows = np.arange(len(frames))
+    left, centre, right = cmnd[rows, k - 1], cmnd[rows, k], cmnd[rows, k + 1]
+    curvature = left - 2 * centre + right
+    shift = np.divide(left - right, 2 * curvature, out=np.zeros_like(curvature), where=curvature > 0)
+    period = min_period - 1 + k + np.clip(shift, -1, 1)
+
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    with np.errstate(divide="ignore"):
+        voiced &= 20 * np.log10(rms) > silence_thresh
+
+    return np.where(voiced, sr / period, np.nan), np.where(voiced, np.clip(1 - centre, 0, 1), 0)
+
+# Sample ranges, on hop boundaries, separated at the middle of silent runs of
+# at least min_silence seconds, each at least min_chunk seconds long
+def silent_split_points(y, sr, hop_length, min_chunk=30.0, min_silence=0.3, silence_thresh=-50, frame_ms=10):
+    silent = frame_dbfs(y, sr, frame_ms) <= silence_thresh
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], silent.astype(np.int8), [0]])))
+    starts, stops = edges[::2], edges[1::2]
+    long_runs = (stops - starts) * frame_ms / 1000 >= min_silence
+    middles = (starts[long_runs] + stops[long_runs]) // 2 * frame_ms * sr // 1000
+
+    cuts = [0]
+    for cut in middles // hop_length * hop_length:
+        if cut - cuts[-1] >= min_chunk * sr and len(y) - cut >= min_chunk * sr:
+            cuts.append(int(cut))
+    return list(zip(cuts, cuts[1:] + [len(y)]))
+
+def _pyin_chunk(args):
+    return pyin_pitch(*args)
+
+# pyin on chunks cut at silences, run across a process pool. Chunks start on
+# hop boundaries, so chunk frame k is global frame start // hop_length + k;
+# each chunk's last frame is the next chunk's first and is dropped.
+def parallel_pyin_pitch(y, sr, fmin=80, fmax=1000, frame_length=1024, hop_length=256,
+                        workers=None, min_chunk=30.0):
+    chunks = silent_split_points(y, sr, hop_length, min_chunk)
+    if len(chunks) == 1:
+        return pyin_pitch(y, sr, fmin, fmax, frame_length, hop_length)
+
+    jobs = [(y[start:stop], sr, fmin, fmax, frame_length, hop_length) for start, stop in chunks]
+    f0 = np.full(1 + len(y) // hop_length, np.nan)
+    voiced_prob = np.zeros(len(f0))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for (start, stop), (chunk_f0, chunk_prob) in zip(chunks, pool.map(_pyin_chunk, jobs)):
+            first = start // hop_length
+            n = len(chunk_f0) if stop == len(y) else (stop - start) // hop_length
+            f0[first:first + n] = chunk_f0[:n]
+            voiced_prob[first:first + n] = chunk_prob[:n]
+    return f0, voiced_prob
+
+def extract_pitch(y, sr, backend="pyin", fmin=80, fmax=1000, frame_length=1024, hop_length=256):
+    if backend == "yin":
+        return yin_pitch(y, sr, fmin, fmax, frame_length, hop_length)
+    if backend == "pyin-parallel":
+        return parallel_pyin_pitch(y, sr, fmin, fmax, frame_length, hop_length)
+    return pyin_pitch(y, sr, fmin, fmax, frame_length, hop_length)
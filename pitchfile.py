@@ -0,0 +1,127 @@
+import json
+import os
+import numpy as np
+
+# Compact pitch file. One file per song folder holds the live contour and
+# the studio contour mapped onto the live timeline, frame by frame:
+#   cents   int16, whole cents above 1 Hz (1 cent = 0.06%), 0 when unvoiced
+#   voiced  uint8, 1 when voiced
+#   prob    uint8, voiced probability * 255
+# Frame times are not stored: frame k is at k * hop_length / sr seconds into
+# the denoised live vocals, which begin `start` seconds into the live audio.
+#
+# Layout: magic, uint32 header length, JSON header (padded so the frames
+# start on a 64-byte boundary), then the frames as packed records, so the
+# file is opened with a read-only memory map and nothing is decoded until a
+# window of it is asked for. Legacy folders with the four .npy files
+# (live_pitch, studio_pitch and their times) are read through the same
+# interface.
+
+magic = b"VCPITCH\x01"
+tracks = ("live", "studio")
+reference_hz = 1.0
+frame_dtype = np.dtype([(f"{track}_{field}", dtype) for track in tracks
+                        for field, dtype in (("cents", "<i2"), ("voiced", "u1"), ("prob", "u1"))])
+
+legacy_names = ("live_pitch.npy", "studio_pitch.npy", "live_pitch_times.npy", "studio_pitch_times.npy")
+
+def encode(contours):
+    n_frames = max(len(f0) for f0, _ in contours.values())
+    frames = np.zeros(n_frames, dtype=frame_dtype)
+    for track, (f0, voiced_prob) in contours.items():
+        f0 = np.asarray(f0, dtype=np.float64)
+        voiced = np.isfinite(f0) & (f0 > 0)
+        cents = np.zeros(len(f0))
+        cents[voiced] = 1200 * np.log2(f0[voiced] / reference_hz)
+        frames[f"{track}_cents"][:len(f0)] = np.clip(np.rint(cents), 0, np.iinfo(np.int16).max)
+        frames[f"{track}_voiced"][:len(f0)] = voiced
+        if voiced_prob is None:
+            voiced_prob = voiced
+        frames[f"{track}_prob"][:len(f0)] = np.rint(np.clip(np.nan_to_num(voiced_prob), 0, 1) * 255)
+    return frames
+
+# contours: {"live": (f0, voiced_prob), "studio": (f0, voiced_prob)}, f0 in
+# Hz with NaN when unvoiced, voiced_prob in [0, 1] or None. A shorter track
+# is padded with unvoiced frames.
+def write_pitch(path, contours, sr, hop_length, start=0.0):
+    frames = encode(contours)
+    header = {"format": 1, "sr": sr, "hop_length": hop_length, "start": float(start),
+              "frames": len(frames), "reference_hz": reference_hz, "dtype": frame_dtype.descr}
+    header = json.dumps(header).encode("utf-8")
+    header += b" " * (-(len(magic) + 4 + len(header)) % 64)
+    with open(path + ".partial", "wb") as f:
+        f.write(magic)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        f.write(frames.tobytes())
+    os.replace(path + ".partial", path)
+
+class PitchData:
+    def __init__(self, frames, frame_period, start=0.0, sr=None, hop_length=None):
+        self.frames = frames
+        self.frame_period = frame_period
+        self.start = start
+        self.sr = sr
+        self.hop_length = hop_length
+
+    def __len__(self):
+        return len(self.frames)
+
+    # Frame index of a time in seconds (on the denoised live timeline)
+    def frame_at(self, seconds):
+        return int(min(max(np.floor(seconds / self.frame_period), 0), len(self)))
+
+    def times(self, lo=0, hi=None):
+        hi = len(self) if hi is None else hi
+        return np.arange(lo, hi) * self.frame_period
+
+    # Pitch in Hz of frames lo:hi, NaN where unvoiced
+    def pitch(self, track, lo=0, hi=None):
+        frames = self.frames[lo:hi]
+        hz = (reference_hz * 2 ** (frames[f"{track}_cents"] / 1200)).astype(np.float32)
+        hz[frames[f"{track}_voiced"] == 0] = np.nan
+        return hz
+
+    def cents(self, track, lo=0, hi=None):
+        return self.frames[f"{track}_cents"][lo:hi]
+
+    def voiced(self, track, lo=0, hi=None):
+        return self.frames[f"{track}_voiced"][lo:hi].astype(bool)
+
+    def voiced_prob(self, track, lo=0, hi=None):
+        return self.frames[f"{track}_prob"][lo:hi] / np.float32(255)
+
+def open_pitch(path):
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not a pitch file")
+        header_length = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    offset = len(magic) + 4 + header_length
+    if header["frames"]:
+        frames = np.memmap(path, dtype=frame_dtype, mode="r", offset=offset, shape=(header["frames"],))
+    else:
+        frames = np.zeros(0, dtype=frame_dtype)
+    return PitchData(frames, header["hop_length"] / header["sr"], header["start"], header["sr"],
+                     header["hop_length"])
+
+def has_legacy_pitch(folder):
+    return all(os.path.exists(os.path.join(folder, name)) for name in legacy_names)
+
+# The four-file layout, loaded and encoded in memory. Its times are a
+# uniform frame grid, so only their spacing is kept.
+def read_legacy_pitch(folder, start=0.0):
+    live_pitch, studio_pitch, live_times, studio_times = (np.load(os.path.join(folder, name))
+                                                          for name in legacy_names)
+    times = live_times if len(live_times) >= len(studio_times) else studio_times
+    frame_period = float(times[1] - times[0]) if len(times) > 1 else 1.0
+    return PitchData(encode({"live": (live_pitch, None), "studio": (studio_pitch, None)}), frame_period, start)
+
+# The pitch of a song folder: its pitch file, else the legacy files (whose
+# start offset lives in data.txt and is passed in), else None
+def read_pitch(path, legacy_start=0.0):
+    if os.path.exists(path):
+        return open_pitch(path)
+    if has_legacy_pitch(os.path.dirname(path)):
+        return read_legacy_pitch(os.path.dirname(path), legacy_start)
+    return None
@@ -0,0 +1,44 @@
+import sys
+from acquisition import prepare_video_in_background
+from metrics import recording
+from pipeline import run_pipeline
+from progress import join_job_group
+from scheduler import Scheduler
+
+# Runs extract, denoise, sync and pitch extraction in a single process. The
+# live video is made playable in the background meanwhile (ffmpeg on one
+# thread, outside the scheduler's budget; usually only a stream copy or
+# nothing at all), next to the original for the GUI to swap in.
+usage = "Usage: python process-vocals.py <song_folder> [--no-checkpoints] [--no-cache] [--cpus N] [--memory-gb N]"
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(usage)
+        sys.exit(1)
+
+    flags, cpus, memory_gb = [], None, None
+    args = iter(sys.argv[2:])
+    try:
+        for arg in args:
+            if arg == "--cpus":
+                cpus = int(next(args))
+            elif arg == "--memory-gb":
+                memory_gb = float(next(args))
+            elif arg in ("--no-checkpoints", "--no-cache"):
+                flags.append(arg)
+            else:
+                raise ValueError(arg)
+    except (StopIteration, ValueError):
+        print(usage)
+        sys.exit(1)
+
+    join_job_group()
+    with recording("process-vocals", sys.argv[1]):
+        video = prepare_video_in_background(sys.argv[1])
+        scheduler = Scheduler(cpus, int(memory_gb * 1024 ** 3) if memory_gb else None)
+        try:
+            run_pipeline(sys.argv[1], checkpoints="--no-checkpoints" not in flags,
+                         use_cache="--no-cache" not in flags, scheduler=scheduler)
+        finally:
+            scheduler.shutdown()
+            video.join()
@@ -0,0 +1,52 @@
+import json
+import os
+import signal
+import subprocess
+
+# Structured progress events for front ends (the GUI, batch runs). With
+# VOCALCOMPARE_EVENTS=1 in the environment each event is written to stdout
+# as one line, the marker followed by a JSON object; otherwise nothing is
+# written, so the scripts' output is unchanged on the command line. The
+# variable is checked on every event rather than on import, for jobs run in
+# an already warm worker (worker.py).
+#   plan          stages: names of the stages about to run
+#   stage_start   stage
+#   stage_done    stage, seconds
+#   stage_cached  stage (reused, not run)
+#   song_folder   path
+
+marker = "@event "
+
+def emit(event, **fields):
+    if os.environ.get("VOCALCOMPARE_EVENTS") == "1":
+        print(marker + json.dumps({"event": event, **fields}) + "\n", end="", flush=True)
+
+# The event dict of an output line, or None for ordinary log text
+def parse_event(line):
+    if not line.startswith(marker):
+        return None
+    try:
+        return json.loads(line[len(marker):])
+    except ValueError:
+        return None
+
+# Jobs. A script the GUI starts (with VOCALCOMPARE_JOB_GROUP=1) moves into a
+# process group of its own, so cancelling it with kill_job also kills what
+# it started: ffmpeg, the pyin pool. Scripts run from a terminal stay in its
+# group, so Ctrl+C still reaches them.
+def join_job_group():
+    if os.environ.get("VOCALCOMPARE_JOB_GROUP") == "1" and hasattr(os, "setpgrp"):
+        try:
+            os.setpgrp()
+        except OSError:
+            pass  # already leading a session (a warm worker's spare)
+
+# Kills the job with process id pid and every process it started
+def kill_job(pid):
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass  # not in its own group yet, or gone already
+    else:
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True)
@@ -0,0 +1,61 @@
+import hashlib
+import os
+from cache import StageCache, file_key
+
+# Studio reference store. One studio recording is usually compared against
+# many live performances, so everything derived from the studio track alone
+# (its audio, separated and denoised vocals, chroma and unwarped pitch
+# contour) is kept once in files/.studio/<id>/ instead of in every song
+# folder. <id> comes from the studio video's site and id (so every URL
+# form of one video shares a reference), or from the audio's content hash
+# for local files and folders downloaded before the store existed.
+#
+# The arrays are stage results in the stage cache's format (.npy files,
+# loaded memory-mapped) under arrays/, keyed the same way, and are never
+# evicted. reference.txt holds key=value details such as the URL and the
+# audio's content hash.
+
+# info is the URL's fetched metadata (yt-dlp's info dict)
+def url_reference_id(info):
+    return "url-" + hashlib.sha256(f"{info['extractor']}:{info['id']}".encode("utf-8")).hexdigest()[:16]
+
+def content_reference_id(audio_key):
+    return "sha-" + audio_key[:16]
+
+def references_folder(base_folder):
+    return os.path.join(base_folder, ".studio")
+
+class StudioReference:
+    def __init__(self, base_folder, reference_id):
+        self.id = reference_id
+        self.folder = os.path.join(references_folder(base_folder), reference_id)
+        self.arrays = StageCache(os.path.join(self.folder, "arrays"), max_bytes=None)
+        self.info_path = os.path.join(self.folder, "reference.txt")
+        self.info = {}
+        if os.path.exists(self.info_path):
+            with open(self.info_path, encoding="utf-8") as f:
+                for line in f:
+                    if "=" in line:
+                        k, v = line.strip().split("=", 1)
+                        self.info[k] = v
+
+    def save_info(self):
+        with open(self.info_path, "w", encoding="utf-8") as f:
+            for k, v in self.info.items():
+                f.write(f"{k}={v}\n")
+
+    # The store's own copy when downloaded into it, else the file it was
+    # first built from
+    def audio_path(self):
+        own = os.path.join(self.folder, "studio_audio.wav")
+        return own if os.path.exists(own) else self.info.get("audio_path", own)
+
+    def has_audio(self):
+        return os.path.exists(self.audio_path())
+
+    # Content hash of the studio audio, computed once
+    def audio_key(self):
+        if "audio_key" not in self.info:
+            self.info["audio_key"] = file_key(self.audio_path())
+            self.save_info()
+        return self.info["audio_key"]
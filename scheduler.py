@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+# Runs a DAG of tasks on a thread pool, starting each task once its
+# dependencies are done and its CPU and memory estimates fit in the budget
+# left by the tasks already running. A task that does not fit even on an
+# idle machine still runs, alone. Tasks run in threads; work that holds the
+# GIL can be handed to the scheduler's process pool from inside a task. The
+# pool's processes are spawned, not forked: tasks submit to it from several
+# threads at once, and a fork taken while another thread holds a lock (in
+# torch or numba, say) can deadlock the child.
+
+def total_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class Task:
+    def __init__(self, name, fn, deps=(), cpu=1, memory=0):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.cpu = cpu
+        self.memory = memory
+
+class Scheduler:
+    # cpu_budget in cores (default: all of them), memory_budget in bytes
+    # (default: 80% of physical memory, unlimited where unknown)
+    def __init__(self, cpu_budget=None, memory_budget=None):
+        self.cpu_budget = cpu_budget or os.cpu_count() or 1
+        if memory_budget is None and total_memory():
+            memory_budget = int(0.8 * total_memory())
+        self.memory_budget = memory_budget
+        self._processes = None
+        self._lock = threading.Lock()
+
+    # Created on first use; tasks running side by side share the one pool
+    @property
+    def processes(self):
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.cpu_budget,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+            return self._processes
+
+    def shutdown(self):
+        with self._lock:
+            processes, self._processes = self._processes, None
+        if processes is not None:
+            processes.shutdown()
+
+    def _fits(self, task, cpu, memory, idle):
+        if idle:
+            return True
+        if cpu + min(task.cpu, self.cpu_budget) > self.cpu_budget:
+            return False
+        return self.memory_budget is None or memory + task.memory <= self.memory_budget
+
+    # Returns {name: result}. Dependencies must be names of tasks in the
+    # list; an unknown one raises ValueError before anything runs. The first
+    # failure stops new tasks from starting and is raised once the running
+    # ones have finished.
+    def run(self, tasks):
+        pending = list(tasks)
+        names = {task.name for task in pending}
+        for task in pending:
+            for dep in task.deps:
+                if dep not in names:
+                    raise ValueError(f"Task {task.name!r} depends on unknown task {dep!r}")
+        running = {}
+        results = {}
+        error = None
+        cpu = memory = 0
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1)) as threads:
+            while pending or running:
+                for task in list(pending):
+                    ready = error is None and all(d in results for d in task.deps)
+                    if ready and self._fits(task, cpu, memory, not running):
+                        pending.remove(task)
+                        running[threads.submit(task.fn)] = task
+                        cpu += min(task.cpu, self.cpu_budget)
+                        memory += task.memory
+                if not running:
+                    if error is None and pending:
+                        raise ValueError(f"Tasks {[task.name for task in pending]} depend on each other")
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    cpu -= min(task.cpu, self.cpu_budget)
+                    memory -= task.memory
+                    try:
+                        results[task.name] = future.result()
+                    except Exception as e:
+                        error = error or e
+        if error is not None:
+            raise error
+        return results
@@ -0,0 +1,54 @@
+import csv
+import os
+import sys
+import time
+from scoring import find_song_folders, leaderboard, score_folders
+
+# Scores song folders (or every song folder under a folder such as files/)
+# and prints them as a leaderboard. Scores already up to date with their
+# pitch are read rather than recomputed.
+usage = ("Usage: python score-songs.py <song_folder|folder>... "
+         "[--by METRIC] [--ascending] [--top N] [--workers N] [--csv PATH]")
+columns = ["accuracy", "note_accuracy", "mean_abs_cents", "bias_cents", "voicing_recall",
+           "drift_cents_per_minute", "live_vibrato_rate", "live_vibrato_extent"]
+
+if __name__ == "__main__":
+    paths, options = [], {"--by": "accuracy", "--top": None, "--workers": None, "--csv": None}
+    ascending = False
+    args = iter(sys.argv[1:])
+    try:
+        for arg in args:
+            if arg == "--ascending":
+                ascending = True
+            elif arg in options:
+                options[arg] = int(next(args)) if arg in ("--top", "--workers") else next(args)
+            elif arg.startswith("--"):
+                raise ValueError(arg)
+            else:
+                paths.append(arg)
+    except (StopIteration, ValueError):
+        print(usage)
+        sys.exit(1)
+    if not paths:
+        print(usage)
+        sys.exit(1)
+
+    start_time = time.time()
+    folders = find_song_folders(paths)
+    rows = leaderboard(score_folders(folders, options["--workers"]), options["--by"], not ascending)
+    print(f"Scored {len(rows)} of {len(folders)} song folders in {time.time() - start_time:.1f}s", flush=True)
+
+    metrics = [options["--by"]] + [c for c in columns if c != options["--by"]]
+    def cell(value):
+        return "-" if value is None else f"{value:.3f}" if isinstance(value, float) else str(value)
+    print(f"{'rank':>4}  {'song':<32} " + " ".join(f"{m[:12]:>12}" for m in metrics))
+    for rank, folder, summary in rows[:options["--top"]]:
+        print(f"{rank:4d}  {os.path.basename(folder)[:32]:<32} "
+              + " ".join(f"{cell(summary.get(m)):>12}" for m in metrics))
+
+    if options["--csv"]:
+        with open(options["--csv"], "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["rank", "song_folder", *rows[0][2].keys()] if rows else ["rank", "song_folder"])
+            for rank, folder, summary in rows:
+                writer.writerow([rank, folder, *summary.values()])
@@ -0,0 +1,294 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from cache import file_key
+from pitchfile import has_legacy_pitch, legacy_names, read_pitch, reference_hz
+
+# Scores a live performance against the studio recording from a song
+# folder's pitch (live and studio contours on the live frame grid). Every
+# metric is computed over whole arrays: per-segment values (phrases, notes,
+# voiced runs) are differences of cumulative sums at the segment bounds, so
+# a song costs a few passes over its frames whatever its length.
+#
+# Deviations are live minus studio in cents, folded to the nearest octave
+# (a performance sung an octave off still scores; the offset is reported
+# separately). Times are seconds into the live audio.
+#
+# The score of a folder is written next to its pitch as score.json, keyed by
+# the pitch's content, so it is only recomputed when the pitch changes.
+
+score_format = 2
+in_tune_cents = 50       # a frame or note within this of the studio is in tune
+phrase_gap = 0.3         # seconds of studio silence that end a phrase
+min_note = 0.1           # seconds; shorter studio notes are not scored
+vibrato_min_run = 0.4    # seconds of voicing needed to measure vibrato
+vibrato_rates = (4, 8)   # Hz; runs oscillating in this band count as vibrato
+vibrato_min_extent = 15  # cents (peak deviation)
+
+# Cents of MIDI note 0 above the pitch file's reference
+midi_zero_cents = 1200 * np.log2(440 / reference_hz) - 6900
+
+# Bounds (starts, ends) of the runs of True in a boolean array
+def runs(mask):
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+# Sums of values over [starts, ends) segments
+def segment_sums(values, starts, ends):
+    totals = np.concatenate(([0], np.cumsum(values, dtype=np.float64)))
+    return totals[ends] - totals[starts]
+
+# Ratios with NaN where the denominator is 0 (a float for scalars)
+def ratio(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.where(b > 0, a / np.maximum(b, 1), np.nan)
+    return result if result.ndim else float(result)
+
+# Centred moving average over `width` frames (odd), NaN where the window
+# is not inside one run of `run_ids` (0 meaning outside any run)
+def run_moving_average(values, run_ids, width):
+    half = width // 2
+    totals = np.concatenate(([0], np.cumsum(values, dtype=np.float64)))
+    average = np.full(len(values), np.nan)
+    if len(values) < width:
+        return average
+    centre = np.arange(half, len(values) - half)
+    inside = (run_ids[centre] > 0) & (run_ids[centre - half] == run_ids[centre]) \
+        & (run_ids[centre + half] == run_ids[centre])
+    centre = centre[inside]
+    average[centre] = (totals[centre + half + 1] - totals[centre - half]) / width
+    return average
+
+# Bounds (starts, ends) of the runs of True in a boolean array, also split
+# at the frames in `cuts`
+def split_runs(mask, cuts):
+    starts, ends = runs(mask)
+    cuts = cuts[(cuts > 0) & (cuts < len(mask))]
+    cuts = cuts[mask[cuts] & mask[cuts - 1]]
+    return np.sort(np.concatenate((starts, cuts))), np.sort(np.concatenate((ends, cuts)))
+
+# Vibrato of one track: (rate Hz, extent cents, fraction of long-run frames
+# with vibrato). Voiced runs are split at the studio note bounds (`cuts`),
+# so a step from one note to the next is not taken for vibrato. Each piece
+# of at least vibrato_min_run is detrended by its least-squares line
+# (slides and drift within the note); the rate comes from the zero
+# crossings of what remains, smoothed over 3 frames against jitter, the
+# extent from that residual's RMS (the peak of a sinusoid of that RMS).
+def vibrato(cents, voiced, frame_period, cuts):
+    starts, ends = split_runs(voiced, cuts)
+    long = ends - starts >= vibrato_min_run / frame_period
+    starts, ends = starts[long], ends[long]
+    if not len(starts):
+        return np.nan, np.nan, 0.0
+    ids = np.arange(1, len(starts) + 1)
+    marks = np.zeros(len(cents) + 1, dtype=np.int64)
+    marks[starts] += ids
+    marks[ends] -= ids
+    run_ids = np.cumsum(marks)[:-1]
+
+    valid = run_ids > 0
+    piece = np.maximum(run_ids, 1) - 1
+    x = np.where(valid, np.arange(len(cents)) - starts[piece], 0).astype(np.float64)
+    y = np.where(valid, cents, 0.0)
+    frames = ends - starts
+    sum_x, sum_y = segment_sums(x, starts, ends), segment_sums(y, starts, ends)
+    spread = frames * segment_sums(x * x, starts, ends) - sum_x ** 2
+    slope = (frames * segment_sums(x * y, starts, ends) - sum_x * sum_y) / spread
+    intercept = (sum_y - slope * sum_x) / frames
+    residual = np.where(valid, y - intercept[piece] - slope[piece] * x, 0.0)
+    smooth = run_moving_average(residual, run_ids, 3)
+    crossing = np.zeros(len(cents))
+    crossing[1:] = np.isfinite(smooth[1:]) & np.isfinite(smooth[:-1]) \
+        & (np.sign(smooth[1:]) != np.sign(smooth[:-1]))
+
+    rate = ratio(segment_sums(crossing, starts, ends) / 2, frames) / frame_period
+    extent = np.sqrt(2 * ratio(segment_sums(residual ** 2, starts, ends), frames))
+    has_vibrato = (rate >= vibrato_rates[0]) & (rate <= vibrato_rates[1]) & (extent >= vibrato_min_extent)
+    if not has_vibrato.any():
+        return np.nan, np.nan, 0.0
+    weights = frames[has_vibrato]
+    return (float(np.average(rate[has_vibrato], weights=weights)),
+            float(np.average(extent[has_vibrato], weights=weights)),
+            float(weights.sum() / max(frames.sum(), 1)))
+
+# Scores a PitchData: {"summary": {...}, "phrases": {column: [...]},
+# "notes": {column: [...]}}
+def score_pitch(pitch):
+    live_cents = pitch.cents("live").astype(np.int32)
+    studio_cents = pitch.cents("studio").astype(np.int32)
+    live_voiced, studio_voiced = pitch.voiced("live"), pitch.voiced("studio")
+    both = live_voiced & studio_voiced
+    period = pitch.frame_period
+
+    difference = live_cents - studio_cents
+    octaves = np.rint(difference / 1200)
+    octave_offset = int(np.median(octaves[both])) if both.any() else 0
+    deviation = np.where(both, difference - 1200 * octaves, 0)
+    absolute = np.abs(deviation)
+    in_tune = both & (absolute <= in_tune_cents)
+
+    # Phrases: studio voiced runs joined across gaps shorter than phrase_gap
+    starts, ends = runs(studio_voiced)
+    if len(starts):
+        breaks = starts[1:] - ends[:-1] >= phrase_gap / period
+        starts, ends = starts[np.concatenate(([True], breaks))], ends[np.concatenate((breaks, [True]))]
+    phrase_studio = segment_sums(studio_voiced, starts, ends)
+    phrase_both = segment_sums(both, starts, ends)
+    phrases = {
+        "start": pitch.start + starts * period,
+        "end": pitch.start + ends * period,
+        "accuracy": ratio(segment_sums(in_tune, starts, ends), phrase_studio),
+        "coverage": ratio(phrase_both, phrase_studio),
+        "mean_abs_cents": ratio(segment_sums(absolute, starts, ends), phrase_both),
+        "bias_cents": ratio(segment_sums(deviation, starts, ends), phrase_both),
+    }
+
+    # Notes: studio voiced runs on one MIDI note, at least min_note long
+    midi = np.where(studio_voiced, np.rint((studio_cents - midi_zero_cents) / 100), -1)
+    bounds = np.flatnonzero(np.diff(midi)) + 1
+    starts = np.concatenate(([0], bounds))[:len(midi)]
+    ends = np.concatenate((bounds, [len(midi)]))[:len(midi)]
+    keep = (midi[starts] >= 0) & (ends - starts >= min_note / period)
+    starts, ends = starts[keep], ends[keep]
+    note_both = segment_sums(both, starts, ends)
+    note_deviation = ratio(segment_sums(deviation, starts, ends), note_both)
+    note_coverage = ratio(note_both, ends - starts)
+    notes = {
+        "start": pitch.start + starts * period,
+        "duration": (ends - starts) * period,
+        "midi": midi[starts].astype(np.int64),
+        "deviation_cents": note_deviation,
+        "coverage": note_coverage,
+        "correct": (np.abs(note_deviation) <= in_tune_cents) & (note_coverage >= 0.5),
+    }
+
+    # Drift: least-squares slope of the deviation over time
+    minutes = np.flatnonzero(both) * period / 60
+    drift = np.nan
+    if len(minutes) > 1 and np.ptp(minutes) > 0:
+        shifted = minutes - minutes.mean()
+        drift = float(np.dot(shifted, deviation[both]) / np.dot(shifted, shifted))
+
+    n_studio, n_live, n_both = studio_voiced.sum(), live_voiced.sum(), both.sum()
+    summary = {
+        "accuracy": ratio(in_tune.sum(), n_studio),
+        "in_tune_fraction": ratio(in_tune.sum(), n_both),
+        "mean_abs_cents": ratio(absolute.sum(), n_both),
+        "median_abs_cents": float(np.median(absolute[both])) if n_both else np.nan,
+        "bias_cents": ratio(deviation.sum(), n_both),
+        "octave_offset": octave_offset,
+        "voicing_agreement": ratio((live_voiced == studio_voiced).sum(), len(live_voiced)),
+        "voicing_recall": ratio(n_both, n_studio),
+        "voicing_precision": ratio(n_both, n_live),
+        "note_accuracy": ratio(notes["correct"].sum(), len(starts)),
+        "notes": len(starts),
+        "phrases": len(phrases["start"]),
+        "drift_cents_per_minute": drift,
+        "seconds": len(pitch) * period,
+    }
+    for track, cents, voiced in (("live", live_cents, live_voiced), ("studio", studio_cents, studio_voiced)):
+        rate, extent, fraction = vibrato(cents, voiced, period, bounds)
+        summary.update({f"{track}_vibrato_rate": rate, f"{track}_vibrato_extent": extent,
+                        f"{track}_vibrato_fraction": fraction})
+    return {"summary": summary, "phrases": phrases, "notes": notes}
+
+# JSON-ready copy: arrays to lists, NaN to None, floats rounded
+def _plain(value):
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (np.ndarray, np.generic)):
+        value = value.tolist()
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, float):
+        return None if not np.isfinite(value) else round(value, 4)
+    return value
+
+# Score files
+def score_path(song_folder):
+    return os.path.join(song_folder, "score.json")
+
+def has_pitch(song_folder):
+    return os.path.exists(os.path.join(song_folder, "pitch.bin")) or has_legacy_pitch(song_folder)
+
+# Content key of a folder's pitch (either layout), or None without pitch
+def pitch_key(song_folder):
+    path = os.path.join(song_folder, "pitch.bin")
+    if os.path.exists(path):
+        return file_key(path)
+    if has_legacy_pitch(song_folder):
+        return "+".join(file_key(os.path.join(song_folder, name)) for name in legacy_names)
+    return None
+
+def read_score(song_folder):
+    try:
+        with open(score_path(song_folder), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _live_start(song_folder):
+    try:
+        with open(os.path.join(song_folder, "data.txt"), encoding="utf-8") as f:
+            data = dict(line.strip().split("=", 1) for line in f if "=" in line)
+        return float(data.get("live_start", 0.0))
+    except OSError:
+        return 0.0
+
+# Scores a song folder and writes its score file; returns the score, or None
+# for a folder without pitch
+def write_score(song_folder, key=None):
+    key = key or pitch_key(song_folder)
+    pitch = read_pitch(os.path.join(song_folder, "pitch.bin"), _live_start(song_folder)) if key else None
+    if pitch is None:
+        return None
+    score = {"format": score_format, "pitch_key": key, **_plain(score_pitch(pitch))}
+    path = score_path(song_folder)
+    with open(path + ".partial", "w", encoding="utf-8") as f:
+        json.dump(score, f)
+    os.replace(path + ".partial", path)
+    return score
+
+# The folder's score, from its score file when that is up to date
+def score_folder(song_folder):
+    key = pitch_key(song_folder)
+    score = read_score(song_folder)
+    if score is not None and score.get("format") == score_format and score.get("pitch_key") == key:
+        return score
+    return write_score(song_folder, key)
+
+def _summary(song_folder):
+    score = score_folder(song_folder)
+    return score and score["summary"]
+
+# Batch API. Song folders under each path: the path itself if it holds
+# pitch, else its subfolders that do
+def find_song_folders(paths):
+    folders = []
+    for path in paths:
+        if has_pitch(path):
+            folders.append(path)
+        elif os.path.isdir(path):
+            folders += sorted(entry.path for entry in os.scandir(path)
+                              if entry.is_dir() and not entry.name.startswith(".") and has_pitch(entry.path))
+    return folders
+
+# {folder: summary} for many song folders, scoring (in `workers` processes)
+# only those whose score file is missing or stale
+def score_folders(folders, workers=None):
+    if workers == 1 or len(folders) < 2:
+        summaries = map(_summary, folders)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            summaries = list(pool.map(_summary, folders, chunksize=16))
+    return {folder: summary for folder, summary in zip(folders, summaries) if summary is not None}
+
+# Leaderboard rows (rank, folder, summary), best first by `metric`; folders
+# without a value for it go last
+def leaderboard(summaries, metric="accuracy", descending=True):
+    def order(item):
+        value = item[1].get(metric)
+        return (value is None, -value if descending and value is not None else value)
+    ranked = sorted(summaries.items(), key=order)
+    return [(rank, folder, summary) for rank, (folder, summary) in enumerate(ranked, 1)]
@@ -0,0 +1,140 @@
+import threading
+from pathlib import Path
+import numpy as np
+
+# In-process Demucs vocal separation. Running `python -m demucs` pays for
+# interpreter startup, the torch import and loading the model on every file,
+# then round-trips the stems through WAV files. A Separator loads the model
+# once and keeps it resident, taking and returning arrays; get_separator
+# shares one per configuration across the process, so the live and studio
+# tracks (or every song of a batch) use the same loaded model.
+#
+#   segment: seconds per chunk the model sees (None: the model's own, the
+#            maximum for htdemucs); shorter uses less memory
+#   overlap: fraction of overlap between chunks
+#   shifts:  random time shifts averaged per chunk. The demucs command line
+#            uses 1, which gives no averaging but makes the output random;
+#            0 is deterministic, so results can be cached
+#   threads: torch CPU threads (None: torch's default, one per core)
+#   jobs:    chunks processed concurrently on the CPU (separate)
+#   batch:   segments stacked into one model call (separate_many)
+
+default_model = "htdemucs"
+
+class Separator:
+    def __init__(self, model=default_model, segment=None, overlap=0.25, shifts=0, threads=None, jobs=0,
+                 batch=4, repo=None):
+        import torch
+        from demucs.pretrained import get_model
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = get_model(model, repo=Path(repo) if repo else None)
+        self.model.eval()
+        self.segment = segment
+        self.overlap = overlap
+        self.shifts = shifts
+        self.jobs = jobs
+        self.batch = batch
+        self.samplerate = self.model.samplerate
+        self.vocals_index = self.model.sources.index("vocals")
+
+    # y as a (channels, samples) tensor at the model's rate and channels,
+    # normalized as the demucs command line does; returns (wav, mean, std)
+    def _normalized(self, y, sr):
+        import torch
+        from demucs.audio import convert_audio
+
+        wav = torch.from_numpy(np.atleast_2d(np.asarray(y, dtype=np.float32)))
+        wav = convert_audio(wav, sr, self.samplerate, self.model.audio_channels)
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std() + 1e-8
+        return (wav - mean) / std, mean, std
+
+    # Seconds per segment: the model's own unless set
+    def _segment(self):
+        from demucs.apply import BagOfModels
+
+        if self.segment:
+            return self.segment
+        if isinstance(self.model, BagOfModels):
+            return min(float(model.segment) for model in self.model.models)
+        return float(self.model.segment)
+
+    # y is (channels, samples) or mono; returns mono float32 vocals at the
+    # model's sample rate
+    def separate(self, y, sr):
+        import torch
+        from demucs.apply import apply_model
+
+        wav, mean, std = self._normalized(y, sr)
+        with torch.no_grad():
+            sources = apply_model(self.model, wav[None], shifts=self.shifts, split=True,
+                                  overlap=self.overlap, segment=self.segment, num_workers=self.jobs,
+                                  device="cpu")
+        vocals = sources[0, self.vocals_index] * std + mean
+        return vocals.mean(0).numpy().astype(np.float32), self.samplerate
+
+    # Several (y, sr) tracks in one call; returns [(vocals, sr)] as separate
+    # would. Every track is cut into overlapping segments the way
+    # apply_model cuts one (each padded with its neighbouring audio, and
+    # blended back with the same triangular weights), but the segments of
+    # all the tracks are pooled and go through the model `batch` at a time,
+    # so a batch mixes tracks rather than waiting on one. With shifts, each
+    # batch is shifted as a whole rather than each track.
+    def separate_many(self, tracks):
+        import torch
+        import torch.nn.functional as F
+        from demucs.apply import apply_model
+
+        segment = self._segment()
+        length = int(self.samplerate * segment)
+        stride = int((1 - self.overlap) * length)
+        weight = torch.cat([torch.arange(1, length // 2 + 1), torch.arange(length - length // 2, 0, -1)])
+        weight = weight / weight.max()
+
+        mixes = [self._normalized(y, sr) for y, sr in tracks]
+        vocals = [torch.zeros_like(wav) for wav, _, _ in mixes]
+        totals = [torch.zeros(wav.shape[-1]) for wav, _, _ in mixes]
+        pieces = []  # (track, offset, samples kept, padding before them, padded segment)
+        for track, (wav, _, _) in enumerate(mixes):
+            n = wav.shape[-1]
+            for offset in range(0, n, stride):
+                kept = min(length, n - offset)
+                start = offset - (length - kept) // 2
+                piece = wav[:, max(start, 0):min(start + length, n)]
+                pieces.append((track, offset, kept, (length - kept) // 2,
+                               F.pad(piece, (max(-start, 0), max(start + length - n, 0)))))
+
+        with torch.no_grad():
+            for first in range(0, len(pieces), max(self.batch, 1)):
+                group = pieces[first:first + max(self.batch, 1)]
+                sources = apply_model(self.model, torch.stack([piece[-1] for piece in group]),
+                                      shifts=self.shifts, split=False, segment=segment, device="cpu")
+                for (track, offset, kept, before, _), out in zip(group, sources[:, self.vocals_index]):
+                    vocals[track][:, offset:offset + kept] += weight[:kept] * out[:, before:before + kept]
+                    totals[track][offset:offset + kept] += weight[:kept]
+
+        results = []
+        for (_, mean, std), track_vocals, total in zip(mixes, vocals, totals):
+            track_vocals = track_vocals / total * std + mean
+            results.append((track_vocals.mean(0).numpy().astype(np.float32), self.samplerate))
+        return results
+
+# torch's CPU thread count is process-wide: separations running side by
+# side should set their share before starting
+def set_threads(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+_separators = {}
+_separators_lock = threading.Lock()
+
+# Held while a model loads, so tracks separating side by side wait for the
+# one copy instead of each loading their own
+def get_separator(model=default_model, **options):
+    key = (model, tuple(sorted(options.items())))
+    with _separators_lock:
+        if key not in _separators:
+            _separators[key] = Separator(model, **options)
+        return _separators[key]
@@ -0,0 +1,74 @@
+import numpy as np
+
+# Frames are frame_ms blocks whose edges follow pydub's millisecond slicing
+# (int(ms * sr / 1000)), so offsets line up with the old AudioSegment trimming.
+def frame_count(y, sr, frame_ms=1):
+    return int(len(y) * 1000 / (sr * frame_ms))
+
+def frame_to_sample(frame, sr, frame_ms=1):
+    return int(frame * frame_ms * sr / 1000)
+
+# dBFS of frames [start, stop) of float audio in [-1, 1]
+def frame_dbfs(y, sr, frame_ms=1, start=0, stop=None):
+    n_frames = frame_count(y, sr, frame_ms)
+    stop = n_frames if stop is None else min(stop, n_frames)
+    if stop <= start:
+        return np.full(0, -np.inf)
+
+    edges = (np.arange(start, stop + 1) * frame_ms * sr / 1000).astype(np.int64)
+    if stop == n_frames:
+        edges[-1] = len(y)
+
+    power = np.add.reduceat(np.square(y[edges[0]:edges[-1]], dtype=np.float64), edges[:-1] - edges[0])
+    mean_power = power / np.diff(edges)
+
+    with np.errstate(divide="ignore"):
+        return 10 * np.log10(mean_power)
+
+# First frame in [start, stop) for which test(db) holds, scanning one block of
+# frames at a time from the front (or from the back when reverse is set).
+def scan_frames(y, sr, test, start, stop, frame_ms=1, block_frames=10000, reverse=False):
+    if reverse:
+        for block_stop in range(stop, start, -block_frames):
+            block_start = max(block_stop - block_frames, start)
+            hits = np.flatnonzero(test(frame_dbfs(y, sr, frame_ms, block_start, block_stop)))
+            if len(hits):
+                return block_start + int(hits[-1])
+    else:
+        for block_start in range(start, stop, block_frames):
+            block_stop = min(block_start + block_frames, stop)
+            hits = np.flatnonzero(test(frame_dbfs(y, sr, frame_ms, block_start, block_stop)))
+            if len(hits):
+                return block_start + int(hits[0])
+    return None
+
+# First and one-past-last frame of sound. With hysteresis > 0 a region only
+# counts as sound once it reaches silence_thresh + hysteresis, and is then
+# extended outwards while it stays above silence_thresh.
+def find_sound_bounds(y, sr, silence_thresh=-40, hysteresis=0, frame_ms=1, block_frames=10000):
+    n_frames = frame_count(y, sr, frame_ms)
+    loud = lambda db: db > silence_thresh + hysteresis
+    quiet = lambda db: ~(db > silence_thresh)
+
+    first_loud = scan_frames(y, sr, loud, 0, n_frames, frame_ms, block_frames)
+    if first_loud is None:
+        return 0, n_frames
+    last_loud = scan_frames(y, sr, loud, first_loud, n_frames, frame_ms, block_frames, reverse=True)
+
+    start, end = first_loud, last_loud + 1
+    if hysteresis > 0:
+        quiet_before = scan_frames(y, sr, quiet, 0, first_loud, frame_ms, block_frames, reverse=True)
+        quiet_after = scan_frames(y, sr, quiet, end, n_frames, frame_ms, block_frames)
+        start = 0 if quiet_before is None else quiet_before + 1
+        end = n_frames if quiet_after is None else quiet_after
+
+    return start, end
+
+# Returns the trimmed audio and the start offset in milliseconds
+def trim_silence(y, sr, silence_thresh=-40, hysteresis=0, frame_ms=1, block_frames=10000):
+    start, end = find_sound_bounds(y, sr, silence_thresh, hysteresis, frame_ms, block_frames)
+
+    start_sample = frame_to_sample(start, sr, frame_ms)
+    end_sample = len(y) if end == frame_count(y, sr, frame_ms) else frame_to_sample(end, sr, frame_ms)
+
+    return y[start_sample:end_sample], start * frame_ms
@@ -1,81 +1,58 @@
 import os
 import sys
-import librosa
-import soundfile as sf
 import numpy as np
-from dtw import dtw
-from scipy.interpolate import interp1d
+from metrics import measure, recording
+from pipeline import (aligners, align_vocals, array_chroma_blocks, file_chroma_blocks, online_time_map,
+                      save_time_map, song_features, song_files, sync_sr, warp_block, warp_modes)
+from warping import warp_to_file
 
 # Path Setup
-if len(sys.argv) != 2:
-    print("Usage: python sync-vocals.py <song_folder>")
+if (len(sys.argv) not in (2, 3, 4)
+        or (len(sys.argv) >= 3 and sys.argv[2] not in aligners)
+        or (len(sys.argv) == 4 and sys.argv[3] not in warp_modes)):
+    print(f"Usage: python sync-vocals.py <song_folder> [{'|'.join(aligners)}] [{'|'.join(warp_modes)}]")
     sys.exit(1)
 
 song_folder = sys.argv[1]
-raw_folder = os.path.join(song_folder, "raw")
+files = song_files(song_folder)
+aligner = sys.argv[2] if len(sys.argv) >= 3 else "exact"
+warp_mode = sys.argv[3] if len(sys.argv) == 4 else "interp"
 
-data = {}
-with open(os.path.join(song_folder, "data.txt"), encoding="utf-8") as f:
-    for line in f:
-        if "=" in line:
-            k, v = line.strip().split("=", 1)
-            data[k] = v
-
-studio_vocals = os.path.join(raw_folder, "studio_vocals_denoised.wav")
-live_vocals = os.path.join(raw_folder, "live_vocals_denoised.wav")
-warped_studio_output = os.path.join(song_folder, "studio_vocals_warped.wav")
-
-# Parameters
-sr = 22050
-hop_length = 1024
-
-# Helpers
-def load_audio(path):
-    if not os.path.exists(path):
-        print(f"Error: File not found -> {path}")
-        sys.exit(1)
-    audio, _ = librosa.load(path, sr=sr, mono=True)
-    return audio
-
-def extract_chroma(y):
-    return librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length)
-
-def compute_alignment_path(chroma_ref, chroma_target):
-    dist_fn = lambda x, y: np.linalg.norm(x - y, ord=1)
-    _, _, _, path = dtw(chroma_ref.T, chroma_target.T, dist=dist_fn)
-    return path
-
-def warp_audio_interpolated(y, path_ref, path_target):
-    times_ref = np.array(path_ref) * hop_length / sr
-    times_target = np.array(path_target) * hop_length / sr
-
-    time_map = interp1d(times_target, times_ref, kind='linear', fill_value='extrapolate')
-    target_duration = np.max(times_target)
-    target_times = np.linspace(0, target_duration, int(target_duration * sr))
-
-    studio_time = np.linspace(0, len(y) / sr, num=len(y))
-    warped_audio = np.interp(target_times, studio_time, y)
-
-    return np.nan_to_num(warped_audio, nan=0.0, posinf=1.0, neginf=-1.0)
+if not os.path.exists(files["live_denoised"]):
+    print(f"Error: File not found -> {files['live_denoised']}")
+    sys.exit(1)
 
 # Main Process
 print("Starting vocal sync...", flush=True)
 
-print("Loading audio...", flush=True)
-studio_audio = load_audio(studio_vocals)
-live_audio = load_audio(live_vocals)
-
-print("Extracting chroma features...", flush=True)
-chroma_studio = extract_chroma(studio_audio)
-chroma_live = extract_chroma(live_audio)
-
-print("Computing DTW alignment path...", flush=True)
-path_studio, path_live = compute_alignment_path(chroma_studio, chroma_live)
-
-print("Warping studio audio to sync with live performance...", flush=True)
-warped_studio = warp_audio_interpolated(studio_audio, path_studio, path_live)
-
-print("Saving warped audio...", flush=True)
-sf.write(warped_studio_output, warped_studio, sr)
+with recording("sync-vocals", song_folder):
+    # Studio vocals and chroma come from the studio reference, the live ones
+    # from the feature store (decoded once, shared with pitch-extraction.py)
+    print("Loading audio...", flush=True)
+    features = song_features(song_folder)
+    studio_audio = np.asarray(features.audio("studio"))
+
+    if aligner == "online":
+        # The live file is streamed, never fully decoded
+        print("Aligning live vocals online as they are decoded...", flush=True)
+        time_map = online_time_map(array_chroma_blocks(studio_audio, sync_sr),
+                                   file_chroma_blocks(files["live_denoised"]))
+    else:
+        time_map = align_vocals(studio_audio, features.audio("live"), aligner,
+                                features.feature("studio", "chroma"), features.feature("live", "chroma"))
+
+    # The online time map is computed as the warp consumes it; its chunks
+    # are kept for pitch-extraction.py, which maps the studio pitch with them
+    chunks = []
+    def recorded(time_map):
+        for chunk in time_map:
+            chunks.append(chunk)
+            yield chunk
+
+    print(f"Warping studio audio to sync with live performance ({warp_mode})...", flush=True)
+    with measure("warping", len(studio_audio) / sync_sr):
+        warp_to_file(studio_audio, sync_sr, recorded(time_map), files["studio_warped"], warp_mode, warp_block)
+    save_time_map(song_folder, np.concatenate([chunk[0] for chunk in chunks]),
+                  np.concatenate([chunk[1] for chunk in chunks]))
 
 print("Alignment complete. Warped studio file saved.")
@@ -0,0 +1,24 @@
+import sys
+from progress import join_job_group
+from worker import run_in_worker, run_script, serve
+
+# Keeps the heavy libraries loaded between jobs (see worker.py).
+#   python warm-worker.py [--no-warm-up]          serves jobs until stopped
+#   python warm-worker.py run <script> [args...]  runs a script in the worker,
+#                                                 or here if none is running
+usage = "Usage: python warm-worker.py [--no-warm-up] | python warm-worker.py run <script> [args...]"
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "run":
+        join_job_group()
+        code = run_in_worker(sys.argv[2], sys.argv[3:])
+        if code is None:
+            code = run_script(sys.argv[2], sys.argv[3:])
+        sys.exit(code)
+    if sys.argv[1:] not in ([], ["--no-warm-up"]):
+        print(usage)
+        sys.exit(1)
+    try:
+        serve(warm_kernels="--no-warm-up" not in sys.argv)
+    except KeyboardInterrupt:
+        pass
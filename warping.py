@@ -0,0 +1,131 @@
+import numpy as np
+import librosa
+import soundfile as sf
+
+# Warps studio audio onto the live timeline. The DTW path arrives as chunks
+# of (studio times, live times) in seconds, possibly still being produced by
+# the online aligner; output is rendered in fixed-size blocks as soon as the
+# map covers them, so writing to disk needs no full-length intermediate.
+
+# Live -> studio time map built up from path chunks. Live times repeated by
+# the path (the studio side moved on while live stood still) are averaged;
+# the newest live time is held back until a later one arrives, since the
+# next chunk may still add to it.
+class TimeMap:
+    def __init__(self):
+        self.live = np.empty(0)
+        self.studio = np.empty(0)
+        self.pending_live = np.empty(0)
+        self.pending_studio = np.empty(0)
+
+    def extend(self, studio_times, live_times):
+        if len(live_times) == 0:
+            return
+        live = np.concatenate([self.pending_live, live_times])
+        studio = np.concatenate([self.pending_studio, studio_times])
+        held = live == live[-1]
+        self.pending_live, self.pending_studio = live[held], studio[held]
+        self._append(live[~held], studio[~held])
+
+    def close(self):
+        self._append(self.pending_live, self.pending_studio)
+        self.pending_live = self.pending_studio = np.empty(0)
+
+    def _append(self, live, studio):
+        if len(live) == 0:
+            return
+        unique_live, index = np.unique(live, return_inverse=True)
+        mean_studio = np.bincount(index, weights=studio) / np.bincount(index)
+        self.live = np.concatenate([self.live, unique_live])
+        self.studio = np.concatenate([self.studio, np.maximum.accumulate(mean_studio)])
+
+    # Live time up to which the map is final
+    def known_until(self):
+        return self.live[-1] if len(self.live) else 0.0
+
+    def __call__(self, t):
+        return np.interp(t, self.live, self.studio)
+
+    # Keep only what blocks starting at live time t can still need
+    def trim(self, t):
+        keep = max(int(np.searchsorted(self.live, t)) - 1, 0)
+        self.live = self.live[keep:]
+        self.studio = self.studio[keep:]
+
+# Linear interpolation of y at fractional sample positions
+def interpolate_block(y, positions):
+    first = max(int(np.floor(positions.min())), 0)
+    last = min(int(np.ceil(positions.max())) + 2, len(y))
+    if last <= first:
+        return np.zeros(len(positions), dtype=np.float32)
+    segment = y[first:last]
+    return np.interp(positions - first, np.arange(len(segment)), segment, left=0.0, right=0.0).astype(np.float32)
+
+# Pitch-preserving warp of one block: the studio span the map assigns to the
+# block, plus `pad` seconds of context on each side, is phase-vocoded to the
+# block's length at a constant rate. Returns length + fade samples, the tail
+# being crossfaded into the next block.
+def stretch_block(y, sr, studio_start, studio_end, length, fade, pad):
+    rate = float(np.clip((studio_end - studio_start) * sr / length, 0.25, 4.0))
+    pad_samples = int(pad * sr)
+    start = int(round(studio_start * sr)) - pad_samples
+    stop = start + int(round(rate * (length + fade))) + 2 * pad_samples
+
+    segment = np.zeros(stop - start, dtype=np.float32)
+    lo, hi = max(start, 0), min(stop, len(y))
+    if hi > lo:
+        segment[lo - start:hi - start] = y[lo:hi]
+
+    stretched = librosa.effects.time_stretch(segment, rate=rate)
+    offset = int(round(pad_samples / rate))
+    block = stretched[offset:offset + length + fade]
+    return np.pad(block, (0, length + fade - len(block))).astype(np.float32)
+
+# Yields the warped audio block by block, each as soon as the map covers it.
+#   mode "interp":  sample interpolation (fast, pitch follows the warp)
+#   mode "stretch": chunked phase-vocoder time stretch (pitch preserving)
+def warp_blocks(y, sr, time_map_chunks, mode="interp",
+                block_seconds=0.5, fade_seconds=0.05, pad_seconds=0.1):
+    time_map = TimeMap()
+    block = int(block_seconds * sr)
+    fade = int(fade_seconds * sr) if mode == "stretch" else 0
+    ramp = np.linspace(0, 1, fade, endpoint=False, dtype=np.float32)
+    position = 0
+    tail = np.zeros(fade, dtype=np.float32)
+
+    def render(stop):
+        nonlocal position, tail
+        while position < stop:
+            length = min(block, stop - position)
+            if mode == "stretch":
+                times = np.array([position, position + length]) / sr
+                start, end = time_map(times)
+                warped = stretch_block(y, sr, start, end, length, fade, pad_seconds)
+                head = min(fade, length)
+                warped[:head] = warped[:head] * ramp[:head] + tail[:head] * (1 - ramp[:head])
+                tail = warped[length:length + fade]
+                warped = warped[:length]
+            else:
+                times = np.arange(position, position + length) / sr
+                warped = interpolate_block(y, time_map(times) * sr)
+            yield np.nan_to_num(warped, nan=0.0, posinf=1.0, neginf=-1.0)
+            position += length
+            time_map.trim(position / sr)
+
+    for studio_times, live_times in time_map_chunks:
+        time_map.extend(np.asarray(studio_times, dtype=np.float64), np.asarray(live_times, dtype=np.float64))
+        ready = int(time_map.known_until() * sr)
+        yield from render(ready // block * block)
+
+    time_map.close()
+    yield from render(int(time_map.known_until() * sr))
+
+# Writes the warped audio to out_path without holding it all in memory
+def warp_to_file(y, sr, time_map_chunks, out_path, mode="interp", block_seconds=0.5):
+    with sf.SoundFile(out_path, "w", samplerate=sr, channels=1) as out:
+        for block in warp_blocks(y, sr, time_map_chunks, mode, block_seconds):
+            out.write(block)
+
+def warp_audio(y, sr, time_map_chunks, mode="interp", block_seconds=0.5):
+    blocks = list(warp_blocks(y, sr, time_map_chunks, mode, block_seconds))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
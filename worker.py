@@ -0,0 +1,254 @@
+import importlib
+import io
+import json
+import os
+import runpy
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError, get_context
+from multiprocessing.connection import Client, Listener, wait
+
+# Persistent warm worker. A stage script started on its own spends seconds
+# importing librosa, scipy, numba and noisereduce (which brings torch) and
+# loading the numba kernels before doing any work. The worker
+# (warm-worker.py) keeps a spare process with all of that already done; each
+# job is handed to the spare, which runs the script as `python script args`
+# would, in the client's working directory and environment, and streams its
+# output back. A spare runs one job and exits, so jobs never see each other's
+# state; the next spare warms up in the background once the job is finished.
+#
+# Clients (warm-worker.py run, which the GUI uses with VOCALCOMPARE_WORKER=1)
+# find the worker through worker_file. When no worker answers, or its spare
+# is still warming up or busy with another job, they run the script
+# themselves, cold, rather than wait. Output written straight to the
+# process's file descriptors (by ffmpeg, say) goes to the worker's console,
+# not to the client.
+#
+# This module imports nothing heavy itself, so a client starts in a few
+# milliseconds.
+
+worker_file = os.path.abspath(os.path.join("files", "worker.json"))
+preload_modules = ["numpy", "scipy.signal", "soundfile", "librosa.core", "librosa.feature", "librosa.onset",
+                   "librosa.sequence", "noisereduce", "alignment", "pipeline", "pitch", "warping", "scoring",
+                   "demucs.pretrained", "demucs.apply"]
+
+# Jobs
+# Runs script with args in this process as `python script args` would;
+# returns its exit code
+def run_script(script, args):
+    script = os.path.abspath(script)
+    sys.argv = [script] + list(args)
+    sys.path.insert(0, os.path.dirname(script))
+    try:
+        runpy.run_path(script, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+# sys.stdout / sys.stderr of a job: text sent to the worker as it is written
+class _Output(io.TextIOBase):
+    def __init__(self, pipe, lock):
+        self.pipe = pipe
+        self.lock = lock
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            with self.lock:
+                self.pipe.send(("output", text))
+        return len(text)
+
+# Imports the heavy modules and runs the numba kernels once, so their
+# compiled code is loaded (from numba's cache when there is one)
+def warm_up(warm_kernels=True):
+    for name in preload_modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass  # optional, e.g. demucs where vocals are separated elsewhere
+    if warm_kernels:
+        import numpy as np
+        from pipeline import compute_alignment_path, pitch_contour
+        chroma = np.random.default_rng(0).random((12, 64))
+        for aligner in ("exact", "band", "multiscale"):
+            compute_alignment_path(chroma, chroma, aligner)
+        pitch_contour(np.zeros(22050, dtype=np.float32), 22050, "pyin")
+
+# A spare: warms up, says so, then runs the one job it is sent
+def _spare(pipe, warm_kernels):
+    import metrics
+
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()  # a group of its own, so a cancelled job's pool processes die with it
+    warm_up(warm_kernels)
+    pipe.send(("ready", None))
+    try:
+        script, args, cwd, env = pipe.recv()
+    except EOFError:
+        return
+    metrics.job_started = time.time()
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(env)
+    lock = threading.Lock()
+    sys.stdout = sys.stderr = _Output(pipe, lock)
+    code = run_script(script, args)
+    with lock:
+        pipe.send(("exit", code))
+
+# Worker
+def _start_spare(context, warm_kernels):
+    pipe, child_pipe = context.Pipe()
+    process = context.Process(target=_spare, args=(child_pipe, warm_kernels), name="warm spare")
+    process.start()
+    child_pipe.close()
+    return process, pipe
+
+# Kills a spare and any processes its job started that are still running
+def _kill(process):
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass  # no such group: gone already, or still warming up
+    elif process.is_alive():
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+    if process.is_alive():
+        process.kill()
+    process.join()
+
+# Relays one job's output to its client; kills the job if the client goes
+# away (cancelled)
+def _relay(connection, process, pipe):
+    code = None
+    while code is None:
+        for ready in wait([connection, pipe]):
+            if ready is connection:
+                try:
+                    connection.recv()
+                except EOFError:
+                    _kill(process)
+                    return
+            else:
+                try:
+                    kind, value = pipe.recv()
+                except EOFError:
+                    process.join()
+                    kind, value = "exit", process.exitcode or 1
+                if kind == "exit":
+                    code = value
+                try:
+                    connection.send((kind, value))
+                except OSError:
+                    pass
+    _kill(process)
+
+# Runs one client's job in the warm spare, or answers "busy" when there is
+# none yet (still warming up, or taken by another job), so the client runs
+# the script itself rather than waiting
+def _handle(connection, spares, warm_kernels):
+    with connection:
+        try:
+            request = connection.recv()
+        except (OSError, EOFError):
+            return
+        with spares["lock"]:
+            spare, spares["ready"] = spares["ready"], None
+        if spare is None:
+            connection.send(("busy", None))
+            return
+        process, pipe = spare
+        print(f"Running {os.path.basename(request['script'])} {' '.join(request['args'])}", flush=True)
+        pipe.send((request["script"], request["args"], request["cwd"], request["env"]))
+        _relay(connection, process, pipe)
+        pipe.close()
+    with spares["lock"]:
+        spares["processes"].discard(process)
+    _warm_spare(spares, warm_kernels)
+
+# Starts the next spare and marks it ready, in the background, once it has
+# warmed up
+def _warm_spare(spares, warm_kernels):
+    def warm():
+        start_time = time.time()
+        try:
+            pipe.recv()
+        except EOFError:
+            print("The spare process failed to warm up", flush=True)
+            return
+        print(f"Spare ready ({time.time() - start_time:.1f}s)", flush=True)
+        with spares["lock"]:
+            spares["ready"] = (process, pipe)
+
+    with spares["lock"]:
+        process, pipe = _start_spare(spares["context"], warm_kernels)
+        spares["processes"].add(process)
+    threading.Thread(target=warm, name="spare warm-up", daemon=True).start()
+
+def serve(warm_kernels=True):
+    authkey = secrets.token_bytes(32)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # so the spare and worker_file are cleaned up
+    # spawn: the same fresh interpreter on every platform
+    spares = {"context": get_context("spawn"), "lock": threading.Lock(), "ready": None, "processes": set()}
+    with Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+        os.makedirs(os.path.dirname(worker_file), exist_ok=True)
+        with open(worker_file, "w", encoding="utf-8") as f:
+            json.dump({"address": list(listener.address), "authkey": authkey.hex(), "pid": os.getpid()}, f)
+        print(f"Warm worker listening on {listener.address[0]}:{listener.address[1]}", flush=True)
+        try:
+            _warm_spare(spares, warm_kernels)
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    continue  # a client that failed to authenticate or hung up
+                threading.Thread(target=_handle, args=(connection, spares, warm_kernels), name="job",
+                                 daemon=True).start()
+        finally:
+            with spares["lock"]:
+                processes = list(spares["processes"])
+            for process in processes:
+                _kill(process)
+            if os.path.exists(worker_file):
+                os.remove(worker_file)
+
+# Client
+# Runs script in the worker, printing its output as it arrives; returns the
+# exit code, or None when no worker answers or it has no warm spare free
+def run_in_worker(script, args):
+    try:
+        with open(worker_file, encoding="utf-8") as f:
+            info = json.load(f)
+        connection = Client(tuple(info["address"]), authkey=bytes.fromhex(info["authkey"]))
+    except (OSError, ValueError, KeyError, AuthenticationError):
+        return None
+    with connection:
+        connection.send({"script": os.path.abspath(script), "args": list(args), "cwd": os.getcwd(),
+                         "env": dict(os.environ)})
+        while True:
+            try:
+                kind, value = connection.recv()
+            except EOFError:
+                return 1
+            if kind == "busy":
+                return None
+            if kind == "exit":
+                return value
+            sys.stdout.write(value)
+            sys.stdout.flush()